@@ -0,0 +1,70 @@
+""" compare loading a playlist command by command and with command lists
+
+usage: python -m benchmarks.bulk_urls [number of urls]
+
+The benchmark talks to the fake mpd from webradio.fake, which answers
+every command immediately, so it measures the round-trips only.
+"""
+import pathlib
+import sys
+import tempfile
+import time
+
+from webradio import fake, single
+
+
+def per_command(client, urls):
+    # the former behaviour: a ping and a command for every url
+    client.ping()
+    client.clear()
+    for url in urls:
+        client.ping()
+        client.add(url)
+
+
+def bulk(client, urls):
+    client.urls = urls
+
+
+# the number of loads per function, the fastest one is reported
+repeat = 5
+
+
+def measure(function, client, urls, repeat=repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(client, urls)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main(n_urls):
+    urls = [
+        "http://radio.example.org/stream{}".format(index)
+        for index in range(n_urls)
+        ]
+
+    with tempfile.TemporaryDirectory() as root:
+        path = pathlib.Path(root) / "socket"
+        with fake.Server(path) as server:
+            client = single.Client(path, keepalive=None)
+            try:
+                for function in (per_command, bulk):
+                    server.reset_statistics()
+                    duration = measure(function, client, urls)
+                    line = "{:12} {:5} urls: {:8.2f} ms {:6} round-trips"
+                    print(line.format(
+                        function.__name__,
+                        n_urls,
+                        duration * 1000,
+                        # the statistics cover every repetition
+                        server.round_trips // repeat,
+                        ))
+            finally:
+                client.disconnect()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
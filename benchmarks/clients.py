@@ -0,0 +1,153 @@
+""" latency and round-trips of the client operations
+
+usage: python -m benchmarks.clients [--output results.json]
+
+Measures station switching, volume changes and toggling the mute state for
+single.Client and for pool.Client with pool sizes from 1 to 64, against
+fake mpd servers from webradio.fake. For every operation the latency
+percentiles and the number of mpd round-trips per call are reported and
+optionally written to a JSON file, so that regressions show up as numbers.
+"""
+import argparse
+import json
+import pathlib
+import random
+import tempfile
+import time
+
+from webradio import fake, pool, single
+
+
+pool_sizes = [1, 2, 4, 8, 16, 32, 64]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def measure(operation, servers, repeat):
+    """ run an operation repeatedly
+
+    Returns
+    -------
+    result : dict
+        latency percentiles in milliseconds and round-trips per call
+    """
+    timings = []
+    round_trips = servers.round_trips
+    for iteration in range(repeat):
+        start = time.perf_counter()
+        operation(iteration)
+        timings.append((time.perf_counter() - start) * 1000)
+    round_trips = servers.round_trips - round_trips
+
+    return {
+        "calls": repeat,
+        "p50_ms": percentile(timings, 0.5),
+        "p90_ms": percentile(timings, 0.9),
+        "p99_ms": percentile(timings, 0.99),
+        "max_ms": max(timings),
+        "round_trips_per_call": round_trips / repeat,
+        }
+
+
+def operations(client, n_urls):
+    choices = random.Random(42)
+
+    return {
+        "play": lambda i: client.play(choices.randrange(n_urls)),
+        "volume": lambda i: setattr(client, "volume", choices.randrange(101)),
+        "toggle_mute": lambda i: client.toggle_mute(),
+        }
+
+
+def bench_single(root, repeat, latency, n_urls=64):
+    servers = fake.Pool(root, 1, latency=latency)
+    client = single.Client(next(servers.sockets), keepalive=None)
+    client.urls = [
+        "http://radio.example.org/{}".format(index)
+        for index in range(n_urls)
+        ]
+    client.play(0)
+
+    try:
+        for name, operation in operations(client, n_urls).items():
+            result = measure(operation, servers, repeat)
+            result.update(client="single", operation=name, pool_size=1)
+            yield result
+    finally:
+        client.disconnect()
+        servers.shutdown()
+
+
+def bench_pool(root, size, repeat, latency):
+    servers = fake.Pool(root, size, latency=latency)
+    client = pool.Client(servers)
+    client.urls = [
+        "http://radio.example.org/{}".format(index)
+        for index in range(size)
+        ]
+    client.play(0)
+
+    try:
+        for name, operation in operations(client, size).items():
+            result = measure(operation, servers, repeat)
+            result.update(client="pool", operation=name, pool_size=size)
+            yield result
+    finally:
+        # also shuts the servers down
+        client.disconnect()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="simulated processing time of every mpd command in seconds",
+        )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=pool_sizes,
+        help="the pool sizes to measure",
+        )
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        root = pathlib.Path(root)
+
+        benches = [bench_single(root / "single", args.repeat, args.latency)]
+        benches.extend(
+            bench_pool(root / str(size), size, args.repeat, args.latency)
+            for size in args.sizes
+            )
+
+        for bench in benches:
+            for result in bench:
+                print(
+                    "{client:6} {pool_size:3} {operation:12} "
+                    "p50 {p50_ms:7.3f} ms  p99 {p99_ms:7.3f} ms  "
+                    "{round_trips_per_call:6.2f} round-trips/call".format(
+                        **result
+                        ))
+                results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"latency": args.latency, "results": results},
+                f,
+                indent=2,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+""" memory and startup time of a process per station against partitions
+
+usage: python -m benchmarks.partitions [--sizes 1 4 16] [--mpd /usr/bin/mpd]
+
+Starts pools of mpd processes (pool.Server) and single mpds with one
+partition per station (partition.Server) for several pool sizes and
+reports the time until a pool.Client has loaded all stations and the total
+resident memory of the mpd processes. This needs mpd, so it is meant to be
+run on the target device. The urls are only loaded, not played.
+"""
+import argparse
+import pathlib
+import shlex
+import tempfile
+import time
+
+from webradio import partition, pool
+
+
+def measure(layout, basepath, size, command):
+    start = time.perf_counter()
+    if layout == "processes":
+        server = pool.Server(
+            basepath=basepath,
+            num=size,
+            fast_boot=True,
+            timeout=10,
+            command=command,
+            )
+        processes = server.workers
+    else:
+        server = partition.Server(
+            basepath=basepath,
+            num=size,
+            timeout=10,
+            command=command,
+            )
+        processes = [server]
+
+    client = pool.Client(server)
+    try:
+        client.urls = [
+            "http://radio.example.org/{}".format(index)
+            for index in range(size)
+            ]
+        startup = time.perf_counter() - start
+
+        rss = sum(process.rss() for process in processes)
+    finally:
+        client.disconnect()
+
+    return {
+        "layout": layout,
+        "size": size,
+        "startup_ms": startup * 1000,
+        "rss_mib": rss / 2**20,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument(
+        "--mpd",
+        default="/usr/bin/mpd",
+        help="the command to start mpd with",
+        )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as root:
+        root = pathlib.Path(root)
+
+        for size in args.sizes:
+            for layout in ("processes", "partitions"):
+                result = measure(
+                    layout,
+                    root / "{}{}".format(layout, size),
+                    size,
+                    shlex.split(args.mpd),
+                    )
+                print(
+                    "{layout:10} {size:3}  startup {startup_ms:8.1f} ms  "
+                    "rss {rss_mib:7.1f} MiB".format(**result)
+                    )
+
+
+if __name__ == "__main__":
+    main()
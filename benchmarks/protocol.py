@@ -0,0 +1,103 @@
+""" compare the built-in protocol engine with musicpd
+
+usage: python -m benchmarks.protocol [iterations]
+
+Measures the cost of parsing a typical status response without any I/O
+and the latency of a status round-trip against a local fake mpd. musicpd
+is only needed for the comparison and skipped if it is not installed.
+"""
+import io
+import pathlib
+import sys
+import tempfile
+import time
+
+from webradio import fake, protocol
+
+try:
+    import musicpd
+except ImportError:
+    musicpd = None
+
+
+status_response = (
+    "volume: 35\nrepeat: 0\nrandom: 0\nsingle: 0\nconsume: 0\n"
+    "playlist: 4\nplaylistlength: 3\nmixrampdb: 0.000000\nstate: play\n"
+    "song: 1\nsongid: 2\ntime: 12:0\nelapsed: 12.003\nbitrate: 128\n"
+    "audio: 44100:24:2\nnextsong: 2\nnextsongid: 3\nOK\n"
+    )
+
+
+def parse_builtin(iterations):
+    data = status_response.encode()
+    buffer = bytearray(len(data) * 2)
+    buffer[:len(data)] = data
+    end = len(data) - len(b"OK\n")
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        protocol.parse(buffer, 0, end, protocol.status_fields)
+    return time.perf_counter() - start
+
+
+def parse_musicpd(iterations):
+    client = musicpd.MPDClient()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        client._rfile = io.StringIO(status_response)
+        client._fetch_object()
+    return time.perf_counter() - start
+
+
+def round_trip(client, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        client.status()
+    return time.perf_counter() - start
+
+
+def report(name, duration, iterations):
+    print("{:28} {:8.2f} us/call".format(
+        name,
+        duration / iterations * 1e6,
+        ))
+
+
+def main(iterations):
+    report("parse (builtin)", parse_builtin(iterations), iterations)
+    if musicpd is not None:
+        report("parse (musicpd)", parse_musicpd(iterations), iterations)
+
+    with tempfile.TemporaryDirectory() as root:
+        path = pathlib.Path(root) / "socket"
+        server = fake.Server(path).start_thread()
+
+        clients = [("status round-trip (builtin)", protocol.MPDClient())]
+        if musicpd is not None:
+            clients.append(
+                ("status round-trip (musicpd)", musicpd.MPDClient()),
+                )
+
+        try:
+            for name, client in clients:
+                client.connect(str(path), 0)
+                report(name, round_trip(client, iterations), iterations)
+                client.disconnect()
+
+            # several commands per write
+            client = protocol.MPDClient()
+            client.connect(str(path), 0)
+            commands = [("setvol", 10), ("play", 0), ("status",)]
+            start = time.perf_counter()
+            for _ in range(iterations):
+                client.execute(*commands)
+            duration = time.perf_counter() - start
+            report("pipelined setvol+play+status", duration, iterations)
+            client.disconnect()
+        finally:
+            server.stop_thread()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,89 @@
+""" the processor time of muted pool workers with and without standby
+
+usage: python -m benchmarks.standby [--duration 30] URL [URL ...]
+
+Starts a pool with one real mpd per url, plays the first url and measures
+the processor time every worker uses within `duration` seconds, once with
+the muted workers writing silence to alsa and once with them in standby
+on the null output. Unlike the other benchmarks this needs mpd, a sound
+card and the network, so it is meant to be run on the target device.
+"""
+import argparse
+import pathlib
+import shlex
+import tempfile
+import time
+
+from webradio import pool
+
+
+def measure(basepath, urls, *, standby, duration, warmup, command):
+    server = pool.Server(
+        basepath=basepath,
+        num=len(urls),
+        fast_boot=True,
+        timeout=10,
+        command=command,
+        )
+    client = pool.Client(server, standby=standby)
+    try:
+        client.urls = urls
+        client.play(0)
+
+        # let the workers fill their buffers
+        time.sleep(warmup)
+
+        workers = server.workers
+        before = [worker.cpu_time() for worker in workers]
+        time.sleep(duration)
+        after = [worker.cpu_time() for worker in workers]
+    finally:
+        client.disconnect()
+
+    # in percent of one core
+    return [
+        (end - start) / duration * 100
+        for start, end in zip(before, after)
+        ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument(
+        "--mpd",
+        default="/usr/bin/mpd",
+        help="the command to start mpd with",
+        )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as root:
+        root = pathlib.Path(root)
+
+        for standby in (False, True):
+            usage = measure(
+                root / ("standby" if standby else "alsa"),
+                args.urls,
+                standby=standby,
+                duration=args.duration,
+                warmup=args.warmup,
+                command=shlex.split(args.mpd),
+                )
+
+            print("standby" if standby else "alsa")
+            for index, percent in enumerate(usage):
+                print("  worker {:2} {:6.2f} % cpu{}".format(
+                    index,
+                    percent,
+                    " (audible)" if index == 0 else "",
+                    ))
+            if len(usage) > 1:
+                print("  mean of the muted workers {:6.2f} % cpu".format(
+                    sum(usage[1:]) / len(usage[1:]),
+                    ))
+
+
+if __name__ == "__main__":
+    main()
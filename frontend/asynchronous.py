@@ -36,9 +36,18 @@ def print_choices(urls):
     print(utils.format_urls(urls))
 
 
+@asyncio.coroutine
+def complete(result):
+    # clients like webradio.single.AsyncClient return coroutines which have
+    # to be waited for, the blocking ones return plain values
+    if asyncio.iscoroutine(result):
+        result = yield from result
+    return result
+
+
 @asyncio.coroutine
 def switch_channel(client, index):
-    client.play(index)
+    yield from complete(client.play(index))
 
 
 @asyncio.coroutine
@@ -48,7 +57,7 @@ def change_volume(client, new_volume):
 
 @asyncio.coroutine
 def toggle_mute(client):
-    client.toggle_mute()
+    yield from complete(client.toggle_mute())
 
 
 actions = {
@@ -0,0 +1,313 @@
+""" a cold start which overlaps its stages and can trace them
+
+The run_* scripts import this module first, so that the trace starts as
+early as possible. `boot` reads the station list in a background thread,
+from a cache if the list did not change, while mpd is started in the
+foreground. With `--startup-trace`, a timeline from the start of the
+process to the first `play()` is printed to stderr. With `--persist`, mpd is
+left running on exit and adopted by the next start, see `runtime_path`.
+"""
+import argparse
+from concurrent import futures
+from contextlib import contextmanager
+import hashlib
+import inspect
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+
+from . import utils
+
+
+def process_start():
+    """ the value of time.monotonic() when the process started
+
+    Falls back to the current time if it can't be determined.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # the fields following the command name, which may contain spaces
+            fields = f.read().rpartition(")")[2].split()
+
+        # starttime, the 22nd field in proc(5), in clock ticks after boot
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, AttributeError, ValueError, IndexError):
+        return time.monotonic()
+
+    return time.monotonic() - age
+
+
+class Trace(object):
+    """ a timeline of the startup stages
+
+    Parameters
+    ----------
+    origin : float, optional
+        the time.monotonic() value the timeline starts at. If None, the
+        start of the process.
+    enabled : bool, default False
+        whether `report` prints anything
+    """
+    def __init__(self, origin=None, *, enabled=False, file=None):
+        self.origin = origin if origin is not None else process_start()
+        self.enabled = enabled
+        self.file = file
+
+        # (stage, start, end) in seconds since the origin
+        self.stages = []
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def _add(self, stage, start, end):
+        with self._lock:
+            self.stages.append(
+                (stage, start - self.origin, end - self.origin),
+                )
+
+    def mark(self, stage):
+        """ record an event without a duration """
+        now = time.monotonic()
+        self._add(stage, now, now)
+
+    @contextmanager
+    def span(self, stage):
+        """ record the time spent in the block """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._add(stage, start, time.monotonic())
+
+    def format(self):
+        lines = ["{:>9} {:>9}  {}".format("start", "duration", "stage")]
+        for stage, start, end in sorted(self.stages, key=lambda s: s[1]):
+            lines.append("{:6.1f} ms {:6.1f} ms  {}".format(
+                start * 1000,
+                (end - start) * 1000,
+                stage,
+                ))
+
+        return "\n".join(lines)
+
+    def report(self):
+        """ print the timeline once, if enabled """
+        if not self.enabled or self._reported:
+            return
+
+        self._reported = True
+        print(self.format(), file=self.file or sys.stderr, flush=True)
+
+
+# created on import, so the scripts should import this module first
+trace = Trace()
+
+
+def parse_args(argv=None, description=None, *, persist=False):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--startup-trace",
+        action="store_true",
+        help="print a timeline of the startup until the first play",
+        )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="don't use the cached station list",
+        )
+    if persist:
+        parser.add_argument(
+            "--persist",
+            action="store_true",
+            help="keep mpd running on exit and continue with it next time",
+            )
+    args = parser.parse_args(argv)
+
+    trace.enabled = args.startup_trace
+    return args
+
+
+def cache_path(path):
+    """ the cache file of a station list """
+    cache_home = pathlib.Path(os.environ.get(
+        "XDG_CACHE_HOME",
+        os.path.expanduser("~/.cache"),
+        ))
+    digest = hashlib.sha1(str(pathlib.Path(path).absolute()).encode())
+
+    return cache_home / "webradio" / "{}.json".format(digest.hexdigest())
+
+
+def session_path():
+    """ the session file of the player, see `webradio.session` """
+    state_home = pathlib.Path(os.environ.get(
+        "XDG_STATE_HOME",
+        os.path.expanduser("~/.local/state"),
+        ))
+
+    return state_home / "webradio" / "session.json"
+
+
+def runtime_path(suffix):
+    """ a basepath which stays the same across runs, see `boot` """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir is not None:
+        root = pathlib.Path(runtime_dir) / "webradio"
+    else:
+        root = pathlib.Path(tempfile.gettempdir()) / "webradio-{}".format(
+            os.getuid(),
+            )
+
+    return root / suffix
+
+
+@contextmanager
+def _runtime_basepath(suffix):
+    path = runtime_path(suffix)
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    yield path
+
+
+def count_urls(path):
+    """ the number of stations, without resolving them """
+    with open(str(path)) as f:
+        return sum(1 for _ in f)
+
+
+def read_urls(path, *, cache=True):
+    """ the stream urls of a station list
+
+    The resolved urls are cached and reused as long as the size and the
+    modification time of the list stay the same.
+    """
+    path = pathlib.Path(path)
+    stat = path.stat()
+    key = [stat.st_mtime_ns, stat.st_size]
+
+    cached = cache_path(path)
+    if cache:
+        try:
+            with cached.open() as f:
+                data = json.load(f)
+            if data["key"] == key:
+                return data["urls"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    # only needed on a cache miss
+    from webradio import url
+
+    with path.open() as f:
+        urls = [url.extract_playlist(line.strip()) for line in f]
+
+    if cache:
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_suffix(".tmp")
+            with tmp.open("w") as f:
+                json.dump({"key": key, "urls": urls}, f)
+            os.replace(str(tmp), str(cached))
+        except OSError:
+            pass
+
+    return urls
+
+
+@contextmanager
+def boot(filepath, suffix, start, *, cache=True, persist=False):
+    """ start a client while the station list is loading
+
+    Parameters
+    ----------
+    filepath : str or pathlib.Path
+        the station list
+    suffix : str
+        the name of the basepath, see `frontend.utils.basepath`
+    start : callable
+        called with the basepath, the number of stations and a function
+        returning the urls, which blocks until they are loaded. It should
+        start mpd before calling the latter and return the client.
+    persist : bool, default False
+        use the same basepath on every start (see `runtime_path`) and
+        detach the client instead of closing it, so that mpd keeps running.
+        start should adopt the mpd left there, see `single.Server`.
+
+    Yields
+    ------
+    client
+        the client returned by start, it is closed (or detached)
+        afterwards
+    """
+    def load():
+        with trace.span("load station list"):
+            return read_urls(filepath, cache=cache)
+
+    def urls():
+        with trace.span("wait for station list"):
+            return loading.result()
+
+    executor = futures.ThreadPoolExecutor(max_workers=1)
+    loading = executor.submit(load)
+    executor.shutdown(wait=False)
+
+    num = count_urls(filepath)
+    if persist:
+        basepath = _runtime_basepath(suffix)
+    else:
+        basepath = utils.basepath(suffix)
+
+    with basepath as path:
+        with trace.span("start"):
+            client = start(path, num, urls)
+        trace.mark("ready")
+
+        if persist:
+            try:
+                yield client
+            finally:
+                client.detach()
+            return
+
+        with client:
+            yield client
+
+
+def trace_first_play(actions):
+    """ mark the first play action in the trace and report it """
+    play = actions["play"]
+    played = threading.Event()
+
+    def finish():
+        trace.mark("first play()")
+        trace.report()
+
+    def traced(*args, **kwargs):
+        result = play(*args, **kwargs)
+        if played.is_set():
+            return result
+        played.set()
+
+        # the asynchronous actions return generator based coroutines
+        if inspect.isgenerator(result):
+            def wait():
+                value = yield from result
+                finish()
+                return value
+
+            return wait()
+        if inspect.isawaitable(result):
+            async def wait():
+                value = await result
+                finish()
+                return value
+
+            return wait()
+
+        finish()
+        return result
+
+    actions["play"] = traced
@@ -1,13 +1,32 @@
-from frontend.utils import basepath
+from frontend import startup
 from frontend import synchronous
-from webradio import player, url
+
+
+def start(path, num, urls):
+    from webradio import player
+    from webradio import session
+
+    # the last station plays before the station list is read, which then
+    # replaces the one of the session if it changed
+    session_path = startup.session_path()
+    restored = session.load(session_path).get("urls") is not None
+
+    client = player.Player(
+        basepath=path,
+        urls=None if restored else urls(),
+        coalesce=0.05,
+        session=session_path,
+        attach=args.persist,
+        )
+    if restored:
+        client.load(urls())
+    return client
 
 
 suffix = "webradio"
 filepath = "urls2"
-with open(filepath) as filelike:
-    raw_urls = [line.strip() for line in filelike]
-    urls = [url.extract_playlist(_) for _ in raw_urls]
+args = startup.parse_args(persist=True)
+startup.trace_first_play(synchronous.actions)
 
 # patch for prebuffering
 synchronous.actions['prebuffering'] = lambda *, client: setattr(
@@ -16,12 +35,18 @@ synchronous.actions['prebuffering'] = lambda *, client: setattr(
     not client.prebuffering,
     )
 
-with basepath(suffix) as path:
-    with player.Player(basepath=path, urls=urls, prebuffering=False) as client:
-        synchronous.print_choices(urls)
-        synchronous.print_prompt()
-        while True:
-            try:
-                synchronous.process_input(client)
-            except StopIteration:
-                break
+booting = startup.boot(
+    filepath,
+    suffix,
+    start,
+    cache=not args.no_cache,
+    persist=args.persist,
+    )
+with booting as client:
+    synchronous.print_choices(client.urls)
+    synchronous.print_prompt()
+    while True:
+        try:
+            synchronous.process_input(client)
+        except StopIteration:
+            break
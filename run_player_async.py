@@ -1,14 +1,27 @@
-from webradio import player, url
-from frontend.utils import basepath
+from frontend import startup
 from frontend import asynchronous
 import asyncio
 import sys
 
 
-def read_urls(filelike):
-    raw_urls = [line.strip() for line in filelike]
-    urls = [url.extract_playlist(_) for _ in raw_urls]
-    return urls
+def start(path, num, urls):
+    from webradio import player
+    from webradio import session
+
+    # the last station plays before the station list is read, which then
+    # replaces the one of the session if it changed
+    session_path = startup.session_path()
+    restored = session.load(session_path).get("urls") is not None
+
+    client = player.Player(
+        basepath=path,
+        urls=None if restored else urls(),
+        session=session_path,
+        attach=args.persist,
+        )
+    if restored:
+        client.load(urls())
+    return client
 
 
 def reader(pool):
@@ -19,8 +32,8 @@ def reader(pool):
 if __name__ == "__main__":
     suffix = "webradio_pool"
     filepath = "urls"
-    with open(filepath) as filelike:
-        urls = read_urls(filelike)
+    args = startup.parse_args(persist=True)
+    startup.trace_first_play(asynchronous.actions)
 
     asynchronous.actions['prebuffering'] = lambda *, client: setattr(
         client,
@@ -28,9 +41,14 @@ if __name__ == "__main__":
         not client.prebuffering,
         )
 
-    with basepath(suffix) as p:
-        with player.map(basepath=p, urls=urls, prebuffering=False) as c, \
-                asynchronous.run_loop_forever() as loop:
-            asyncio.async(asynchronous.print_choices(c.urls))
-            asyncio.async(asynchronous.print_prompt())
-            loop.add_reader(sys.stdin, reader, c)
+    booting = startup.boot(
+        filepath,
+        suffix,
+        start,
+        cache=not args.no_cache,
+        persist=args.persist,
+        )
+    with booting as c, asynchronous.run_loop_forever() as loop:
+        asyncio.async(asynchronous.print_choices(c.urls))
+        asyncio.async(asynchronous.print_prompt())
+        loop.add_reader(sys.stdin, reader, c)
@@ -1,20 +1,34 @@
-from frontend.utils import basepath
+from frontend import startup
 from frontend import synchronous
-from webradio import pool, url
+
+
+def start(path, num, urls):
+    from webradio import pool
+
+    # the workers boot while the station list is loading
+    server = pool.Server(basepath=path, num=num, attach=args.persist)
+    client = pool.Client(server)
+    client.urls = urls()
+    return client
 
 
 suffix = "webradio_pool"
 filepath = "urls"
-with open(filepath) as filelike:
-    raw_urls = [line.strip() for line in filelike]
-    urls = [url.extract_playlist(_) for _ in raw_urls]
+args = startup.parse_args(persist=True)
+startup.trace_first_play(synchronous.actions)
 
-with basepath(suffix) as path:
-    with pool.map(path, urls) as client:
-        synchronous.print_choices(urls)
-        synchronous.print_prompt()
-        while True:
-            try:
-                synchronous.process_input(client)
-            except StopIteration:
-                break
+booting = startup.boot(
+    filepath,
+    suffix,
+    start,
+    cache=not args.no_cache,
+    persist=args.persist,
+    )
+with booting as client:
+    synchronous.print_choices(client.urls)
+    synchronous.print_prompt()
+    while True:
+        try:
+            synchronous.process_input(client)
+        except StopIteration:
+            break
@@ -1,20 +1,36 @@
-from frontend.utils import basepath
+from frontend import startup
 from frontend import synchronous
-from webradio import single, url
+
+
+def start(path, num, urls):
+    from webradio import single
+
+    server = single.Server(basepath=path, attach=args.persist)
+    client = single.Client(server)
+    # an adopted mpd may still play them
+    urls = urls()
+    if client.urls != urls:
+        client.urls = urls
+    return client
 
 
 suffix = "webradio"
 filepath = "urls2"
-with open(filepath) as filelike:
-    raw_urls = [line.strip() for line in filelike]
-    urls = [url.extract_playlist(_) for _ in raw_urls]
+args = startup.parse_args(persist=True)
+startup.trace_first_play(synchronous.actions)
 
-with basepath(suffix) as path:
-    with single.map(path, urls) as client:
-        synchronous.print_choices(urls)
-        synchronous.print_prompt()
-        while True:
-            try:
-                synchronous.process_input(client)
-            except StopIteration:
-                break
+booting = startup.boot(
+    filepath,
+    suffix,
+    start,
+    cache=not args.no_cache,
+    persist=args.persist,
+    )
+with booting as client:
+    synchronous.print_choices(client.urls)
+    synchronous.print_prompt()
+    while True:
+        try:
+            synchronous.process_input(client)
+        except StopIteration:
+            break
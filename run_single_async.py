@@ -1,14 +1,16 @@
-from webradio import single, url
-from frontend.utils import basepath
+from frontend import startup
 from frontend import asynchronous
 import asyncio
 import sys
 
 
-def read_urls(filelike):
-    raw_urls = [line.strip() for line in filelike]
-    urls = [url.extract_playlist(_) for _ in raw_urls]
-    return urls
+def start(path, num, urls):
+    from webradio import single
+
+    server = single.Server(basepath=path)
+    client = single.Client(server)
+    client.urls = urls()
+    return client
 
 
 def reader(pool):
@@ -19,12 +21,11 @@ def reader(pool):
 if __name__ == "__main__":
     suffix = "webradio_pool"
     filepath = "urls2"
-    with open(filepath) as filelike:
-        urls = read_urls(filelike)
-
-    with basepath(suffix) as p:
-        with single.map(basepath=p, urls=urls) as client, \
-                asynchronous.run_loop_forever() as loop:
-            asyncio.async(asynchronous.print_choices(client.urls))
-            asyncio.async(asynchronous.print_prompt())
-            loop.add_reader(sys.stdin, reader, client)
+    args = startup.parse_args()
+    startup.trace_first_play(asynchronous.actions)
+
+    booting = startup.boot(filepath, suffix, start, cache=not args.no_cache)
+    with booting as client, asynchronous.run_loop_forever() as loop:
+        asyncio.async(asynchronous.print_choices(client.urls))
+        asyncio.async(asynchronous.print_prompt())
+        loop.add_reader(sys.stdin, reader, client)
@@ -0,0 +1,173 @@
+import io
+import os
+import pathlib
+import time
+
+import pytest
+from unittest import mock
+
+import frontend.startup as startup
+
+
+@pytest.fixture(scope='function')
+def stations(tmpdir, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir / "cache"))
+
+    path = pathlib.Path(str(tmpdir)) / "urls"
+    path.write_text("a\nb\nc\n")
+    return path
+
+
+@pytest.fixture(scope='function')
+def extract_playlist():
+    m = mock.patch(
+        'webradio.url.extract_playlist',
+        side_effect=lambda url: url.upper(),
+        )
+
+    with m as extract_playlist:
+        yield extract_playlist
+
+
+@pytest.fixture(scope='function')
+def trace():
+    m = mock.patch('frontend.startup.trace', startup.Trace(time.monotonic()))
+
+    with m as trace:
+        yield trace
+
+
+def test_process_start():
+    assert startup.process_start() <= time.monotonic()
+
+
+class TestTrace(object):
+    def test_stages(self):
+        trace = startup.Trace(0)
+
+        with trace.span("span"):
+            pass
+        trace.mark("mark")
+
+        assert [stage for stage, _, _ in trace.stages] == ["span", "mark"]
+        stage, start, end = trace.stages[1]
+        assert start == end
+
+        lines = trace.format().splitlines()
+        assert len(lines) == 3
+        assert lines[-1].endswith("mark")
+
+    def test_report(self):
+        output = io.StringIO()
+        trace = startup.Trace(0, file=output)
+        trace.mark("stage")
+
+        trace.report()
+        assert output.getvalue() == ""
+
+        trace.enabled = True
+        trace.report()
+        trace.report()
+        assert len(output.getvalue().splitlines()) == 2
+
+
+def test_parse_args(trace):
+    args = startup.parse_args(["--startup-trace"])
+    assert args.startup_trace and not args.no_cache
+    assert trace.enabled
+
+
+def test_session_path(monkeypatch):
+    monkeypatch.setenv("XDG_STATE_HOME", "/state")
+    assert startup.session_path() == pathlib.Path(
+        "/state/webradio/session.json",
+        )
+
+
+def test_read_urls(stations, extract_playlist):
+    assert startup.count_urls(stations) == 3
+
+    urls = startup.read_urls(stations)
+    assert urls == ["A", "B", "C"]
+    assert startup.cache_path(stations).exists()
+
+    # cached
+    extract_playlist.reset_mock()
+    assert startup.read_urls(stations) == urls
+    assert not extract_playlist.called
+
+    # the cache is bypassed
+    assert startup.read_urls(stations, cache=False) == urls
+    assert extract_playlist.call_count == 3
+
+    # the list changed
+    extract_playlist.reset_mock()
+    stations.write_text("d\n")
+    os.utime(str(stations), ns=(0, 0))
+    assert startup.read_urls(stations) == ["D"]
+    assert extract_playlist.call_count == 1
+
+
+def test_boot(stations, extract_playlist, trace):
+    client = mock.MagicMock()
+
+    def start(path, num, urls):
+        assert pathlib.Path(path).parent.exists()
+        assert num == 3
+        client.urls = urls()
+        return client
+
+    with startup.boot(stations, "webradio_test", start) as booted:
+        assert booted is client
+        assert client.urls == ["A", "B", "C"]
+        assert not client.__exit__.called
+
+    assert client.__exit__.called
+    stages = {stage for stage, _, _ in trace.stages}
+    assert stages == {
+        "load station list",
+        "wait for station list",
+        "start",
+        "ready",
+        }
+
+
+def test_boot_persist(stations, extract_playlist, trace, monkeypatch,
+                      tmpdir):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmpdir))
+    path = pathlib.Path(str(tmpdir)) / "webradio" / "webradio_test"
+    assert startup.runtime_path("webradio_test") == path
+
+    client = mock.MagicMock()
+    paths = []
+
+    def start(path, num, urls):
+        paths.append(path)
+        return client
+
+    for _ in range(2):
+        with startup.boot(stations, "webradio_test", start, persist=True):
+            pass
+
+    # the same basepath every time, and mpd is left running
+    assert paths == [path, path]
+    assert client.detach.call_count == 2
+    assert not client.__exit__.called
+
+    args = startup.parse_args(["--persist"], persist=True)
+    assert args.persist
+    with pytest.raises(SystemExit):
+        startup.parse_args(["--persist"])
+
+
+def test_trace_first_play(trace):
+    client = mock.Mock()
+    actions = {'play': lambda index, *, client: client.play(index)}
+    startup.trace_first_play(actions)
+
+    actions['play'](1, client=client)
+    actions['play'](2, client=client)
+    assert client.play.call_count == 2
+
+    stages = [stage for stage, _, _ in trace.stages]
+    assert stages == ["first play()"]
@@ -1 +1,2 @@
 from .contextmanagers import *
+from .fakes import *
@@ -0,0 +1,4 @@
+from webradio.fake import Pool as FakePool
+
+
+__all__ = ["FakePool"]
@@ -5,6 +5,8 @@ from unittest import mock
 
 import webradio
 
+from .fakes import FakePool
+
 
 @pytest.fixture(scope='function')
 def mkdir():
@@ -84,3 +86,20 @@ def single_client():
 
     with m as client:
         yield client
+
+
+@pytest.fixture(scope='function')
+def fake_servers(tmpdir):
+    """ start pools of fake mpd servers, which get stopped afterwards """
+    root = pathlib.Path(str(tmpdir))
+    pools = []
+
+    def start(num, name="pool"):
+        servers = FakePool(root / name, num)
+        pools.append(servers)
+        return servers
+
+    yield start
+
+    for servers in pools:
+        servers.shutdown()
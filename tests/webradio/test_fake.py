@@ -0,0 +1,227 @@
+import os
+import pathlib
+import queue
+import subprocess
+import time
+
+import pytest
+
+import webradio.base as base
+import webradio.fake as fake
+import webradio.protocol as protocol
+import webradio.single as single
+
+
+@pytest.fixture(scope='function')
+def server(tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "socket"
+
+    with fake.Server(path) as server:
+        yield server
+
+
+class TestServer(object):
+    def test_commands(self, server):
+        client = single.Client(server.path, keepalive=None)
+
+        urls = list(map(str, range(5)))
+        client.urls = urls
+        client.play(3)
+        client.volume = 20
+
+        assert server.playlist == urls
+        assert server.song == 3
+        assert server.state == "play"
+        assert server.volume == 20
+
+        client.status_ttl = 0
+        status = client.status()
+        assert status == {
+            'volume': '20',
+            'state': 'play',
+            'song': '3',
+            'bitrate': '128',
+            }
+
+        # the playlist was loaded with a single command list
+        assert server.commands["command_list"] == 1
+        assert server.commands["add"] == len(urls)
+
+        with pytest.raises(protocol.CommandError):
+            client._client.play(10)
+
+        client.disconnect()
+
+    def test_round_trips(self, server):
+        client = protocol.MPDClient()
+        client.connect(str(server.path))
+        server.reset_statistics()
+
+        client.execute(("setvol", 10), ("play",), ("status",))
+        assert sum(server.commands.values()) == 3
+        assert server.round_trips == 1
+
+        client.ping()
+        assert server.round_trips == 2
+
+        client.disconnect()
+
+    def test_latency(self, server):
+        server.latency = {"*": 0, "status": 0.05}
+
+        client = protocol.MPDClient()
+        client.connect(str(server.path))
+
+        # only the configured command is delayed
+        assert server.latency.get("ping") is None
+        client.ping()
+
+        start = time.perf_counter()
+        client.status()
+        assert time.perf_counter() - start >= 0.05
+
+        client.disconnect()
+
+    def test_failures(self, server):
+        client = single.Client(server.path, keepalive=None)
+
+        # errors are reported
+        server.inject("setvol", "error")
+        with pytest.raises(protocol.CommandError):
+            client.volume = 30
+
+        # dropped connections are reconnected and the command replayed
+        server.inject("clear", "disconnect")
+        client.clear()
+        assert server.commands["clear"] == 2
+
+        # the connection drops twice
+        server.inject("ping", "disconnect", times=2)
+        with pytest.raises(ConnectionError):
+            client.ping()
+
+        with pytest.raises(ValueError):
+            server.inject("ping", "segfault")
+
+        client.disconnect()
+
+    def test_idle(self, server):
+        client = single.Client(server.path, keepalive=None)
+        other = single.Client(server.path, keepalive=None)
+        other.urls = ["a", "b"]
+
+        changes = queue.Queue()
+        client.subscribe(lambda subsystem, status: changes.put(subsystem))
+
+        other.volume = 5
+        other.play(1)
+        received = {changes.get(timeout=1), changes.get(timeout=1)}
+        assert received == {"mixer", "player"}
+
+        assert client.volume == 5
+        assert client.station == 1
+
+        other.disconnect()
+        client.disconnect()
+
+
+    def test_outputs(self, server):
+        client = protocol.MPDClient()
+        client.connect(str(server.path))
+
+        # the null output starts disabled
+        assert server.outputs == [["alsa", True], ["standby", False]]
+        client.enableoutput(1)
+        client.disableoutput(0)
+        assert server.outputs == [["alsa", False], ["standby", True]]
+        client.enableoutput(0)
+        assert server.outputs[0] == ["alsa", True]
+
+        with pytest.raises(protocol.CommandError):
+            client.enableoutput(2)
+
+        client.disconnect()
+
+    def test_playlistinfo(self, server):
+        client = protocol.MPDClient()
+        client.connect(str(server.path))
+
+        assert client.playlistinfo() == []
+        client.add("a")
+        client.add("b c")
+        assert client.playlistinfo() == ["a", "b c"]
+
+        client.disconnect()
+
+
+def test_read_config(tmpdir):
+    path = pathlib.Path(str(tmpdir))
+    single.fill(path, fast_boot=True)
+
+    config = fake.read_config(path / "mpd" / "mpd.conf")
+    assert config["bind_to_address"] == str(path / "mpd" / "socket")
+    assert config["pid_file"] == str(path / "mpd" / "pid")
+
+    # only alsa is enabled at startup
+    outputs = fake.read_outputs(path / "mpd" / "mpd.conf")
+    assert outputs == [(path.name, True), ("standby", False)]
+
+
+def test_daemon_output(tmpdir):
+    path = pathlib.Path(str(tmpdir))
+    single.fill(path, fast_boot=True)
+    env = dict(os.environ, XDG_CONFIG_HOME=str(path))
+
+    # reading the output of the command doesn't wait for the daemon
+    started = subprocess.run(
+        fake.command(),
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=5,
+        )
+    assert started.returncode == 0
+
+    subprocess.run(fake.command() + ["--kill"], env=env, timeout=5)
+
+
+def test_single_server(tmpdir):
+    basepath = pathlib.Path(str(tmpdir)) / "webradio"
+
+    server = single.Server(
+        basepath=basepath,
+        fast_boot=True,
+        timeout=5,
+        command=fake.command(),
+        )
+    assert (basepath / "mpd" / "pid").exists()
+    assert fake.alive(server.pid)
+    assert server.cpu_time() >= 0
+
+    with single.Client(server, keepalive=None) as client:
+        client.urls = ["a"]
+        client.play(0)
+        assert client.station == 0
+
+    assert not basepath.exists()
+
+
+def test_alive():
+    assert base.alive(os.getpid())
+
+    child = subprocess.Popen(["true"])
+    child.wait()
+    assert not base.alive(child.pid)
+
+
+def test_alive_foreign(monkeypatch):
+    # without /proc, a process of another user can only be signalled
+    def stat(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+
+    def kill(pid, signal):
+        raise PermissionError(pid)
+
+    monkeypatch.setattr("builtins.open", stat)
+    monkeypatch.setattr(os, "kill", kill)
+    assert base.alive(1)
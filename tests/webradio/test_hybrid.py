@@ -0,0 +1,103 @@
+from unittest import mock
+
+import pytest
+
+import webradio.hybrid as hybrid
+
+
+@pytest.fixture(scope='function')
+def pool_server():
+    m = mock.patch(
+        'webradio.hybrid.pool.Server',
+        mock.create_autospec(hybrid.pool.Server),
+        )
+
+    with m as server:
+        yield server
+
+
+@pytest.fixture(scope='function')
+def servers(fake_servers):
+    server = mock.Mock(spec=["pool", "single", "shutdown"])
+    server.pool = fake_servers(3, "pool")
+    server.single = next(fake_servers(1, "single").sockets)
+
+    return server
+
+
+urls = ["url{}".format(index) for index in range(8)]
+favourites = [5, 0, 2]
+
+
+class TestServer(object):
+    def test_init(self, single_server, pool_server, mkdir, exists, rmdir):
+        basepath = "/hybrid"
+
+        exists.return_value = True
+        with pytest.raises(FileExistsError):
+            hybrid.Server(basepath=basepath, num=3)
+
+        exists.return_value = False
+        server = hybrid.Server(basepath=basepath, num=3)
+
+        assert pool_server.call_args_list[0][1]['num'] == 3
+        assert single_server.call_count == 1
+
+        server.shutdown()
+        assert pool_server.return_value.shutdown.call_count == 1
+        assert single_server.return_value.shutdown.call_count == 1
+        assert rmdir.call_count == 1
+
+
+class TestClient(object):
+    def test_urls(self, servers):
+        client = hybrid.Client(servers, favourites=favourites)
+        client.urls = urls
+
+        assert client.urls == tuple(urls)
+        assert client.pool.urls == tuple(urls[index] for index in favourites)
+        assert servers.single.exists()
+
+        client.disconnect()
+        assert servers.shutdown.call_count == 1
+
+    def test_play(self, servers):
+        pool_servers = servers.pool.servers
+
+        client = hybrid.Client(servers, favourites=favourites)
+        client.urls = urls
+        client.volume = 30
+
+        # a favourite
+        client.play(2)
+        assert client.station == 2
+        assert client.backend(2) is client.pool
+        assert pool_servers[2].volume == 30
+        assert client.muted is False
+
+        # an on demand station
+        client.play(4)
+        assert client.station == 4
+        assert client.single.station == 4
+        assert client.single.muted is False
+        assert client.single.volume == 30
+        assert pool_servers[2].volume == 0
+
+        # the volume only changes on the audible backend
+        client.volume = 45
+        assert client.single.volume == 45
+        assert client.pool.volume == 30
+
+        # back to a favourite
+        client.play(5)
+        assert pool_servers[0].volume == 45
+        assert client.single.muted is True
+
+        client.toggle_mute()
+        assert client.muted is True
+        assert pool_servers[0].volume == 0
+
+        with pytest.raises(RuntimeError):
+            client.play(len(urls))
+
+        client.disconnect()
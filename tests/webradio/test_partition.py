@@ -0,0 +1,125 @@
+import pathlib
+
+import pytest
+
+import webradio.fake as fake
+import webradio.partition as partition
+import webradio.pool as pool
+import webradio.protocol as protocol
+import webradio.supervisor as supervisor
+
+
+def test_fill(tmpdir):
+    path = pathlib.Path(str(tmpdir))
+
+    partition.fill(path, 3)
+
+    config = path / "mpd" / "mpd.conf"
+    assert (path / "mpd" / "playlists").is_dir()
+    assert fake.read_outputs(config) == [
+        ("webradio0", True),
+        ("webradio1", True),
+        ("webradio2", True),
+        ]
+    assert "db_file" not in config.read_text()
+
+
+def test_pool(tmpdir):
+    basepath = pathlib.Path(str(tmpdir)) / "partitions"
+    urls = ["url0", "url1", "url2"]
+
+    server = partition.Server(
+        basepath=basepath,
+        num=len(urls),
+        timeout=5,
+        command=fake.command(),
+        )
+    assert list(server.sockets) == [
+        partition.Endpoint(server.socket, "webradio{}".format(index))
+        for index in range(len(urls))
+        ]
+
+    client = pool.Client(server)
+    client.urls = urls
+    client.volume = 40
+    client.play(1)
+    assert client.urls == tuple(urls)
+
+    # every station has its own player and mixer
+    mpd = protocol.MPDClient()
+    mpd.connect(str(server.socket))
+    statuses = []
+    for index in range(len(urls)):
+        mpd.partition("webradio{}".format(index))
+        statuses.append(mpd.status())
+    mpd.disconnect()
+
+    assert [status["volume"] for status in statuses] == ["0", "40", "0"]
+    assert all(status["state"] == "play" for status in statuses)
+
+    client.disconnect()
+    assert not basepath.exists()
+
+
+def test_attach(tmpdir):
+    basepath = pathlib.Path(str(tmpdir)) / "partitions"
+    urls = ["url0", "url1"]
+    options = dict(
+        basepath=basepath,
+        num=len(urls),
+        timeout=5,
+        command=fake.command(),
+        )
+
+    client = pool.Client(partition.Server(**options))
+    client.urls = urls
+    client.play(0)
+    client.detach()
+
+    # the partitions exist already
+    server = partition.Server(attach=True, **options)
+    assert server.attached
+
+    client = pool.Client(server)
+    assert client.urls == tuple(urls)
+    assert client.station == 0
+
+    client.disconnect()
+    assert not basepath.exists()
+
+
+def test_unsupported(tmpdir):
+    server = partition.Server(
+        basepath=pathlib.Path(str(tmpdir)) / "partitions",
+        num=2,
+        timeout=5,
+        command=fake.command(),
+        )
+
+    # the outputs of the other partitions would be switched as well
+    with pytest.raises(ValueError):
+        pool.Client(server, standby=True)
+
+    client = pool.Client(server)
+    client.urls = ["url0", "url1"]
+
+    # single workers can't be replaced
+    with pytest.raises(ValueError):
+        client.restart(0)
+
+    checker = supervisor.Supervisor(client, recycle_after=0, start=False)
+    assert checker.check() == []
+    assert isinstance(checker.error, ValueError)
+    client.disconnect()
+
+    # nor started on demand
+    lazy = pool.Client(partition.Server(
+        basepath=pathlib.Path(str(tmpdir)) / "lazy",
+        num=2,
+        timeout=5,
+        command=fake.command(),
+        ), lazy=True)
+    lazy.urls = ["url0", "url1"]
+    with pytest.raises(ValueError):
+        lazy.play(0)
+    lazy.disconnect()
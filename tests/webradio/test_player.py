@@ -1,9 +1,33 @@
+import json
+import pathlib
 from unittest import mock
 import pytest
 
 import webradio.player as player
 
 
+@pytest.fixture(scope='function')
+def hybrid():
+    m = mock.patch(
+        'webradio.player.hybrid',
+        mock.create_autospec(player.hybrid),
+        )
+
+    with m as hybrid:
+        yield hybrid
+
+
+@pytest.fixture(scope='function')
+def warmup():
+    m = mock.patch(
+        'webradio.player.warmup',
+        mock.create_autospec(player.warmup),
+        )
+
+    with m as warmup:
+        yield warmup
+
+
 @pytest.fixture(scope='function')
 def pool():
     m = mock.patch(
@@ -43,7 +67,9 @@ class TestPlayer(object):
             prebuffering=False,
             )
 
-        assert single.Server.call_args_list == [mock.call(basepath=basepath)]
+        assert single.Server.call_args_list == [
+            mock.call(basepath=basepath, attach=False),
+            ]
         assert single.Client.call_args_list == [mock.call(server_instance)]
         assert instance.client is client_instance
         assert instance.server is server_instance
@@ -66,13 +92,75 @@ class TestPlayer(object):
             )
 
         assert pool.Server.call_args_list == [
-            mock.call(basepath=basepath, num=n_urls)
+            mock.call(basepath=basepath, num=n_urls, attach=False)
             ]
         assert pool.Client.call_args_list == [mock.call(server_instance)]
         assert instance.client is client_instance
         assert instance.server is server_instance
         assert url_property.call_args_list == [mock.call(urls)]
 
+    def test_init_hybrid(self, single, pool, hybrid):
+        n_urls = 11
+        basepath = "/webradio"
+        urls = list(map(lambda x: "x" + str(x), range(n_urls)))
+        favourites = [3, 5]
+
+        client_instance = hybrid.Client.return_value
+        url_property = mock.PropertyMock()
+        type(client_instance).urls = url_property
+        server_instance = hybrid.Server.return_value
+
+        instance = player.Player(
+            basepath=basepath,
+            urls=urls,
+            prebuffering=True,
+            favourites=favourites,
+            )
+
+        assert hybrid.Server.call_args_list == [
+            mock.call(basepath=basepath, num=len(favourites))
+            ]
+        assert hybrid.Client.call_args_list == [
+            mock.call(server_instance, favourites=favourites)
+            ]
+        assert instance.client is client_instance
+        assert url_property.call_args_list == [mock.call(urls)]
+        assert pool.Server.call_count == 0
+
+        # without prebuffering the favourites don't matter
+        single.Client.return_value.status.return_value = {
+            "state": "play",
+            "bitrate": "128",
+            }
+        instance.prebuffering = False
+        assert instance.wait_switch(timeout=5)
+        assert instance.client is single.Client.return_value
+
+    def test_init_instant(self, single, pool, warmup):
+        n_urls = 11
+        basepath = "/webradio"
+        urls = list(map(lambda x: "x" + str(x), range(n_urls)))
+
+        client_instance = warmup.Client.return_value
+        url_property = mock.PropertyMock()
+        type(client_instance).urls = url_property
+        server_instance = warmup.Server.return_value
+
+        instance = player.Player(
+            basepath=basepath,
+            urls=urls,
+            prebuffering=True,
+            instant_start=True,
+            )
+
+        assert warmup.Server.call_args_list == [
+            mock.call(basepath=basepath, num=n_urls)
+            ]
+        assert warmup.Client.call_args_list == [mock.call(server_instance)]
+        assert instance.client is client_instance
+        assert url_property.call_args_list == [mock.call(urls)]
+        assert pool.Server.call_count == 0
+
     def test_prebuffering(self, single, pool):
         n_urls = 11
         basepath = "/webradio"
@@ -99,11 +187,34 @@ class TestPlayer(object):
         assert instance.client is single_client
         assert instance.server is single_server
 
+        # the station which is playing while switching
+        type(single_client).station = mock.PropertyMock(return_value=3)
+        type(single_client).volume = mock.PropertyMock(return_value=35)
+        single_client.muted = False
+        playing = {"state": "play", "bitrate": "128"}
+        pool_client.status.return_value = playing
+        single_client.status.return_value = playing
+
         # off to on
         instance.prebuffering = True
         assert instance.prebuffering is True
+        assert instance.wait_switch(timeout=5)
         assert instance.client is pool_client
         assert instance.server is pool_server
+        assert instance.switch_error is None
+
+        # the pool was built next to the running server
+        assert pool.Server.call_args_list == [
+            mock.call(basepath=basepath + "-next", num=n_urls, attach=False),
+            ]
+        # and took over the station
+        assert pool_client.play.call_args_list == [mock.call(3)]
+        assert pool_client.status.call_args_list == [mock.call(max_age=0)]
+        assert pool_client.volume == 35
+        assert pool_client.mute.call_count == 0
+        assert single_client.mute.call_count == 1
+        assert single_client.disconnect.call_count == 1
+        assert single_server.shutdown.call_count == 1
 
         # on to on: should be a no-op
         instance.prebuffering = True
@@ -111,11 +222,263 @@ class TestPlayer(object):
         assert instance.client is pool_client
         assert instance.server is pool_server
 
-        # on to off
+        # on to off: back into the first basepath
+        type(pool_client).station = mock.PropertyMock(return_value=None)
         instance.prebuffering = False
+        assert instance.wait_switch(timeout=5)
         assert instance.prebuffering is False
         assert instance.client is single_client
         assert instance.server is single_server
+        assert single.Server.call_args_list[-1] == mock.call(
+            basepath=basepath,
+            attach=False,
+            )
+        assert pool_client.disconnect.call_count == 1
+        assert pool_server.shutdown.call_count == 1
+
+    def test_switch_failing(self, single, pool, tmpdir):
+        basepath = "/webradio"
+        urls = ["x0", "x1"]
+        path = pathlib.Path(str(tmpdir)) / "session.json"
+
+        instance = player.Player(basepath=basepath, urls=urls, session=path)
+        single_client = instance.client
+        type(single_client).station = mock.PropertyMock(return_value=None)
+        type(single_client).volume = mock.PropertyMock(return_value=50)
+        single_client.muted = False
+
+        pool.Server.side_effect = FileExistsError
+        instance.prebuffering = True
+        assert instance.wait_switch(timeout=5)
+
+        # the old backend keeps playing
+        assert isinstance(instance.switch_error, FileExistsError)
+        assert instance.prebuffering is False
+        assert instance.client is single_client
+        assert single_client.disconnect.call_count == 0
+
+        # the failed mode never got into the session
+        assert instance.session.flush(timeout=1)
+        assert not path.exists()
+        instance.shutdown()
+        assert json.loads(path.read_text())["prebuffering"] is False
+
+    @pytest.mark.parametrize("failing", ["client", "urls"])
+    def test_switch_client_failing(self, single, pool, failing):
+        basepath = "/webradio"
+        urls = ["x0", "x1"]
+
+        instance = player.Player(basepath=basepath, urls=urls)
+        single_client = instance.client
+
+        if failing == "client":
+            pool.Client.side_effect = ConnectionRefusedError
+        else:
+            type(pool.Client.return_value).urls = mock.PropertyMock(
+                side_effect=ConnectionRefusedError,
+                )
+        instance.prebuffering = True
+        assert instance.wait_switch(timeout=5)
+
+        # the half built backend doesn't stay behind
+        assert isinstance(instance.switch_error, ConnectionRefusedError)
+        assert pool.Server.return_value.shutdown.call_count == 1
+        if failing == "urls":
+            assert pool.Client.return_value.disconnect.call_count == 1
+        assert instance.prebuffering is False
+        assert instance.client is single_client
+        assert single_client.disconnect.call_count == 0
+
+    def test_session(self, single, pool, tmpdir):
+        path = pathlib.Path(str(tmpdir)) / "session.json"
+        urls = ["x0", "x1", "x2"]
+
+        client = single.Client.return_value
+        type(client).station = mock.PropertyMock(return_value=None)
+        type(client).volume = mock.PropertyMock(return_value=50)
+        client.muted = False
+
+        # nothing to restore yet
+        with pytest.raises(ValueError):
+            player.Player(basepath="/webradio", urls=None, session=path)
+
+        instance = player.Player(basepath="/webradio", urls=urls, session=path)
+        assert client.play.call_count == 0
+
+        type(client).station = mock.PropertyMock(return_value=2)
+        instance.play(2)
+        instance.shutdown()
+        assert json.loads(path.read_text()) == {
+            "urls": urls,
+            "station": 2,
+            "volume": 50,
+            "muted": False,
+            "prebuffering": False,
+            }
+
+        # the last station plays right away, with the urls of the session
+        client.reset_mock()
+        volume = mock.PropertyMock(return_value=50)
+        type(client).volume = volume
+        instance = player.Player(basepath="/webradio", urls=None, session=path)
+        assert instance._urls == urls
+        assert volume.call_args_list[0] == mock.call(50)
+        assert client.load.call_args_list == [mock.call(urls, station=2)]
+        instance.shutdown()
+
+        # but not with other urls
+        client.reset_mock()
+        instance = player.Player(
+            basepath="/webradio",
+            urls=["y0", "y1", "y2"],
+            session=path,
+            )
+        assert client.play.call_count == 0
+        instance.shutdown()
+
+    def test_attach(self, single, pool, tmpdir):
+        basepath = pathlib.Path(str(tmpdir)) / "webradio"
+        path = pathlib.Path(str(tmpdir)) / "session.json"
+        urls = ["x0", "x1"]
+        path.write_text(json.dumps({
+            "urls": urls,
+            "station": 1,
+            "volume": 20,
+            "prebuffering": True,
+            }))
+
+        # the previous player switched to the pool before it was detached
+        next_basepath = pathlib.Path(str(basepath) + "-next")
+        next_basepath.mkdir()
+
+        server = pool.Server.return_value
+        server.attached = True
+        client = pool.Client.return_value
+        url_property = mock.PropertyMock(return_value=tuple(urls))
+        type(client).urls = url_property
+
+        instance = player.Player(
+            basepath=basepath,
+            urls=None,
+            session=path,
+            instant_start=True,
+            attach=True,
+            )
+        assert pool.Server.call_args_list == [
+            mock.call(basepath=str(next_basepath), num=2, attach=True),
+            ]
+        assert single.Server.call_count == 0
+
+        # the adopted workers keep playing as they are
+        assert url_property.call_args_list == [mock.call()]
+        assert client.play.call_count == 0
+        assert client.mock_calls.count(mock.call.mute()) == 0
+
+        instance.detach()
+        assert client.detach.call_count == 1
+        assert client.disconnect.call_count == 0
+        assert server.shutdown.call_count == 0
+
+        with pytest.raises(ValueError):
+            player.Player(
+                basepath=basepath,
+                urls=urls,
+                favourites=[0],
+                attach=True,
+                )
+
+    def test_detach_warmup(self, single, pool, warmup):
+        instance = player.Player(
+            basepath="/webradio",
+            urls=["x0", "x1"],
+            prebuffering=True,
+            instant_start=True,
+            )
+        client = instance.client
+        assert client is warmup.Client.return_value
+
+        # nothing is torn down, the player keeps working
+        with pytest.raises(ValueError):
+            instance.detach()
+        assert instance.client is client
+        instance.play(1)
+
+        instance.shutdown()
+        assert warmup.Server.return_value.shutdown.call_count == 1
+
+    def test_session_prebuffering(self, single, pool, tmpdir):
+        path = pathlib.Path(str(tmpdir)) / "session.json"
+        path.write_text(json.dumps({
+            "urls": ["x0", "x1"],
+            "station": 1,
+            "volume": 20,
+            "muted": True,
+            "prebuffering": True,
+            }))
+
+        single_client = single.Client.return_value
+        type(single_client).station = mock.PropertyMock(return_value=1)
+        single_client.muted = True
+        playing = {"state": "play", "bitrate": "128"}
+        single_client.status.return_value = playing
+        pool.Client.return_value.status.return_value = playing
+
+        instance = player.Player(basepath="/webradio", urls=None, session=path)
+        assert instance.prebuffering is True
+
+        # the single server plays first, muted, before loading the others
+        assert single_client.mute.call_count >= 1
+        assert single_client.load.call_args_list == [
+            mock.call(["x0", "x1"], station=1),
+            ]
+        assert single_client.play.call_count == 0
+        assert single_client.mock_calls.index(mock.call.mute()) < (
+            single_client.mock_calls.index(
+                mock.call.load(["x0", "x1"], station=1),
+                ))
+
+        # and hands over to the pool
+        assert instance.wait_switch(timeout=5)
+        assert instance.client is pool.Client.return_value
+        assert pool.Client.return_value.play.call_args_list == [mock.call(1)]
+        assert pool.Client.return_value.mute.call_count == 1
+        instance.shutdown()
+
+    def test_load(self, single, pool):
+        basepath = "/webradio"
+        urls = ["x0", "x1", "x2"]
+
+        client = single.Client.return_value
+        type(client).station = mock.PropertyMock(return_value=1)
+        client.status.return_value = {"state": "play", "bitrate": "128"}
+
+        instance = player.Player(basepath=basepath, urls=urls)
+        assert single.Server.call_count == 1
+
+        # nothing changed
+        instance.load(urls)
+        assert instance.wait_switch(timeout=5)
+        assert single.Server.call_count == 1
+
+        # the station moved, the new backend plays it at its new index
+        client.reset_mock()
+        instance.load(["x1", "x2"])
+        assert instance.wait_switch(timeout=5)
+        assert instance.switch_error is None
+        assert single.Server.call_args_list[-1] == mock.call(
+            basepath=basepath + "-next",
+            attach=False,
+            )
+        assert client.play.call_args_list == [mock.call(0)]
+        assert instance._urls == ["x1", "x2"]
+        assert instance.prebuffering is False
+
+        # the old urls stay if the new backend fails
+        single.Server.side_effect = FileExistsError
+        instance.load(["y0"])
+        assert instance.wait_switch(timeout=5)
+        assert isinstance(instance.switch_error, FileExistsError)
+        assert instance._urls == ["x1", "x2"]
 
     def test_getattr(self, single, pool):
         n_urls = 13
@@ -162,6 +525,41 @@ class TestPlayer(object):
         instance.volume = volume
         assert volume_property.call_args_list == [mock.call(volume)]
 
+    def test_coalesce(self, single, pool):
+        n_urls = 12
+        basepath = "/webradio"
+        urls = list(map(lambda x: "x" + str(x), range(n_urls)))
+
+        single_client = single.Client.return_value
+        volume_property = mock.PropertyMock(return_value=10)
+        type(single_client).volume = volume_property
+
+        instance = player.Player(
+            basepath=basepath,
+            urls=urls,
+            prebuffering=False,
+            coalesce=10,
+            )
+
+        instance.volume = 20
+        instance.volume_writer.flush(timeout=1)
+        instance.volume = 30
+        instance.volume = 40
+        # reads back what was set, although it is not written yet
+        assert instance.volume == 40
+        assert volume_property.call_args_list[-1] == mock.call(20)
+
+        # the pending value is written before shutting down
+        instance.shutdown()
+        assert volume_property.call_args_list == [
+            mock.call(20),
+            mock.call(40),
+            ]
+
+        # and the writer is closed
+        with pytest.raises(RuntimeError):
+            instance.volume_writer.submit(50)
+
     def test_shutdown(self, single, pool):
         n_urls = 12
         basepath = "/webradio"
@@ -1,6 +1,9 @@
+import pathlib
+import time
 from unittest import mock
 import pytest
 
+import webradio.fake as fake
 import webradio.pool as pool
 
 
@@ -12,6 +15,7 @@ def pool_server():
         )
 
     with m as server:
+        server.return_value.attached = False
         yield server
 
 
@@ -87,6 +91,142 @@ class TestServer(object):
         socket_paths = list(s.sockets)
         assert socket_paths == expected_socket_paths
 
+    def test_ready(self, single_server, mkdir, exists, rmdir):
+        basepath = "/pool"
+        n_instances = 10
+
+        workers = [mock.Mock(name=str(index)) for index in range(n_instances)]
+
+        def start(basepath, **kwargs):
+            # the workers start in arbitrary order
+            index = int(basepath.name[len("webradio"):])
+            return workers[index]
+
+        single_server.side_effect = start
+
+        # limit the number of concurrently starting workers
+        exists.return_value = False
+        s = pool.Server(basepath=basepath, num=n_instances, concurrency=3)
+
+        ready = sorted(s.ready(), key=lambda item: item[0])
+        assert ready == list(enumerate(workers))
+        assert s.worker(4) is workers[4]
+        assert s.workers == workers
+
+    def test_failing_worker(self, single_server, mkdir, exists, rmdir):
+        basepath = "/pool"
+        n_instances = 3
+
+        worker = single_server.return_value
+        single_server.side_effect = [worker, RuntimeError, worker]
+
+        # start sequentially so the side effects are deterministic
+        exists.return_value = False
+        s = pool.Server(basepath=basepath, num=n_instances, concurrency=1)
+
+        with pytest.raises(RuntimeError):
+            s.worker(1)
+
+        # the started workers still get shut down
+        s.shutdown()
+        assert worker.shutdown.call_count == 2
+
+    def test_failing_shutdown(self, single_server, mkdir, exists, rmdir):
+        workers = [mock.Mock(name=str(index)) for index in range(3)]
+        single_server.side_effect = workers
+        workers[0].shutdown.side_effect = ChildProcessError
+
+        exists.return_value = False
+        s = pool.Server(basepath="/pool", num=3, concurrency=1)
+
+        # an mpd which won't die is not hidden
+        with pytest.raises(ChildProcessError):
+            s.remove(0)
+
+        workers[1].shutdown.side_effect = ChildProcessError
+        with pytest.raises(ChildProcessError):
+            s.shutdown()
+        # but doesn't keep the others running
+        assert workers[2].shutdown.call_count == 1
+
+    def test_add_remove(self, single_server, mkdir, exists, rmdir):
+        basepath = "/pool"
+
+        workers = []
+
+        def start(basepath, **kwargs):
+            workers.append(mock.Mock(name=basepath.name))
+            return workers[-1]
+
+        single_server.side_effect = start
+
+        exists.return_value = False
+        s = pool.Server(basepath=basepath, num=0, maximum=2)
+        assert s.size == 0
+
+        assert s.add() == 0
+        assert s.add() == 1
+        with pytest.raises(RuntimeError):
+            s.add()
+
+        first = s.worker(0)
+        s.remove(0)
+        assert first.shutdown.call_count == 1
+        assert s.size == 1
+        with pytest.raises(IndexError):
+            s.worker(0)
+        with pytest.raises(IndexError):
+            s.remove(0)
+
+        # the free index gets reused
+        assert s.add() == 0
+        assert single_server.call_args_list[-1][1]['basepath'].name == \
+            "webradio0"
+        assert s.workers == [workers[2], workers[1]]
+
+        s.shutdown()
+        with pytest.raises(RuntimeError):
+            s.add()
+        assert all(worker.shutdown.call_count == 1 for worker in workers)
+
+
+def test_available_memory(tmpdir):
+    meminfo = pathlib.Path(str(tmpdir)) / "meminfo"
+
+    meminfo.write_text(
+        "MemTotal:        1000000 kB\n"
+        "MemFree:          200000 kB\n"
+        "MemAvailable:     512000 kB\n"
+        )
+    assert pool.available_memory(str(meminfo)) == 512000 * 1024
+
+    # MemFree on old kernels
+    meminfo.write_text("MemTotal: 1000 kB\nMemFree: 300 kB\n")
+    assert pool.available_memory(str(meminfo)) == 300 * 1024
+
+    assert pool.available_memory(str(meminfo) + ".missing") is None
+
+
+def test_memory_limits(tmpdir):
+    meminfo = pathlib.Path(str(tmpdir)) / "meminfo"
+    meminfo.write_text("MemAvailable: {} kB\n".format(64 * 1024 * 10))
+
+    minimum, maximum = pool.memory_limits(
+        worker_size=64 * 2**20,
+        reserve=2 * 64 * 2**20,
+        meminfo=str(meminfo),
+        )
+    assert (minimum, maximum) == (2, 8)
+
+    # there is always room for one worker
+    assert pool.memory_limits(
+        worker_size=2**40,
+        meminfo=str(meminfo),
+        ) == (1, 1)
+
+    assert pool.memory_limits(meminfo=str(meminfo) + ".missing") == \
+        (1, None)
+
 
 class TestClient(object):
     def test_init(self, single_client, pool_server):
@@ -132,9 +272,44 @@ class TestClient(object):
         assert instance.volume == volume1
         volume.reset_mock()
 
-        # check pass through by setting
+        # not playing: nothing is sent
         instance.volume = volume2
-        assert volume.call_args_list == [mock.call(volume2)] * n_instances
+        assert instance.volume == volume2
+        assert volume.call_count == 0
+
+        # playing: the new worker gets the volume before being unmuted
+        instance.play(3)
+        assert volume.call_args_list == [mock.call(volume2)]
+
+        # only the audible worker gets the changes
+        volume.reset_mock()
+        instance.volume = volume1
+        assert instance.volume == volume1
+        assert volume.call_args_list == [mock.call(volume1)]
+
+    def test_coalesce(self, single_client, pool_server):
+        n_instances = 5
+
+        server_instance = pool_server.return_value
+        client_instance = single_client.return_value
+        type(server_instance).sockets = mock.PropertyMock(
+            return_value=range(n_instances),
+            )
+        volume = mock.PropertyMock(return_value=10)
+        type(client_instance).volume = volume
+
+        instance = pool.Client(server_instance, coalesce=10)
+        instance.play(2)
+        volume.reset_mock()
+
+        instance.volume = 40
+        instance.volume_writer.flush(timeout=1)
+        instance.volume = 50
+        instance.volume = 60
+        assert instance.volume == 60
+
+        instance.disconnect()
+        assert volume.call_args_list == [mock.call(40), mock.call(60)]
 
     def test_urls(self, single_client, pool_server):
         n_instances = 20
@@ -180,9 +355,7 @@ class TestClient(object):
 
         instance = pool.Client(server_instance)
 
-        muted = mock.PropertyMock(
-            side_effect=[True] * (n_instances - 1) + [False],
-            )
+        muted = mock.PropertyMock(return_value=False)
         type(client_instance).muted = muted
 
         # not playing
@@ -193,14 +366,13 @@ class TestClient(object):
         assert muted.call_count == 0
 
         # playing (at least, we pretend to be playing)
-        # reading
+        # reading: only the current client is asked
         instance._current = client_instance
         assert instance.muted is False
-        assert muted.call_count == n_instances
+        assert muted.call_count == 1
 
         muted.reset_mock()
         # from unmuted to muted
-        muted.side_effect = None
         instance.muted = True
         assert muted.call_args_list == [mock.call(True)]
 
@@ -210,11 +382,13 @@ class TestClient(object):
         assert muted.call_args_list == [mock.call(False)]
 
     def test_play(self, single_client, pool_server):
-        muted = mock.PropertyMock()
+        changes = []
 
         def with_name(value):
             obj = mock.Mock(name=str(value))
-            type(obj).muted = muted
+            type(obj).muted = mock.PropertyMock(
+                side_effect=lambda state: changes.append((value, state)),
+                )
             return obj
 
         n_instances = 13
@@ -230,26 +404,30 @@ class TestClient(object):
 
         instance = pool.Client(server_instance)
         # delete the muted calls on startup
-        muted.reset_mock()
+        del changes[:]
 
         # play with an index to big: no-op
         with pytest.raises(IndexError):
             instance.play(n_instances + 5)
 
         assert instance._current is None
-        assert muted.call_count == 0
+        assert changes == []
 
-        # with an arbitrary index
+        # with an arbitrary index: only unmute the new one
         instance.play(index1)
         assert instance._current._mock_name == str(index1)
-        calls = [mock.call(True)] * n_instances + [mock.call(False)]
-        assert muted.call_args_list == calls
+        assert changes == [(index1, False)]
 
-        muted.reset_mock()
-        # with another one
+        del changes[:]
+        # with another one: unmute the new one first, then mute the old one
         instance.play(index2)
         assert instance._current._mock_name == str(index2)
-        assert muted.call_args_list == calls
+        assert changes == [(index2, False), (index1, True)]
+
+        del changes[:]
+        # with the same one
+        instance.play(index2)
+        assert changes == [(index2, False)]
 
     def test_station(self, single_client, pool_server):
         station_property = mock.PropertyMock()
@@ -285,16 +463,12 @@ class TestClient(object):
 
     def test_mute_functions(self, single_client, pool_server):
         n_instances = 17
-        client_instance = single_client.return_value
         server_instance = pool_server.return_value
 
         current = mock.Mock()
         muted = mock.PropertyMock()
         type(current).muted = muted
 
-        total_muted = mock.PropertyMock()
-        type(client_instance).muted = total_muted
-
         type(server_instance).sockets = mock.PropertyMock(
             return_value=range(n_instances),
             )
@@ -314,14 +488,14 @@ class TestClient(object):
 
         # toggle_mute()
         muted.reset_mock()
-        total_muted.side_effect = [True] * n_instances
+        muted.return_value = True
         instance.toggle_mute()
-        assert muted.call_args_list == [mock.call(False)]
+        assert muted.call_args_list == [mock.call(), mock.call(False)]
 
         muted.reset_mock()
-        total_muted.side_effect = [True] * (n_instances - 1) + [False]
+        muted.return_value = False
         instance.toggle_mute()
-        assert muted.call_args_list == [mock.call(True)]
+        assert muted.call_args_list == [mock.call(), mock.call(True)]
 
     def test_context(self, single_client, pool_server):
         n_instances = 10
@@ -339,6 +513,27 @@ class TestClient(object):
         assert server_instance.shutdown.call_count == 1
 
 
+def test_standby(fake_servers):
+    servers = fake_servers(3)
+    outputs = [server.outputs for server in servers.servers]
+    audible = [["alsa", True], ["standby", False]]
+    standby = [["alsa", False], ["standby", True]]
+
+    client = pool.Client(servers, standby=True)
+    client.urls = ["url0", "url1", "url2"]
+    assert outputs == [standby] * 3
+
+    client.play(1)
+    assert outputs == [standby, audible, standby]
+    assert servers.servers[1].volume > 0
+
+    client.play(2)
+    assert outputs == [standby, standby, audible]
+    assert servers.servers[1].volume == 0
+
+    client.disconnect()
+
+
 def test_map(pool_client, pool_server):
     client_instance = pool_client.return_value
     server_instance = pool_server.return_value
@@ -356,3 +551,184 @@ def test_map(pool_client, pool_server):
         ]
     assert pool_client.call_args_list == [mock.call(server_instance)]
     assert url_prop.call_args_list == [mock.call(urls)]
+
+
+def test_lazy(tmpdir):
+    urls = ["url{}".format(index) for index in range(6)]
+
+    server = pool.Server(
+        basepath=pathlib.Path(str(tmpdir)) / "pool",
+        num=0,
+        fast_boot=True,
+        timeout=5,
+        command=fake.command(),
+        minimum=1,
+        maximum=3,
+        )
+    client = pool.Client(server, lazy=True, idle_timeout=60)
+
+    # the minimum gets started right away
+    client.urls = urls
+    assert client.urls == tuple(urls)
+    assert server.size == 1
+
+    client.volume = 35
+    client.play(4)
+    assert server.size == 2
+    assert client.station == 4
+    assert client.volume == 35
+    assert client.muted is False
+
+    client.play(2)
+    assert server.size == 3
+
+    # the least recently played workers make room
+    client.play(5)
+    assert client.clients[0] is None
+    client.play(3)
+    assert client.clients[4] is None
+    assert server.size == 3
+    assert client.clients[3].urls == [urls[3]]
+
+    # nothing is idle yet
+    assert client.reap() == []
+
+    later = client._used[3] + 61
+    assert client.reap(now=later) == [2, 5]
+    assert server.size == 1
+    assert client.station == 3
+
+    client.disconnect()
+    assert not server.basepath.exists()
+
+
+def test_attach(tmpdir):
+    basepath = pathlib.Path(str(tmpdir)) / "pool"
+    urls = ["url0", "url1", "url2"]
+    options = dict(
+        basepath=basepath,
+        num=len(urls),
+        fast_boot=True,
+        timeout=5,
+        command=fake.command(),
+        )
+
+    server = pool.Server(**options)
+    assert not server.attached
+    client = pool.Client(server)
+    client.urls = urls
+    client.volume = 30
+    client.play(1)
+    pids = [worker.pid for worker in server.workers]
+
+    client.detach()
+    assert all(fake.alive(pid) for pid in pids)
+
+    with pytest.raises(FileExistsError):
+        pool.Server(**options)
+
+    server = pool.Server(attach=True, **options)
+    assert server.attached
+    assert [worker.pid for worker in server.workers] == pids
+
+    client = pool.Client(server)
+    assert client.urls == tuple(urls)
+    assert client.station == 1
+    assert client.volume == 30
+    assert client.muted is False
+
+    # the workers keep playing
+    client.urls = urls
+    assert client.station == 1
+    assert client.clients[1].status(max_age=0)["volume"] == "30"
+
+    client.play(2)
+    assert client.clients[1].status(max_age=0)["volume"] == "0"
+
+    # every worker is muted now, only the state file knows the station
+    client.mute()
+    client.detach()
+
+    client = pool.Client(pool.Server(attach=True, **options))
+    assert client.station == 2
+    assert client.volume == 30
+    assert client.muted is True
+
+    client.play(0)
+    assert client.muted is False
+    assert client.clients[0].status(max_age=0)["volume"] == "30"
+
+    client.disconnect()
+    assert not basepath.exists()
+
+
+def test_lazy_warm_up(tmpdir):
+    server = pool.Server(
+        basepath=pathlib.Path(str(tmpdir)) / "pool",
+        num=0,
+        fast_boot=True,
+        timeout=5,
+        command=fake.command(boot_delay=0.5),
+        minimum=4,
+        )
+    client = pool.Client(server, lazy=True)
+
+    # the workers boot concurrently, one after another would take 2s
+    start = time.monotonic()
+    client.urls = ["url{}".format(index) for index in range(6)]
+    assert time.monotonic() - start < 1.5
+
+    assert all(client.clients[station] is not None for station in range(4))
+    assert client.clients[4] is None
+    client.disconnect()
+
+
+def test_reap_in_background(tmpdir):
+    server = pool.Server(
+        basepath=pathlib.Path(str(tmpdir)) / "pool",
+        num=0,
+        fast_boot=True,
+        timeout=5,
+        command=fake.command(),
+        minimum=1,
+        maximum=3,
+        )
+    client = pool.Client(server, lazy=True, idle_timeout=0.2)
+    client.urls = ["url{}".format(index) for index in range(4)]
+
+    client.play(2)
+    client.play(3)
+    assert server.size == 3
+
+    # staying on a station without playing another one
+    deadline = time.monotonic() + 5
+    while server.size > 1 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert server.size == 1
+    assert client.station == 3
+
+    client.disconnect()
+    assert not server.basepath.exists()
+
+
+def test_reap_error(single_client, pool_server):
+    server = pool_server.return_value
+    server.minimum = 0
+    server.maximum = None
+    server.add.side_effect = [0, 1]
+    single_client.side_effect = lambda *args, **kwargs: mock.Mock()
+
+    client = pool.Client(server, lazy=True, idle_timeout=0.05)
+    client.urls = ["url0", "url1"]
+    client.play(0)
+    client.play(1)
+
+    # the reaper keeps the error and goes on
+    server.remove.side_effect = ChildProcessError
+    deadline = time.monotonic() + 5
+    while client.reap_error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert isinstance(client.reap_error, ChildProcessError)
+    assert client._reaper.is_alive()
+
+    client.disconnect()
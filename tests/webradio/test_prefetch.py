@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+import webradio.prefetch as prefetch
+
+
+@pytest.fixture(scope='function')
+def servers(fake_servers):
+    return fake_servers(4)
+
+
+urls = ["url{}".format(index) for index in range(10)]
+
+
+class TestClient(object):
+    def test_neighbours(self, servers):
+        client = prefetch.Client(servers)
+        client.urls = urls
+
+        assert client.neighbours(4) == [5, 3]
+        assert client.neighbours(0) == [1, 9]
+        assert client.neighbours(9) == [0, 8]
+
+        client.wrap = False
+        assert client.neighbours(0) == [1]
+        assert client.neighbours(9) == [8]
+
+        client.disconnect()
+
+    def test_zapping(self, servers):
+        client = prefetch.Client(servers)
+        client.urls = urls
+        client.volume = 40
+
+        client.play(4)
+        assert client.wait(timeout=5)
+        assert all(client.worker(station) is not None for station in (3, 4, 5))
+        assert servers.servers[client.worker(4)].volume == 40
+
+        # going up keeps the previous station and buffers the next one
+        for station in range(5, 9):
+            assert client.worker(station) is not None
+            client.play(station)
+            assert client.wait(timeout=5)
+
+            assert client.station == station
+            for neighbour in (station - 1, station + 1):
+                worker = client.worker(neighbour)
+                assert worker is not None
+                assert servers.servers[worker].playlist == [urls[neighbour]]
+                assert servers.servers[worker].volume == 0
+
+        # jumping back to the previous station
+        client.play(2)
+        assert client.wait(timeout=5)
+        assert client.worker(8) is not None
+        assert client.neighbours(2) == [3, 1, 8]
+
+        client.play(8)
+        assert servers.servers[client.worker(8)].volume == 40
+        assert client.muted is False
+
+        client.disconnect()
+
+    def test_play_while_prefetching(self, servers):
+        client = prefetch.Client(servers)
+        client.urls = urls
+        client.play(4)
+        assert client.wait(timeout=5)
+
+        # loading a spare worker takes a while
+        for server in servers.servers:
+            server.latency = {"add": 0.5}
+
+        client.play(5)
+        # the prefetching of 6 is in progress
+        time.sleep(0.1)
+        start = time.monotonic()
+        client.play(4)
+        # the neighbour is prebuffered, only the prefetching has to load
+        assert time.monotonic() - start < 0.4
+        assert client.station == 4
+
+        assert client.wait(timeout=5)
+        for neighbour in client.neighbours(4):
+            worker = client.worker(neighbour)
+            assert worker is not None
+            assert servers.servers[worker].playlist == [urls[neighbour]]
+
+        client.disconnect()
+
+    def test_invalid(self, servers):
+        client = prefetch.Client(servers)
+        client.urls = urls
+
+        with pytest.raises(RuntimeError):
+            client.play(len(urls))
+
+        client.disconnect()
@@ -0,0 +1,186 @@
+import pathlib
+import socket
+import threading
+
+import pytest
+
+import webradio.protocol as protocol
+
+
+status_response = (
+    b"volume: 35\n"
+    b"repeat: 0\n"
+    b"playlistlength: 3\n"
+    b"state: play\n"
+    b"song: 1\n"
+    b"songid: 2\n"
+    b"bitrate: 128\n"
+    b"audio: 44100:24:2\n"
+    b"OK\n"
+    )
+
+
+@pytest.fixture(scope='function')
+def connection():
+    """ a client connected to one end of a socket pair """
+    client_end, server_end = socket.socketpair()
+
+    client = protocol.MPDClient(bufsize=16)
+    client._socket = client_end
+
+    yield client, server_end
+
+    client_end.close()
+    server_end.close()
+
+
+def test_quote():
+    assert protocol.quote('a "b" \\c') == '"a \\"b\\" \\\\c"'
+    assert protocol.encode("add", "x y") == b'add "x y"\n'
+    assert protocol.encode("play") == b'play\n'
+
+
+def test_parse():
+    body = status_response[:-len(b"OK\n")]
+
+    # only the requested fields
+    response = protocol.parse(body, 0, len(body), ["volume", "song"])
+    assert response == {"volume": "35", "song": "1"}
+
+    # everything
+    response = protocol.parse(body, 0, len(body))
+    assert response["audio"] == "44100:24:2"
+    assert len(response) == 8
+
+    # a region of a larger buffer
+    buffer = bytearray(b"xxx" + body + b"OK\n")
+    response = protocol.parse(buffer, 3, 3 + len(body), ["state"])
+    assert response == {"state": "play"}
+
+
+class TestMPDClient(object):
+    def test_connect(self, tmpdir):
+        path = str(pathlib.Path(str(tmpdir)) / "socket")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+
+        def serve():
+            connection, _ = listener.accept()
+            connection.sendall(b"OK MPD 0.19.0\n")
+            assert connection.recv(16) == b"close\n"
+            connection.close()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+
+        client = protocol.MPDClient()
+        client.connect(host=path, port=0)
+        assert client.mpd_version == "0.19.0"
+
+        client.disconnect()
+        thread.join()
+        listener.close()
+
+        # nothing to connect to
+        with pytest.raises(OSError):
+            client.connect(host=path, port=0)
+
+    def test_status(self, connection):
+        client, server = connection
+
+        # the response is larger than the buffer and arrives in pieces
+        server.sendall(status_response[:20])
+        server.sendall(status_response[20:] + status_response)
+
+        status = client.status()
+        assert server.recv(64) == b"status\n"
+        assert status == {
+            "volume": "35",
+            "state": "play",
+            "song": "1",
+            "bitrate": "128",
+            }
+
+        # the second response is already buffered
+        assert client.status() == status
+
+    def test_error(self, connection):
+        client, server = connection
+
+        server.sendall(b"ACK [2@0] {play} Bad song index\nOK\n")
+        with pytest.raises(protocol.CommandError) as e:
+            client.play(20)
+        assert "Bad song index" in str(e.value)
+        assert server.recv(64) == b'play "20"\n'
+
+        # the client is still usable
+        client.ping()
+
+    def test_connection_lost(self, connection):
+        client, server = connection
+
+        server.sendall(b"volume: 3")
+        server.close()
+        with pytest.raises(ConnectionError):
+            client.status()
+
+    def test_execute(self, connection):
+        client, server = connection
+
+        server.sendall(
+            b"OK\nACK [50@0] {add} No such file\n" + status_response,
+            )
+        with pytest.raises(protocol.CommandError):
+            client.execute(("setvol", 0), ("add", "x"), ("status",))
+
+        # all commands were sent in a single write
+        assert server.recv(64) == b'setvol "0"\nadd "x"\nstatus\n'
+
+        server.sendall(b"OK\n" + status_response)
+        responses = client.execute(
+            ("setvol", 10),
+            ("status",),
+            fields=["volume"],
+            )
+        assert responses == [{}, {"volume": "35"}]
+
+    def test_command_list(self, connection):
+        client, server = connection
+
+        client.command_list_ok_begin()
+        client.clear()
+        client.add("a")
+        client.add("b")
+
+        server.sendall(b"list_OK\n" * 3 + b"OK\n")
+        assert client.command_list_end() == [{}, {}, {}]
+        assert server.recv(256) == (
+            b'command_list_ok_begin\nclear\nadd "a"\nadd "b"\n'
+            b'command_list_end\n'
+            )
+
+        # a failing command aborts the list
+        client.command_list_ok_begin()
+        client.add("a")
+        client.add("b")
+        server.sendall(b"list_OK\nACK [50@1] {add} No such file\n")
+        with pytest.raises(protocol.CommandError):
+            client.command_list_end()
+
+        with pytest.raises(protocol.CommandError):
+            client.command_list_end()
+
+    def test_idle(self, connection):
+        client, server = connection
+
+        server.sendall(b"changed: mixer\nchanged: player\nOK\n")
+        assert client.idle("player", "mixer") == ["mixer", "player"]
+        assert server.recv(64) == b'idle "player" "mixer"\n'
+
+        # aborting unblocks a pending idle
+        timer = threading.Timer(0.05, client.abort)
+        timer.start()
+        with pytest.raises(ConnectionError):
+            client.idle()
+        timer.join()
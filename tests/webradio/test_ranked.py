@@ -0,0 +1,77 @@
+import pathlib
+
+import pytest
+
+import webradio.ranked as ranked
+import webradio.usage as usage
+
+
+@pytest.fixture(scope='function')
+def servers(fake_servers):
+    return fake_servers(3)
+
+
+urls = ["url{}".format(index) for index in range(10)]
+
+
+class TestClient(object):
+    def test_urls(self, servers):
+        counters = usage.Usage()
+        for _ in range(3):
+            counters.record(urls[7])
+        counters.record(urls[4])
+
+        client = ranked.Client(servers, usage=counters)
+        client.urls = urls
+
+        # the favourites get the workers
+        assert client.urls == tuple(urls)
+        assert client.assignments == (7, 4, 0)
+        for server, station in zip(servers.servers, client.assignments):
+            assert server.playlist == [urls[station]]
+            assert server.state == "play"
+            assert server.volume == 0
+
+        client.disconnect()
+
+    def test_play(self, servers):
+        client = ranked.Client(servers)
+        client.urls = urls
+        client.volume = 40
+
+        # a prebuffered station
+        client.play(1)
+        assert client.station == 1
+        assert servers.servers[1].volume == 40
+        assert client.muted is False
+
+        # a cold station evicts the least valuable worker
+        client.play(5)
+        assert client.station == 5
+        assert client.assignments == (5, 1, 2)
+        assert servers.servers[0].playlist == [urls[5]]
+        assert servers.servers[0].volume == 40
+        assert servers.servers[1].volume == 0
+
+        # the audible worker is never evicted
+        client.play(6)
+        client.play(7)
+        assert client.worker(7) is not None
+        assert client.worker(6) is not None
+        assert client.station == 7
+
+        with pytest.raises(RuntimeError):
+            client.play(len(urls))
+
+        client.disconnect()
+
+    def test_usage_file(self, servers, tmpdir):
+        path = pathlib.Path(str(tmpdir)) / "usage.json"
+
+        client = ranked.Client(servers, usage=usage.Usage(path))
+        client.urls = urls
+        client.play(8)
+        client.disconnect()
+
+        # the counters survive restarts
+        assert usage.Usage(path).ranked(urls)[0] == 8
@@ -0,0 +1,54 @@
+import json
+import pathlib
+
+import pytest
+
+import webradio.session as session
+
+
+def test_session(tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "state" / "session.json"
+
+    s = session.Session(path, interval=10)
+    assert s.load() == {}
+
+    s.save(urls=["a", "b"], station=1, volume=30)
+    assert s.flush(timeout=1)
+    assert json.loads(path.read_text()) == {
+        "urls": ["a", "b"],
+        "station": 1,
+        "volume": 30,
+        }
+
+    # rate limited: only the latest of these gets written, on closing
+    s.save(volume=40)
+    s.save(volume=50, muted=True)
+    assert json.loads(path.read_text())["volume"] == 30
+    s.close()
+    assert s.error is None
+
+    restored = session.Session(path).load()
+    assert restored == {
+        "urls": ["a", "b"],
+        "station": 1,
+        "volume": 50,
+        "muted": True,
+        }
+    assert [p.name for p in path.parent.iterdir()] == [path.name]
+
+    with pytest.raises(ValueError):
+        s.save(colour="blue")
+
+
+def test_load_broken(tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "session.json"
+
+    path.write_text('{"urls": ["a"], "stat')
+    assert session.Session(path).load() == {}
+
+    path.write_text('[1, 2]')
+    assert session.Session(path).load() == {}
+
+    # unknown fields are dropped
+    path.write_text('{"volume": 20, "colour": "blue"}')
+    assert session.Session(path).load() == {"volume": 20}
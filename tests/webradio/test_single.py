@@ -1,10 +1,17 @@
+import asyncio
+import os
 import pathlib
 import shutil
+import signal
+import queue
 import subprocess
+import threading
+import time
 
 from unittest import mock
 import pytest
 
+import webradio.fake as fake
 import webradio.single as single
 
 
@@ -44,8 +51,7 @@ def fill():
 @pytest.fixture(scope='function')
 def mpdclient():
     m = mock.patch(
-        'webradio.single.musicpd.MPDClient',
-        # mock.create_autospec(single.musicpd.MPDClient),
+        'webradio.single.protocol.MPDClient',
         )
 
     with m as mpdclient:
@@ -70,6 +76,24 @@ def test_fill(tmpdir):
     assert config.stat().st_size > 0
 
 
+def test_fill_fast_boot(tmpdir):
+    path = pathlib.Path(str(tmpdir))
+
+    single.fill(path, fast_boot=True)
+
+    mpd = path / "mpd"
+    expected_content = [
+        mpd / name
+        for name in ["mpd.conf", "playlists"]
+        ]
+    assert sorted(mpd.iterdir()) == expected_content
+
+    config = (mpd / "mpd.conf").read_text()
+    for option in ["music_directory", "db_file", "state_file", "sticker"]:
+        assert option not in config
+    assert "bind_to_address" in config
+
+
 class TestServer(object):
     def test_init_succeeding(self, exists, mkdir, fill, call):
         basepath = pathlib.Path("root")
@@ -139,6 +163,44 @@ class TestServer(object):
         assert "--kill" in call.call_args_list[-1][0][0]
         assert rmdir.call_count == 1
 
+    def test_wait_ready(self, exists, mkdir, fill, call):
+        basepath = pathlib.Path("root")
+        m = mock.patch('webradio.single.socket')
+
+        # the socket appears after a few polls
+        exists.side_effect = [False, False, False, True]
+        with m as socket_module:
+            s = single.Server(basepath=basepath, timeout=1)
+        assert exists.call_count == 4
+        assert s.boot_time >= 0
+
+        # bound, but not listening yet
+        exists.side_effect = None
+        exists.return_value = True
+        with m as socket_module:
+            connection = socket_module.socket.return_value
+            connection.connect.side_effect = [ConnectionRefusedError, None]
+            s.wait_ready(timeout=1)
+        assert connection.connect.call_count == 2
+        assert connection.close.call_count == 2
+
+        # the socket never appears
+        exists.side_effect = None
+        exists.return_value = False
+        s = single.Server(basepath=basepath)
+        with pytest.raises(TimeoutError):
+            s.wait_ready(timeout=0.05)
+
+    def test_fast_boot(self, exists, mkdir, fill, call):
+        basepath = pathlib.Path("root")
+
+        exists.return_value = False
+        single.Server(basepath=basepath, fast_boot=True)
+
+        assert fill.call_args_list == [
+            mock.call(basepath.absolute(), fast_boot=True),
+            ]
+
     def test_socket(self, exists, mkdir, fill, call, rmtree, rmdir):
         basepath = pathlib.Path("root").absolute()
         exists.return_value = False
@@ -150,6 +212,90 @@ class TestServer(object):
         assert socket.relative_to(basepath) == pathlib.Path("mpd/socket")
 
 
+def test_attach(tmpdir):
+    basepath = pathlib.Path(str(tmpdir)) / "webradio"
+    options = dict(
+        basepath=basepath,
+        fast_boot=True,
+        timeout=5,
+        command=fake.command(),
+        )
+
+    server = single.Server(**options)
+    client = single.Client(server, keepalive=None)
+    client.urls = ["a", "b"]
+    client.volume = 40
+    client.play(1)
+    pid = server.pid
+
+    client.detach()
+    assert fake.alive(pid)
+
+    # the running mpd is adopted and the state read from it
+    server = single.Server(attach=True, **options)
+    assert server.attached
+    assert server.pid == pid
+
+    client = single.Client(server, keepalive=None)
+    assert client.urls == ["a", "b"]
+    assert client.station == 1
+    assert client.volume == 40
+    assert client.muted is False
+
+    client.mute()
+    client.detach()
+    with single.Client(single.Server(attach=True, **options)) as client:
+        assert client.muted is True
+        assert client.station == 1
+        # mpd only knows a volume of 0, the state file the one before
+        assert client.volume == 40
+
+        client.unmute()
+        assert client.status(max_age=0)["volume"] == "40"
+
+    assert not fake.alive(pid)
+    assert not basepath.exists()
+
+
+def test_load_station(fake_servers):
+    servers = fake_servers(1)
+    urls = ["url{}".format(index) for index in range(5)]
+
+    with single.Client(next(servers.sockets), keepalive=None) as client:
+        for station in (0, 2, 4):
+            client.load(urls, station=station, chunksize=2)
+            assert servers.servers[0].playlist == urls
+            assert client.status(max_age=0)["song"] == str(station)
+            assert client.status()["state"] == "play"
+
+
+def test_attach_stale(tmpdir):
+    basepath = pathlib.Path(str(tmpdir)) / "webradio"
+    options = dict(
+        basepath=basepath,
+        fast_boot=True,
+        timeout=5,
+        command=fake.command(),
+        )
+
+    server = single.Server(**options)
+    server.detach()
+    pid = server.pid
+    os.kill(pid, signal.SIGKILL)
+    while fake.alive(pid):
+        time.sleep(0.01)
+
+    # the crashed mpd left its tree behind
+    server = single.Server(attach=True, **options)
+    assert not server.attached
+    assert server.pid != pid
+
+    with single.Client(server, keepalive=None) as client:
+        assert client.urls == []
+
+    assert not basepath.exists()
+
+
 class TestClient(object):
     basepath = pathlib.Path("root")
 
@@ -172,7 +318,7 @@ class TestClient(object):
         assert client.muted == muted
 
         # with a server object
-        server = mock.Mock()
+        server = mock.Mock(attached=False)
         type(server).socket = mock.PropertyMock(return_value=self.basepath)
 
         client = single.Client(server)
@@ -189,6 +335,18 @@ class TestClient(object):
 
         expected_call = mock.call(host=str(self.basepath.absolute()), port=0)
         assert client_mock.connect.call_args_list == [expected_call]
+        assert client_mock.partition.call_count == 0
+
+        # with a partition, every connection selects it
+        server = mock.Mock(spec=["socket", "partition"])
+        server.socket = self.basepath
+        server.partition = "webradio3"
+
+        client = single.Client(server)
+        client._connect()
+        assert client_mock.partition.call_args_list == [
+            mock.call("webradio3"),
+            ] * 2
 
     def test_disconnect(self, mpdclient):
         client_mock = mpdclient.return_value
@@ -211,22 +369,66 @@ class TestClient(object):
 
         client = single.Client(self.basepath)
 
-        # succeeding
-        client_mock.ping.return_value = True
+        # succeeding: no additional round-trip
         client.clear()
         assert client_mock.clear.call_count == 1
+        assert client_mock.ping.call_count == 0
 
         client_mock.clear.reset_mock()
         client_mock.connect.reset_mock()
-        # failing
-        client_mock.ping.side_effect = BrokenPipeError
+        # failing once: reconnect and replay
+        client_mock.clear.side_effect = [BrokenPipeError, None]
         client.clear()
 
         # check that the calls were actually executed
-        assert client_mock.clear.call_count == 1
+        assert client_mock.clear.call_count == 2
         assert client_mock.connect.call_count == 1
         assert client_mock.disconnect.call_count == 1
 
+        client_mock.clear.reset_mock()
+        # failing twice: the error is propagated
+        client_mock.clear.side_effect = ConnectionResetError
+        with pytest.raises(ConnectionError):
+            client.clear()
+        assert client_mock.clear.call_count == 2
+
+    def test_reconnect(self, mpdclient):
+        client_mock = mpdclient.return_value
+
+        client = single.Client(self.basepath)
+        client_mock.connect.reset_mock()
+
+        # the server comes back after a few attempts
+        client_mock.connect.side_effect = [
+            FileNotFoundError,
+            ConnectionRefusedError,
+            None,
+            ]
+        client._reconnect(delay=0)
+        assert client_mock.connect.call_count == 3
+
+        # the server does not come back
+        client_mock.connect.reset_mock()
+        client_mock.connect.side_effect = ConnectionRefusedError
+        with pytest.raises(ConnectionRefusedError):
+            client._reconnect(attempts=3, delay=0)
+        assert client_mock.connect.call_count == 3
+
+    def test_keepalive(self, mpdclient):
+        client_mock = mpdclient.return_value
+
+        client = single.Client(self.basepath, keepalive=0.01)
+        time.sleep(0.1)
+        client.disconnect()
+
+        # idle connections get pinged
+        assert client_mock.ping.call_count > 0
+
+        client_mock.ping.reset_mock()
+        client = single.Client(self.basepath, keepalive=None)
+        time.sleep(0.05)
+        assert client_mock.ping.call_count == 0
+
     def test_volume(self, mpdclient):
         client_mock = mpdclient.return_value
 
@@ -252,6 +454,151 @@ class TestClient(object):
         expected_calls = [mock.call(volume2), mock.call(volume3)]
         assert client_mock.setvol.call_args_list == expected_calls
 
+    def test_status(self, mpdclient):
+        client_mock = mpdclient.return_value
+        client_mock.status.side_effect = lambda: {
+            'volume': '20',
+            'state': 'stop',
+            }
+
+        client = single.Client(self.basepath, status_ttl=60)
+        client.urls = list(map(str, range(5)))
+        assert client_mock.status.call_count == 1
+        assert client.cache_misses == 1
+
+        # loading the playlist invalidated the status
+        assert client.status() == {'volume': '20', 'state': 'stop'}
+        assert client_mock.status.call_count == 2
+
+        # the own commands update the cached status
+        client.volume = 35
+        client.play(3)
+        status = client.status()
+        assert status == {'volume': '35', 'state': 'play', 'song': '3'}
+        assert client_mock.status.call_count == 2
+        assert client.cache_hits == 1
+        assert client.cache_misses == 2
+
+        # clearing invalidates
+        client.clear()
+        client.status()
+        assert client_mock.status.call_count == 3
+
+        # asking the server explicitly
+        client.status()
+        client.status(max_age=0)
+        assert client_mock.status.call_count == 4
+
+        # the status expires
+        client.status_ttl = 0
+        client.status()
+        assert client_mock.status.call_count == 5
+        assert client.cache_misses == 5
+
+    def test_watch(self, mpdclient):
+        client_mock = mpdclient.return_value
+        client_mock.status.side_effect = lambda: {
+            'volume': '20',
+            'state': 'stop',
+            }
+
+        aborted = threading.Event()
+        client_mock.abort.side_effect = aborted.set
+
+        changes = [["mixer", "player"]]
+
+        def idle(*subsystems):
+            if changes:
+                return changes.pop()
+
+            # block like a real idle until the watcher is stopped
+            aborted.wait()
+            raise ConnectionError("aborted")
+
+        client_mock.idle.side_effect = idle
+
+        client = single.Client(self.basepath, muted=False)
+        assert client.volume == 20
+
+        # another client changed the volume and the song
+        client_mock.status.side_effect = lambda: {
+            'volume': '60',
+            'state': 'play',
+            'song': '2',
+            }
+
+        received = queue.Queue()
+        client.subscribe(
+            lambda subsystem, status: received.put((subsystem, status)),
+            subsystems=["mixer"],
+            )
+
+        subsystem, status = received.get(timeout=1)
+        assert subsystem == "mixer"
+        assert status['volume'] == '60'
+        assert received.empty()
+
+        assert client.volume == 60
+        assert client.station == 2
+        assert client.status()['state'] == 'play'
+
+        client.disconnect()
+        assert aborted.is_set()
+
+    def test_events(self, mpdclient):
+        client_mock = mpdclient.return_value
+        client_mock.status.return_value = {'volume': '0', 'state': 'stop'}
+
+        aborted = threading.Event()
+        client_mock.abort.side_effect = aborted.set
+        changes = [["player"]]
+
+        def idle(*subsystems):
+            if changes:
+                return changes.pop()
+            aborted.wait()
+            raise ConnectionError("aborted")
+
+        client_mock.idle.side_effect = idle
+
+        client = single.Client(self.basepath, muted=True)
+
+        async def receive():
+            events = client.events()
+            return await asyncio.wait_for(events.get(), timeout=1)
+
+        subsystem, status = asyncio.run(receive())
+        assert subsystem == "player"
+        assert client.muted is True
+
+        # outside of a running loop, it has to be given
+        with pytest.raises(RuntimeError):
+            client.events()
+
+        client.disconnect()
+
+    def test_coalesce(self, mpdclient):
+        client_mock = mpdclient.return_value
+        client_mock.status.return_value = {'volume': '10'}
+
+        client = single.Client(self.basepath, coalesce=10)
+
+        # the first change is written right away, the rest is coalesced
+        client.volume = 20
+        client.volume_writer.flush(timeout=1)
+        for volume in range(21, 31):
+            client.volume = volume
+        client.mute()
+        assert client.volume == 30
+
+        # the latest value is sent on disconnect
+        client.disconnect()
+        assert client_mock.setvol.call_args_list == [
+            mock.call(20),
+            mock.call(0),
+            ]
+        assert client.volume_writer.dropped == 10
+
     def test_urls(self, mpdclient):
         client_mock = mpdclient.return_value
         client = single.Client(self.basepath)
@@ -275,6 +622,76 @@ class TestClient(object):
         expected_calls = list(map(mock.call, urls1 + urls2))
         assert client_mock.add.call_args_list == expected_calls
 
+    def test_load(self, mpdclient):
+        client_mock = mpdclient.return_value
+        client = single.Client(self.basepath)
+
+        urls = list(map(str, range(25)))
+        client.load(urls, chunksize=10)
+
+        assert client.urls == urls
+        assert client_mock.command_list_ok_begin.call_count == 3
+        assert client_mock.command_list_end.call_count == 3
+        assert client_mock.clear.call_count == 1
+        assert client_mock.add.call_args_list == list(map(mock.call, urls))
+
+        # loading an empty list still clears
+        client_mock.reset_mock()
+        client.load([])
+        assert client.urls == []
+        assert client_mock.clear.call_count == 1
+        assert client_mock.command_list_end.call_count == 1
+
+    def test_load_station(self, mpdclient):
+        client_mock = mpdclient.return_value
+        client = single.Client(self.basepath)
+
+        urls = list(map(str, range(5)))
+        client.load(urls, station=3)
+
+        # the station plays before the others get added
+        calls = [name for name, _, _ in client_mock.mock_calls]
+        assert calls.index("play") < calls.index("command_list_end")
+        assert client_mock.add.call_args_list[0] == mock.call("3")
+        assert client_mock.move.call_args_list == [mock.call("2:5", 0)]
+        assert client.urls == urls
+        assert client.station == 3
+
+        with pytest.raises(RuntimeError):
+            client.load(urls, station=5)
+
+    def test_standby(self, mpdclient):
+        client_mock = mpdclient.return_value
+        client = single.Client(self.basepath)
+        # mpd starts with the null output disabled
+        assert client.standby is False
+        client.standby = False
+        assert client_mock.command_list_end.call_count == 0
+
+        client.standby = True
+        assert client.standby is True
+        assert client_mock.enableoutput.call_args_list == [
+            mock.call(single.standby_output),
+            ]
+        assert client_mock.disableoutput.call_args_list == [
+            mock.call(single.audible_output),
+            ]
+        assert client_mock.command_list_end.call_count == 1
+
+        # nothing changes
+        client.standby = True
+        assert client_mock.command_list_end.call_count == 1
+
+        client_mock.reset_mock()
+        client.standby = False
+        assert client.standby is False
+        assert client_mock.enableoutput.call_args_list == [
+            mock.call(single.audible_output),
+            ]
+        assert client_mock.disableoutput.call_args_list == [
+            mock.call(single.standby_output),
+            ]
+
     def test_add(self, mpdclient):
         client_mock = mpdclient.return_value
 
@@ -481,3 +898,185 @@ def test_map(single_server, single_client):
         mock.call(single_server.return_value)
         ]
     assert url_prop.call_args_list == [mock.call(urls)]
+
+
+@pytest.fixture(scope='function')
+def mpd_socket(tmpdir):
+    """ a fake mpd which only answers once it got `batch` commands """
+    path = pathlib.Path(str(tmpdir)) / "socket"
+    received = []
+
+    async def handle(reader, writer):
+        writer.write(b"OK MPD 0.19.0\n")
+        while True:
+            batch = []
+            while len(batch) < handle.batch:
+                line = await reader.readline()
+                if not line:
+                    return
+                batch.append(line.decode().strip())
+
+            received.extend(batch)
+            for command in batch:
+                if command == handle.drop:
+                    # the server goes away without answering
+                    writer.close()
+                    return
+                if command == "status":
+                    writer.write(b"volume: 40\nsong: 3\nstate: play\n")
+                if command.startswith("play") and '"99"' in command:
+                    writer.write(b"ACK [2@0] {play} Bad song index\n")
+                else:
+                    writer.write(b"OK\n")
+            await writer.drain()
+
+    handle.batch = 1
+    handle.drop = None
+
+    def run(coroutine):
+        async def main():
+            server = await asyncio.start_unix_server(handle, path=str(path))
+            try:
+                return await asyncio.wait_for(coroutine(path), timeout=2)
+            finally:
+                server.close()
+
+        return asyncio.run(main())
+
+    run.handle = handle
+    run.received = received
+    return run
+
+
+class TestAsyncClient(object):
+    def test_connect(self, mpd_socket):
+        async def scenario(path):
+            async with single.AsyncClient(path) as client:
+                return client.volume
+
+        assert mpd_socket(scenario) == 40
+        assert mpd_socket.received == ["status"]
+
+    def test_pipelining(self, mpd_socket):
+        urls = ["a", "b", "c", "d"]
+
+        async def scenario(path):
+            async with single.AsyncClient(path) as client:
+                await client.set_urls(urls)
+
+                # the server does not answer before all three commands
+                # arrived, so this would hang if they were sent one by one
+                mpd_socket.handle.batch = 3
+                await asyncio.gather(
+                    client.set_volume(20),
+                    client.mute(),
+                    client.play(2),
+                    )
+
+                return client
+
+        client = mpd_socket(scenario)
+
+        assert client.volume == 20
+        assert client.muted is True
+        assert client.station == 2
+        assert client.urls == urls
+        assert mpd_socket.received == [
+            "status",
+            "clear",
+            'add "a"',
+            'add "b"',
+            'add "c"',
+            'add "d"',
+            'setvol "20"',
+            'setvol "0"',
+            'play "2"',
+            ]
+
+    def test_play(self, mpd_socket):
+        async def scenario(path):
+            async with single.AsyncClient(path) as client:
+                await client.set_urls(map(str, range(5)))
+
+                # without index
+                await client.play()
+                assert client.station == 3
+
+                # invalid index
+                with pytest.raises(RuntimeError):
+                    await client.play(10)
+
+                # rejected by the server
+                client._urls = list(range(100))
+                with pytest.raises(RuntimeError) as e:
+                    await client.play(99)
+                assert "Bad song index" in str(e.value)
+
+        mpd_socket(scenario)
+
+    def test_mute(self, mpd_socket):
+        async def scenario(path):
+            async with single.AsyncClient(path, muted=True) as client:
+                # changing the volume while muted is only cached
+                await client.set_volume(55)
+                await client.toggle_mute()
+                await client.unmute()
+                return client.muted
+
+        assert mpd_socket(scenario) is False
+        assert mpd_socket.received == ["status", 'setvol "55"']
+
+    def test_setters(self, mpd_socket):
+        async def scenario(path):
+            async with single.AsyncClient(path) as client:
+                await client.set_urls(["a", "b"])
+
+                client.volume = 30
+                client.station = 1
+                await client.wait()
+                assert client.error is None
+
+                # errors of the tasks are not lost
+                client.station = 5
+                with pytest.raises(RuntimeError):
+                    await client.wait()
+
+                client.station = 5
+                await asyncio.sleep(0.01)
+                assert isinstance(client.error, RuntimeError)
+
+        mpd_socket(scenario)
+        assert mpd_socket.received[-2:] == ['setvol "30"', 'play "1"']
+
+    def test_connection_lost(self, mpd_socket):
+        async def scenario(path):
+            client = await single.AsyncClient(path).connect()
+            await client.disconnect()
+            with pytest.raises(ConnectionError):
+                await client.clear()
+
+        mpd_socket(scenario)
+
+    def test_connection_lost_in_flight(self, mpd_socket):
+        async def scenario(path):
+            client = await single.AsyncClient(path).connect()
+
+            mpd_socket.handle.drop = "clear"
+            with pytest.raises(ConnectionError):
+                await client.clear()
+
+            # later commands fail right away instead of hanging
+            with pytest.raises(ConnectionError):
+                await client.set_volume(10)
+            await client.disconnect()
+
+        mpd_socket(scenario)
+
+    def test_partition(self, mpd_socket):
+        async def scenario(path):
+            server = mock.Mock(socket=path, partition="webradio1")
+            async with single.AsyncClient(server):
+                pass
+
+        mpd_socket(scenario)
+        assert mpd_socket.received == ['partition "webradio1"', "status"]
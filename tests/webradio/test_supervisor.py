@@ -0,0 +1,79 @@
+import os
+import pathlib
+import signal
+
+import pytest
+
+import webradio.fake as fake
+import webradio.pool as pool
+import webradio.supervisor as supervisor
+
+
+@pytest.fixture(scope='function')
+def client(tmpdir):
+    server = pool.Server(
+        basepath=pathlib.Path(str(tmpdir)) / "pool",
+        num=3,
+        fast_boot=True,
+        timeout=5,
+        command=fake.command(),
+        )
+    client = pool.Client(server)
+    client.urls = ["url0", "url1", "url2"]
+
+    yield client
+
+    client.disconnect()
+
+
+def crash(worker):
+    pid = int((worker.basepath / "mpd" / "pid").read_text())
+    os.kill(pid, signal.SIGKILL)
+
+
+def test_restart(client):
+    client.volume = 40
+    client.play(1)
+
+    crash(client.server.worker(1))
+
+    with supervisor.Supervisor(client, start=False) as s:
+        assert s.check() == [1]
+
+        # the new worker took over
+        assert client.station == 1
+        assert client.muted is False
+        assert client.clients[1].urls == ["url1"]
+        assert client.clients[1].volume == 40
+        client.clients[1].ping()
+
+        assert s.restarts == {1: 1}
+        assert s.stats["restarts"] == 1
+        assert s.stats["max_recovery"] >= 0
+
+        # everything is fine now
+        assert s.check() == []
+
+
+def test_urls_with_crashed_worker(client):
+    crash(client.server.worker(2))
+
+    client.urls = ["x0", "x1", "x2"]
+    assert client.urls == ("x0", "x1", "x2")
+
+
+def test_recycle(client):
+    client.play(0)
+
+    with supervisor.Supervisor(client, recycle_after=60, start=False) as s:
+        assert s.check() == []
+
+        # staggered and never the audible worker
+        later = s._started[1] + 61
+        assert s.check(now=later) in ([1], [2])
+        assert s.check(now=later) in ([1], [2])
+        assert s.check(now=later) == []
+
+        assert s.recycled == {1: 1, 2: 1}
+        assert s.restarts == {}
+        assert client.station == 0
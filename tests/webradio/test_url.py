@@ -1,4 +1,7 @@
+import sys
+
 import pytest
+import requests as _requests
 from unittest import mock
 
 import webradio.url as url
@@ -6,13 +9,14 @@ import webradio.url as url
 
 @pytest.fixture(scope='function')
 def requests():
-    m = mock.patch(
-        'webradio.url.requests',
-        mock.create_autospec(url.requests)
+    # imported lazily by webradio.url
+    m = mock.patch.dict(
+        sys.modules,
+        {'requests': mock.create_autospec(_requests)},
         )
 
-    with m as requests:
-        yield requests
+    with m:
+        yield sys.modules['requests']
 
 
 @pytest.fixture(scope='function')
@@ -0,0 +1,55 @@
+import pathlib
+
+import webradio.usage as usage
+
+
+def test_score():
+    counters = usage.Usage(half_life=10)
+
+    assert counters.score("a") == 0
+    counters.record("a", now=100)
+    counters.record("a", now=100)
+    assert counters.score("a", now=100) == 2
+
+    # the score halves every half life
+    assert counters.score("a", now=110) == 1
+    counters.record("a", now=120)
+    assert counters.score("a", now=120) == 1.5
+
+
+def test_ranked():
+    counters = usage.Usage(half_life=10)
+    urls = ["a", "b", "c", "d"]
+
+    # without any plays the order is kept
+    assert counters.ranked(urls, now=0) == [0, 1, 2, 3]
+
+    counters.record("c", now=0)
+    counters.record("c", now=0)
+    counters.record("b", now=0)
+    counters.record("d", now=5)
+    assert counters.ranked(urls, now=5) == [2, 3, 1, 0]
+
+
+def test_persistence(tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "usage.json"
+
+    counters = usage.Usage(path)
+    counters.record("a", now=50)
+    counters.save()
+    assert path.exists()
+
+    restored = usage.Usage(path)
+    assert restored.score("a", now=50) == 1
+
+    # a corrupt file is ignored
+    path.write_text("{")
+    assert usage.Usage(path).score("a", now=50) == 0
+
+    # and so is valid json of another shape
+    for data in ('[1, 2]', '{"a": 1}', '{"a": [1]}', '{"a": ["x", 2]}'):
+        path.write_text(data)
+        assert usage.Usage(path).score("a", now=50) == 0
+
+    # in memory only
+    usage.Usage().save()
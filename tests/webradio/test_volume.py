@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+import webradio.volume as volume
+
+
+class TestCoalescingWriter(object):
+    def test_coalescing(self):
+        written = []
+        release = threading.Event()
+
+        def write(value):
+            # block the first write, so that the others pile up
+            release.wait()
+            written.append(value)
+
+        writer = volume.CoalescingWriter(write, interval=0)
+        assert writer.pending() is None
+        writer.submit(1)
+        # wait until the first value is being written
+        while writer._pending is not volume._nothing:
+            pass
+        assert writer.pending() == 1
+
+        for value in range(2, 10):
+            writer.submit(value)
+        assert writer.pending() == 9
+        release.set()
+
+        assert writer.flush(timeout=1)
+        assert writer.pending(default=0) == 0
+        assert written == [1, 9]
+        assert writer.written == 2
+        assert writer.dropped == 7
+
+        writer.close()
+
+    def test_interval(self):
+        written = []
+        writer = volume.CoalescingWriter(written.append, interval=0.2)
+
+        writer.submit(1)
+        writer.flush(timeout=1)
+        # the second write has to wait for the interval
+        writer.submit(2)
+        writer.submit(3)
+        assert written == [1]
+        writer._thread.join(timeout=0.1)
+        assert written == [1]
+        writer._thread.join(timeout=0.2)
+        assert written == [1, 3]
+
+        # flushing does not wait for the interval
+        writer.submit(4)
+        assert writer.flush(timeout=0.05) is True
+        assert written == [1, 3, 4]
+
+        writer.close()
+
+    def test_close(self):
+        written = []
+        writer = volume.CoalescingWriter(written.append, interval=10)
+
+        writer.submit(1)
+        writer.flush(timeout=1)
+        writer.submit(2)
+
+        # the pending value is still written
+        writer.close()
+        assert written == [1, 2]
+
+        with pytest.raises(RuntimeError):
+            writer.submit(3)
+
+    def test_error(self):
+        def write(value):
+            raise ConnectionError("lost")
+
+        writer = volume.CoalescingWriter(write)
+        writer.submit(1)
+        writer.flush(timeout=1)
+
+        assert isinstance(writer.error, ConnectionError)
+        writer.close()
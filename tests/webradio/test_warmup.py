@@ -0,0 +1,103 @@
+import threading
+from unittest import mock
+
+import pytest
+
+import webradio.warmup as warmup
+
+
+class GatedPool(object):
+    """ a pool whose workers only become ready when told so """
+    def __init__(self, servers):
+        self.servers = servers
+        self.gate = threading.Event()
+
+    def ready(self, timeout=None):
+        self.gate.wait()
+        for index, path in enumerate(self.servers.sockets):
+            yield index, path
+
+    def shutdown(self):
+        self.servers.shutdown()
+
+
+@pytest.fixture(scope='function')
+def servers(fake_servers):
+    server = mock.Mock(spec=["pool", "single", "shutdown"])
+    server.pool = GatedPool(fake_servers(3, "pool"))
+    server.single = mock.Mock(spec=["socket", "shutdown"])
+    server.single.socket = next(fake_servers(1, "single").sockets)
+
+    return server
+
+
+urls = ["url0", "url1", "url2"]
+
+
+class TestServer(object):
+    def test_init(self, single_server, mkdir, exists, rmdir):
+        basepath = "/warmup"
+
+        with mock.patch('webradio.warmup.pool.Server') as pool_server:
+            exists.return_value = True
+            with pytest.raises(FileExistsError):
+                warmup.Server(basepath=basepath, num=3)
+
+            exists.return_value = False
+            server = warmup.Server(basepath=basepath, num=3)
+
+            assert single_server.call_count == 1
+            assert pool_server.call_args_list[0][1]['num'] == 3
+
+            server.shutdown()
+            assert single_server.return_value.shutdown.call_count == 1
+            assert pool_server.return_value.shutdown.call_count == 1
+
+
+class TestClient(object):
+    def test_warm_up(self, servers):
+        single_fake = servers.single
+        pool_servers = servers.pool.servers.servers
+
+        client = warmup.Client(servers)
+        client.urls = urls
+        client.volume = 30
+
+        # nothing is ready: the single server plays right away
+        client.play(1)
+        assert client.station == 1
+        assert client.status(max_age=0)["state"] == "play"
+        assert client.single.station == 1
+        assert client.muted is False
+        assert all(server.playlist == [] for server in pool_servers)
+
+        servers.pool.gate.set()
+        assert client.ready.wait(timeout=5)
+        assert client.error is None
+
+        # the workers prebuffer muted
+        for url, server in zip(urls, pool_servers):
+            assert server.playlist == [url]
+            assert server.state == "play"
+            assert server.volume == 0
+
+        # the single server is still audible
+        assert single_fake.shutdown.call_count == 0
+
+        # the next play moves to the pool and retires the single server
+        client.play(2)
+        assert pool_servers[2].volume == 30
+        assert client.single is None
+        assert single_fake.shutdown.call_count == 1
+
+        client.play(0)
+        assert pool_servers[0].volume == 30
+        assert pool_servers[2].volume == 0
+
+        with pytest.raises(RuntimeError):
+            client.play(3)
+        with pytest.raises(RuntimeError):
+            client.urls = urls
+
+        client.disconnect()
+        assert servers.shutdown.call_count == 1
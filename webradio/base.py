@@ -1,5 +1,6 @@
 import abc
 from contextlib import contextmanager
+import os
 
 
 @contextmanager
@@ -10,6 +11,25 @@ def ignore(exception):
         pass
 
 
+def alive(pid):
+    """ whether a process is running, zombies don't count """
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            # the state follows the command name in parentheses
+            return f.read().rpartition(")")[2].split()[0] != "Z"
+    except OSError:
+        pass
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # it exists, but belongs to someone else
+        pass
+    return True
+
+
 class base_client(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def __init__(self, server, *, muted=False):
@@ -0,0 +1,708 @@
+""" an in-process stand-in for mpd
+
+The fake implements the part of the mpd protocol the clients use (ping,
+status, setvol, outputs, add, clear, move, playlistinfo, play, stop, command
+lists and idle) on a unix socket, with configurable per-command latency and
+failure injection. It counts the commands it got and the round-trips it
+needed to get them, so the cost of a client operation can be measured
+without a real mpd.
+
+It can also replace mpd for `single.Server`::
+
+    single.Server(basepath=path, command=fake.command())
+
+In that case it reads the socket and pid file from the mpd.conf in
+$XDG_CONFIG_HOME/mpd, daemonizes like mpd and stops on `--kill`.
+
+This module only depends on the standard library and `webradio.base`, so
+that it can be run as a script without the package being importable.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import pathlib
+import re
+import shlex
+import signal
+import sys
+import threading
+import time
+
+if __package__:
+    from .base import alive
+else:
+    # run as a script, see `command`: its directory is on sys.path
+    from base import alive
+
+
+version = "0.21.0"
+
+
+class Ack(Exception):
+    """ an error response for the current command """
+    codes = {
+        "arg": 2,
+        "unknown": 5,
+        "no_exist": 50,
+        }
+
+    def __init__(self, kind, command, message):
+        super().__init__(message)
+        self.code = self.codes[kind]
+        self.command = command
+
+    def format(self, index=0):
+        return "ACK [{}@{}] {{{}}} {}\n".format(
+            self.code,
+            index,
+            self.command,
+            self,
+            )
+
+
+class Disconnect(Exception):
+    """ drop the connection (an injected failure) """
+
+
+class Partition(object):
+    """ the playlist and player state of a mpd partition """
+    def __init__(self, name, volume):
+        self.name = name
+        self.volume = volume
+        self.playlist = []
+        self.song = None
+        self.state = "stop"
+
+
+def default_partition(name):
+    """ a property for the state of the default partition """
+    def get(self):
+        return getattr(self.partitions["default"], name)
+
+    def set(self, value):
+        setattr(self.partitions["default"], name, value)
+
+    return property(get, set)
+
+
+class Session(object):
+    """ the state of a single client connection """
+    def __init__(self, writer, partition):
+        self.writer = writer
+        self.partition = partition
+        self.command_list = None
+        self.list_ok = False
+        # subsystems changed since the last idle response
+        self.pending = set()
+        # the subsystems a pending idle waits for, None if not idling
+        self.idle = None
+
+
+class Server(object):
+    """ a fake mpd server
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        the unix socket to listen on
+
+    Other Parameters
+    ----------------
+    latency : float or dict, optional
+        the time to wait before answering a command in seconds, either for
+        all commands or as a mapping of command name to latency. The key
+        "*" sets the default.
+    volume : int, default 50
+        the initial volume
+    outputs : sequence of str or (str, bool)
+        the names of the audio outputs, optionally with whether they start
+        enabled. The default is like the single.Server configuration: alsa
+        and a disabled null output.
+    """
+    def __init__(
+            self,
+            path,
+            *,
+            latency=None,
+            volume=50,
+            outputs=(("alsa", True), ("standby", False)),
+            ):
+        self.path = pathlib.Path(path)
+
+        if not isinstance(latency, dict):
+            latency = {"*": latency or 0}
+        self.latency = latency
+
+        self.partitions = {"default": Partition("default", volume)}
+        self.outputs = [
+            [output, True] if isinstance(output, str) else list(output)
+            for output in outputs
+            ]
+        # the partition each output belongs to
+        self.output_partitions = ["default"] * len(self.outputs)
+
+        # statistics
+        self.commands = collections.Counter()
+        self.round_trips = 0
+
+        self._failures = collections.defaultdict(collections.deque)
+        self._sessions = set()
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    volume = default_partition("volume")
+    playlist = default_partition("playlist")
+    song = default_partition("song")
+    state = default_partition("state")
+
+    def inject(self, command, failure="error", times=1):
+        """ make the next calls of a command fail
+
+        Parameters
+        ----------
+        command : str
+            the name of the command
+        failure : {"error", "disconnect"}
+            answer with an ACK or drop the connection without answering
+        times : int, default 1
+            the number of calls to fail
+        """
+        if failure not in ("error", "disconnect"):
+            raise ValueError("unknown failure: {}".format(failure))
+
+        self._failures[command].extend([failure] * times)
+
+    def reset_statistics(self):
+        self.commands.clear()
+        self.round_trips = 0
+
+    async def start(self):
+        self._server = await asyncio.start_unix_server(
+            self._handle,
+            path=str(self.path),
+            )
+        return self
+
+    async def stop(self):
+        if self._server is None:
+            return
+
+        self._server.close()
+        for session in list(self._sessions):
+            session.writer.close()
+        await self._server.wait_closed()
+        self._server = None
+
+        if self.path.exists():
+            self.path.unlink()
+
+    def start_thread(self):
+        """ run the server in an event loop in a background thread """
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+
+        return self
+
+    def stop_thread(self):
+        if self._thread is None:
+            return
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start_thread()
+
+    def __exit__(self, *args):
+        self.stop_thread()
+
+    async def _handle(self, reader, writer):
+        session = Session(writer, self.partitions["default"])
+        self._sessions.add(session)
+
+        writer.write("OK MPD {}\n".format(version).encode())
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+
+                self.round_trips += 1
+                *lines, buffer = (buffer + data).split(b"\n")
+                for line in lines:
+                    await self._process(session, line.decode())
+                await writer.drain()
+        except (Disconnect, ConnectionError):
+            pass
+        finally:
+            self._sessions.discard(session)
+            writer.close()
+
+    async def _process(self, session, line):
+        try:
+            command, *args = shlex.split(line)
+        except ValueError:
+            session.writer.write(
+                Ack("arg", "", "Invalid quoting").format().encode(),
+                )
+            return
+
+        if session.command_list is not None and command != "command_list_end":
+            session.command_list.append((command, args))
+            return
+
+        if command in ("command_list_begin", "command_list_ok_begin"):
+            session.command_list = []
+            session.list_ok = command == "command_list_ok_begin"
+            return
+
+        if command == "command_list_end":
+            await self._process_list(session)
+            return
+
+        if command == "close":
+            raise Disconnect()
+
+        if command == "noidle":
+            if session.idle is not None:
+                self._respond_idle(session)
+            return
+
+        try:
+            response = await self._execute(session, command, args)
+        except Ack as e:
+            session.writer.write(e.format().encode())
+            return
+
+        if response is not None:
+            session.writer.write((response + "OK\n").encode())
+
+    async def _process_list(self, session):
+        commands, session.command_list = session.command_list, None
+
+        self.commands["command_list"] += 1
+        output = []
+        for index, (command, args) in enumerate(commands):
+            try:
+                response = await self._execute(session, command, args)
+            except Ack as e:
+                output.append(e.format(index))
+                break
+
+            output.append(response or "")
+            if session.list_ok:
+                output.append("list_OK\n")
+        else:
+            output.append("OK\n")
+
+        session.writer.write("".join(output).encode())
+
+    async def _execute(self, session, command, args):
+        """ execute a command and return the response lines """
+        self.commands[command] += 1
+
+        latency = self.latency.get(command, self.latency.get("*", 0))
+        if latency:
+            await asyncio.sleep(latency)
+
+        failures = self._failures.get(command)
+        if failures:
+            if failures.popleft() == "disconnect":
+                raise Disconnect()
+            raise Ack("unknown", command, "injected failure")
+
+        handler = getattr(self, "_command_" + command, None)
+        if handler is None:
+            raise Ack("unknown", command, "unknown command")
+
+        return handler(session, *args)
+
+    def _changed(self, *subsystems, partition=None):
+        """ notify the idling sessions, only in `partition` if given """
+        for session in self._sessions:
+            if partition is not None and session.partition is not partition:
+                continue
+
+            session.pending.update(subsystems)
+            if session.idle is None:
+                continue
+
+            if not session.idle or session.pending & session.idle:
+                self._respond_idle(session)
+
+    def _respond_idle(self, session):
+        wanted = session.idle or session.pending
+        changed = sorted(session.pending & wanted)
+
+        session.pending -= wanted
+        session.idle = None
+
+        session.writer.write("".join(
+            "changed: {}\n".format(subsystem)
+            for subsystem in changed
+            ).encode() + b"OK\n")
+
+    def _command_idle(self, session, *subsystems):
+        session.idle = set(subsystems)
+        if session.pending and (
+                not session.idle or session.pending & session.idle):
+            self._respond_idle(session)
+        # the response is written once something changed
+        return None
+
+    def _command_ping(self, session):
+        return ""
+
+    def _command_status(self, session):
+        partition = session.partition
+        lines = [
+            ("partition", partition.name),
+            ("volume", partition.volume),
+            ("repeat", 0),
+            ("random", 0),
+            ("playlistlength", len(partition.playlist)),
+            ("state", partition.state),
+            ]
+        if partition.song is not None:
+            lines.append(("song", partition.song))
+        if partition.state == "play":
+            lines.append(("bitrate", 128))
+
+        return "".join("{}: {}\n".format(*line) for line in lines)
+
+    def _command_setvol(self, session, volume):
+        try:
+            volume = int(volume)
+        except ValueError:
+            raise Ack("arg", "setvol", "Integer expected")
+        if not 0 <= volume <= 100:
+            raise Ack("arg", "setvol", "Invalid volume value")
+
+        session.partition.volume = volume
+        self._changed("mixer", partition=session.partition)
+        return ""
+
+    def _command_outputs(self, session):
+        return "".join(
+            "outputid: {}\noutputname: {}\noutputenabled: {}\n".format(
+                index,
+                name,
+                int(enabled),
+                )
+            for index, (name, enabled) in enumerate(self.outputs)
+            )
+
+    def _command_partition(self, session, name):
+        if name not in self.partitions:
+            raise Ack("no_exist", "partition", "partition does not exist")
+
+        session.partition = self.partitions[name]
+        return ""
+
+    def _command_newpartition(self, session, name):
+        if name in self.partitions:
+            raise Ack("arg", "newpartition", "name already exists")
+
+        self.partitions[name] = Partition(name, self.volume)
+        self._changed("partition")
+        return ""
+
+    def _command_moveoutput(self, session, name):
+        for index, (output, _) in enumerate(self.outputs):
+            if output == name:
+                self.output_partitions[index] = session.partition.name
+                self._changed("output")
+                return ""
+
+        raise Ack("no_exist", "moveoutput", "No such audio output")
+
+    def _set_output(self, command, output, enabled):
+        try:
+            output = int(output)
+        except ValueError:
+            raise Ack("arg", command, "Integer expected")
+        if not 0 <= output < len(self.outputs):
+            raise Ack("no_exist", command, "No such audio output")
+
+        self.outputs[output][1] = enabled
+        self._changed("output")
+        return ""
+
+    def _command_enableoutput(self, session, output):
+        return self._set_output("enableoutput", output, True)
+
+    def _command_disableoutput(self, session, output):
+        return self._set_output("disableoutput", output, False)
+
+    def _command_add(self, session, url):
+        session.partition.playlist.append(url)
+        self._changed("playlist", partition=session.partition)
+        return ""
+
+    def _command_playlistinfo(self, session):
+        return "".join(
+            "file: {}\nPos: {}\nId: {}\n".format(url, index, index + 1)
+            for index, url in enumerate(session.partition.playlist)
+            )
+
+    def _command_clear(self, session):
+        partition = session.partition
+        partition.playlist = []
+        partition.song = None
+        partition.state = "stop"
+        self._changed("playlist", "player", partition=partition)
+        return ""
+
+    def _command_move(self, session, position, to):
+        partition = session.partition
+        playlist = partition.playlist
+        try:
+            if ":" in position:
+                start, end = (int(value) for value in position.split(":"))
+            else:
+                start = int(position)
+                end = start + 1
+            to = int(to)
+        except ValueError:
+            raise Ack("arg", "move", "Integer expected")
+        if not 0 <= start < end <= len(playlist):
+            raise Ack("arg", "move", "Bad song index")
+        if not 0 <= to <= len(playlist) - (end - start):
+            raise Ack("arg", "move", "Bad song index")
+
+        # the played song keeps playing, wherever it ends up
+        order = list(range(len(playlist)))
+        block = order[start:end]
+        del order[start:end]
+        order[to:to] = block
+
+        partition.playlist = [playlist[index] for index in order]
+        if partition.song is not None:
+            partition.song = order.index(partition.song)
+        self._changed("playlist", partition=partition)
+        return ""
+
+    def _command_play(self, session, index=None):
+        partition = session.partition
+        if index is None:
+            index = partition.song if partition.song is not None else 0
+        else:
+            index = int(index)
+
+        if not 0 <= index < len(partition.playlist):
+            if not partition.playlist and index == 0:
+                # mpd silently ignores play on an empty playlist
+                return ""
+            raise Ack("arg", "play", "Bad song index")
+
+        partition.song = index
+        partition.state = "play"
+        self._changed("player", partition=partition)
+        return ""
+
+    def _command_stop(self, session):
+        session.partition.state = "stop"
+        self._changed("player", partition=session.partition)
+        return ""
+
+
+class Pool(object):
+    """ fake mpd servers sharing one event loop in a background thread
+
+    Provides the `sockets` and `shutdown` of a pool.Server, so it can be
+    passed to pool.Client.
+
+    Parameters
+    ----------
+    root : pathlib.Path
+        the directory to put the sockets into, created if necessary
+    num : int
+        the number of servers
+    latency : float or dict, optional
+        the latency of every server, see `Server`
+    """
+    def __init__(self, root, num, latency=None):
+        root.mkdir(exist_ok=True)
+        self.servers = [
+            Server(root / "socket{}".format(index), latency=latency)
+            for index in range(num)
+            ]
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            daemon=True,
+            )
+        self._thread.start()
+
+        for server in self.servers:
+            self._call(server.start())
+
+    def _call(self, coroutine):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        return future.result()
+
+    @property
+    def sockets(self):
+        for server in self.servers:
+            yield server.path
+
+    @property
+    def round_trips(self):
+        return sum(server.round_trips for server in self.servers)
+
+    def shutdown(self):
+        if not self._thread.is_alive():
+            return
+
+        for server in self.servers:
+            self._call(server.stop())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def read_config(path):
+    """ read the options the fake cares about from a mpd.conf """
+    pattern = re.compile(r'^\s*(\w+)\s+"([^"]*)"', re.MULTILINE)
+    with open(str(path)) as f:
+        return dict(pattern.findall(f.read()))
+
+
+def read_outputs(path):
+    """ the names of the audio outputs in a mpd.conf and whether they are
+    enabled
+    """
+    block = re.compile(r'audio_output\s*{([^}]*)}')
+    name = re.compile(r'\bname\s+"([^"]*)"')
+    enabled = re.compile(r'\benabled\s+"([^"]*)"')
+    with open(str(path)) as f:
+        blocks = block.findall(f.read())
+
+    outputs = []
+    for body in blocks:
+        state = enabled.search(body)
+        outputs.append((
+            name.search(body).group(1),
+            state is None or state.group(1) != "no",
+            ))
+
+    return outputs
+
+
+def command(*, latency=None, boot_delay=None):
+    """ the command to start the fake in place of /usr/bin/mpd
+
+    `boot_delay` seconds pass before it daemonizes, like a slowly starting
+    mpd.
+    """
+    args = [sys.executable, os.path.abspath(__file__)]
+    if latency is not None:
+        args.extend(["--latency", str(latency)])
+    if boot_delay is not None:
+        args.extend(["--boot-delay", str(boot_delay)])
+    return args
+
+
+def kill(pid_file):
+    with pid_file.open() as f:
+        pid = int(f.read().strip())
+
+    if not alive(pid):
+        # it crashed, nobody is going to clean up
+        return 1
+
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return 1
+
+    # wait for the server to clean up, like mpd --kill
+    deadline = time.monotonic() + 5
+    while pid_file.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    return 0
+
+
+def serve(socket_path, pid_file, latency, outputs):
+    server = Server(socket_path, latency=latency, outputs=outputs)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start())
+    pid_file.write_text(str(os.getpid()))
+
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(server.stop())
+        loop.close()
+        if pid_file.exists():
+            pid_file.unlink()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--boot-delay", type=float, default=0)
+    parser.add_argument("--kill", action="store_true")
+    parser.add_argument("--no-daemon", action="store_true")
+    args = parser.parse_args(argv)
+
+    config_home = pathlib.Path(os.environ.get(
+        "XDG_CONFIG_HOME",
+        os.path.expanduser("~/.config"),
+        ))
+    config = read_config(config_home / "mpd" / "mpd.conf")
+    outputs = read_outputs(config_home / "mpd" / "mpd.conf")
+    socket_path = pathlib.Path(config["bind_to_address"])
+    pid_file = pathlib.Path(config["pid_file"])
+
+    if args.kill:
+        return kill(pid_file)
+
+    time.sleep(args.boot_delay)
+
+    if args.no_daemon:
+        serve(socket_path, pid_file, args.latency, outputs)
+        return 0
+
+    # daemonize like mpd: return once the server accepts connections
+    if os.fork() == 0:
+        os.setsid()
+        # don't keep the pipes of the caller open
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.close(devnull)
+        try:
+            serve(socket_path, pid_file, args.latency, outputs)
+        finally:
+            os._exit(0)
+
+    deadline = time.monotonic() + 5
+    while not pid_file.exists():
+        if time.monotonic() > deadline:
+            return 1
+        time.sleep(0.005)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
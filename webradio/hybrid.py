@@ -0,0 +1,177 @@
+import pathlib
+
+from . import base
+from . import pool
+from . import single
+from .base import ignore
+
+
+class Server(object):
+    """ a pool for the favourite stations and a single server for the rest
+
+    Parameters
+    ----------
+    basepath : str or pathlib.Path
+        the (not yet existing) directory to put the servers into
+    num : int
+        the number of favourite stations to prebuffer
+    """
+    def __init__(self, *, basepath, num):
+        self.basepath = pathlib.Path(basepath)
+        if self.basepath.exists():
+            raise FileExistsError(
+                "{} does already exist... not overwriting".format(
+                    self.basepath,
+                    ))
+
+        self.basepath.mkdir(mode=0o700)
+
+        # the pool boots in the background while the single server starts
+        self.pool = pool.Server(basepath=self.basepath / "pool", num=num)
+        self.single = single.Server(basepath=self.basepath / "single")
+
+    def shutdown(self):
+        self.single.shutdown()
+        self.pool.shutdown()
+
+        with ignore(OSError):
+            self.basepath.rmdir()
+
+
+class Client(base.base_client):
+    """ instant switching for the favourites, on demand for the rest
+
+    The favourite stations are played by the prebuffered pool, all others
+    by the single server. Only the backend which plays the current station
+    is unmuted.
+
+    Parameters
+    ----------
+    server : hybrid.Server
+        the servers to connect to
+    favourites : sequence of int
+        the indices of the prebuffered stations
+    """
+    def __init__(self, server, *, favourites, muted=False):
+        self.server = server
+        self.favourites = tuple(favourites)
+
+        self.pool = pool.Client(server.pool)
+        self.single = single.Client(server.single, muted=True)
+
+        self._urls = ()
+        self._current = None
+        self._station = None
+        self._volume = self.pool.volume
+
+    def disconnect(self):
+        self.single.disconnect()
+        self.pool.disconnect()
+
+        self.server.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, cls, exception, traceback):
+        self.disconnect()
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, new_volume):
+        self._volume = int(new_volume)
+        if self._current is not None:
+            self._current.volume = self._volume
+
+    @property
+    def urls(self):
+        return self._urls
+
+    @urls.setter
+    def urls(self, urls):
+        self._urls = tuple(urls)
+
+        self.pool.urls = [self._urls[index] for index in self.favourites]
+        # the single server can play every station, so that the indices
+        # don't need to be translated
+        self.single.urls = self._urls
+
+    def backend(self, index):
+        """ the client responsible for a station """
+        if index in self.favourites:
+            return self.pool
+        return self.single
+
+    def play(self, index):
+        if index >= len(self._urls) or index < 0:
+            raise RuntimeError("invalid station index")
+
+        previous, self._current = self._current, self.backend(index)
+        if self._current is not previous:
+            # the new backend is muted, so this only sets its cached volume
+            self._current.volume = self._volume
+
+        if self._current is self.pool:
+            # the pool unmutes the station itself
+            self.pool.play(self.favourites.index(index))
+        else:
+            self.single.play(index)
+            self.single.muted = False
+
+        if previous is not None and previous is not self._current:
+            previous.muted = True
+
+        self._station = index
+
+    def status(self, **kwargs):
+        """ the status of the audible mpd, empty if nothing is played
+
+        The arguments are passed to `single.Client.status`.
+        """
+        if self._current is None:
+            return {}
+
+        return self._current.status(**kwargs)
+
+    @property
+    def station(self):
+        return self._station
+
+    @station.setter
+    def station(self, index):
+        self.play(index)
+
+    @property
+    def muted(self):
+        if self._current is None:
+            return True
+
+        return self._current.muted
+
+    @muted.setter
+    def muted(self, new_state):
+        if self._current is None:
+            return
+
+        self._current.muted = new_state
+
+    def mute(self):
+        self.muted = True
+
+    def unmute(self):
+        self.muted = False
+
+    def toggle_mute(self):
+        self.muted = not self.muted
+
+
+def map(basepath, urls, favourites):
+    server = Server(basepath=basepath, num=len(favourites))
+
+    client = Client(server, favourites=favourites)
+    client.urls = urls
+
+    return client
@@ -0,0 +1,180 @@
+""" a pool of mpd partitions in a single mpd process
+
+Instead of one mpd per station, `Server` starts a single mpd with one alsa
+output per station and gives every station a partition of its own, with
+its own playlist, player and mixer. The partitions are served on the same
+socket, so `pool.Client` works unchanged: every `single.Client` selects
+its partition right after connecting.
+
+All outputs open the same alsa device, which therefore has to allow
+mixing, like the dmix based "default" device does. The standby output of
+`single.Server` isn't available, see `pool.Client`. Neither are lazy pools
+and restarting single workers, e.g. by a `supervisor.Supervisor`. All of
+these raise ValueError.
+"""
+import collections
+
+from . import pool
+from . import protocol
+from . import single
+
+
+config_template = """
+playlist_directory "{base}/mpd/playlists"
+log_file           "{base}/mpd/log"
+pid_file           "{base}/mpd/pid"
+
+bind_to_address    "{base}/mpd/socket"
+
+input {{
+    plugin "curl"
+}}
+{outputs}
+replaygain    "off"
+"""
+
+output_template = """
+audio_output {{
+    type        "alsa"
+    name        "{name}"
+    mixer_type  "software"
+}}
+"""
+
+# what pool.Client connects to: a socket and a partition on it
+Endpoint = collections.namedtuple("Endpoint", ["socket", "partition"])
+
+
+def partition_name(index):
+    """ the name of the partition and of its output """
+    return "webradio{}".format(index)
+
+
+def fill(path, num):
+    mpdpath = path / "mpd"
+    mpdpath.mkdir(mode=0o700)
+    (mpdpath / "playlists").mkdir(mode=0o700)
+
+    outputs = "".join(
+        output_template.format(name=partition_name(index))
+        for index in range(num)
+        )
+    with (mpdpath / "mpd.conf").open('w') as f:
+        f.write(config_template.format(
+            base=str(path.absolute()),
+            outputs=outputs,
+            ))
+
+
+class Server(single.Server):
+    def __init__(
+            self,
+            *,
+            basepath,
+            num,
+            timeout=None,
+            command=("/usr/bin/mpd",),
+            attach=False,
+            ):
+        """ start a mpd with `num` partitions in basepath
+
+        The configuration is always the minimal one of `fast_boot`.
+
+        Parameters
+        ----------
+        basepath : str or pathlib.Path
+            the (not yet existing) directory to put the mpd tree into
+        num : int
+            the number of partitions
+
+        Other Parameters
+        ----------------
+        attach : bool, default False
+            adopt a running mpd, see `single.Server`. It has to have the
+            partitions already.
+        """
+        self.num = num
+        super().__init__(
+            basepath=basepath,
+            fast_boot=True,
+            timeout=timeout,
+            command=command,
+            attach=attach,
+            )
+
+        if not self.attached:
+            self._partition()
+
+    def _fill(self, fast_boot):
+        fill(self.basepath, self.num)
+
+    def _validate(self, client):
+        for index in range(self.num):
+            client.partition(partition_name(index))
+
+    def _partition(self):
+        """ create the partitions and move an output into each of them """
+        client = protocol.MPDClient()
+        client.connect(host=str(self.socket), port=0)
+        try:
+            client.command_list_ok_begin()
+            for index in range(self.num):
+                name = partition_name(index)
+                client.newpartition(name)
+                # moveoutput moves into the partition of the connection
+                client.partition(name)
+                client.moveoutput(name)
+            client.command_list_end()
+        finally:
+            client.disconnect()
+
+    # the stations of a lazy pool.Client are only started when played
+    minimum = 0
+    maximum = None
+
+    # the output ids are the same in every partition, so a worker can't
+    # be switched to standby without silencing the others
+    standby_output = None
+
+    # pool.Client and supervisor.Supervisor start and replace workers one
+    # by one, the partitions however are fixed and share a single mpd
+    def add(self):
+        raise ValueError(
+            "the partitions are fixed, lazy pools need a pool.Server",
+            )
+
+    def remove(self, index):
+        raise ValueError(
+            "the partitions are fixed, lazy pools need a pool.Server",
+            )
+
+    def restart(self, index):
+        raise ValueError(
+            "the partitions share one mpd, which can only be restarted as "
+            "a whole",
+            )
+
+    def worker(self, index, timeout=None):
+        raise ValueError(
+            "the partitions share one mpd, see `sockets` for their "
+            "endpoints",
+            )
+
+    @property
+    def boot_times(self):
+        """ the boot time of each partition in seconds """
+        return [self.boot_time] * self.num
+
+    @property
+    def sockets(self):
+        for index in range(self.num):
+            yield Endpoint(self.socket, partition_name(index))
+
+
+def map(basepath, urls):
+    server = Server(basepath=basepath, num=len(urls))
+
+    client = pool.Client(server)
+    client.urls = urls
+
+    return client
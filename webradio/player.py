@@ -1,38 +1,336 @@
+import pathlib
+import threading
+import time
+
 from .base import ignore
+from . import hybrid
 from . import pool
+from . import session as sessions
 from . import single
+from . import volume
+from . import warmup
 
 
 class Player(object):
-    def __init__(self, *, basepath, urls, prebuffering=False):
+    def __init__(
+            self,
+            *,
+            basepath,
+            urls,
+            prebuffering=None,
+            coalesce=None,
+            favourites=None,
+            handover_timeout=10,
+            instant_start=False,
+            session=None,
+            attach=False,
+            ):
+        """ a radio player which can switch between prebuffering modes
+
+        Switching the mode happens live: the new backend is built next to
+        the current one in the background and only takes over once it
+        plays the current station, see `wait_switch`.
+
+        Parameters
+        ----------
+        urls : sequence of str or None
+            the resolved stream urls. If None, the ones of the session.
+
+        Other Parameters
+        ----------------
+        prebuffering : bool, optional
+            prebuffer the stations (see `favourites`) or play every station
+            on demand. If None, the mode of the session or False.
+        coalesce : float, optional
+            send volume changes at most once per this many seconds
+        favourites : sequence of int, optional
+            if given, only these stations get prebuffered and the others
+            are played on demand (see `hybrid.Client`). If None, all
+            stations get prebuffered.
+        handover_timeout : float, default 10
+            the maximum time to wait for the new backend to play the
+            current station in seconds. It takes over anyway afterwards.
+        instant_start : bool, default False
+            with prebuffering, play from a single server right away and
+            move to the pool workers as they become ready, see
+            `warmup.Client`
+        session : str or pathlib.Path, optional
+            the file to remember the urls, the station, the volume, the
+            muted state and the mode in, see `session.Session`. On start the
+            last station is played before anything else: it is loaded before
+            the other stations and, with prebuffering, played from a single
+            server until the pool has taken over. Pass urls=None to start
+            from the urls of the session and `load` fresh ones afterwards.
+        attach : bool, default False
+            adopt the mpd instances a previous player left running in
+            basepath, see `detach` and `single.Server`. An adopted backend
+            keeps playing and the session is not restored on top of it.
+            Backends with favourites can't be attached.
+        """
+        if attach and favourites is not None:
+            raise ValueError("hybrid backends can't be attached")
         self.client = None
         self.server = None
+        self._favourites = favourites
+
+        self.handover_timeout = handover_timeout
+        self.instant_start = instant_start
+        self.attach = attach
+        # the background thread building the backend of the other mode
+        self._switching = None
+        self.switch_error = None
+
+        # volume changes go through the writer, whichever client is active
+        self.volume_writer = None
+        if coalesce is not None:
+            self.volume_writer = volume.CoalescingWriter(
+                lambda value: setattr(self.client, "volume", value),
+                interval=coalesce,
+                )
+
+        self.session = None
+        state = {}
+        if session is not None:
+            self.session = sessions.Session(session)
+            state = self.session.load()
+
+        if urls is None:
+            urls = state.get("urls")
+            if urls is None:
+                if self.session is not None:
+                    self.session.close()
+                raise ValueError("neither urls nor a session to restore")
+        # the station doesn't mean anything with other urls
+        if state.get("urls") != list(urls):
+            state.pop("station", None)
+        if prebuffering is None:
+            prebuffering = bool(state.get("prebuffering", False))
 
         self.basepath = basepath
+        # the current backend lives in one of the two, the next one gets
+        # built in the other
+        self._basepaths = [basepath, str(pathlib.Path(basepath)) + "-next"]
+        if attach and not pathlib.Path(self._basepaths[0]).exists():
+            # the previous player switched modes before it was detached
+            if pathlib.Path(self._basepaths[1]).exists():
+                self._basepaths.reverse()
         self._urls = urls
 
-        self.prebuffering = prebuffering
+        if attach:
+            self.prebuffering = prebuffering
+            if not getattr(self.server, "attached", False):
+                self._restore(state)
+        elif state.get("station") is not None:
+            # the single server plays the station before the others are
+            # loaded and long before the pool can
+            self._prebuffering = False
+            self.server, self.client = self._initialize_single(
+                self._basepaths[0],
+                load=False,
+                )
+            self._restore(state, load=True)
+            self.prebuffering = prebuffering
+        else:
+            self.prebuffering = prebuffering
+            self._restore(state)
+
+    def _restore(self, state, load=False):
+        """ continue where the session ended
+
+        With `load`, the client has no urls yet and gets them with the
+        station played first, see `single.Client.load`.
+        """
+        if not state:
+            return
+
+        # before playing, so the station starts at the right volume
+        if state.get("muted"):
+            self.client.mute()
+        if state.get("volume") is not None:
+            self.client.volume = state["volume"]
+        if state.get("station") is None:
+            pass
+        elif load:
+            self.client.load(self._urls, station=state["station"])
+        else:
+            self.client.play(state["station"])
+
+    def _save(self, **state):
+        """ schedule a snapshot of the session, if there is one """
+        if self.session is None or self.client is None:
+            return
+
+        snapshot = dict(
+            urls=list(self._urls),
+            station=self.client.station,
+            volume=self.client.volume,
+            muted=self.client.muted,
+            prebuffering=self._prebuffering,
+            )
+        snapshot.update(state)
+        self.session.save(**snapshot)
+
+    def _connect(self, server, factory, load=True):
+        """ connect a client to a freshly built server and load the urls
+
+        If that fails, the server is shut down again, so its mpd processes
+        don't keep running and its basepath can be used for the next try.
+        """
+        client = None
+        try:
+            client = factory(server)
+            # an adopted backend may still play them
+            attached = self.attach and getattr(server, "attached", False)
+            if not load:
+                pass
+            elif not attached or list(client.urls) != list(self._urls):
+                client.urls = self._urls
+        except Exception:
+            with ignore(Exception):
+                if client is not None:
+                    client.disconnect()
+            with ignore(Exception):
+                server.shutdown()
+            raise
+
+        return server, client
 
-    def _initialize_prebuffered(self):
+    def _initialize_prebuffered(self, basepath, attach=False):
         n_urls = len(self._urls)
-        self.server = pool.Server(
-            basepath=self.basepath,
+        server = pool.Server(
+            basepath=basepath,
             num=n_urls,
+            attach=attach,
             )
 
-        self.client = pool.Client(self.server)
-        self.client.urls = self._urls
+        return self._connect(server, pool.Client)
 
-    def _initialize_single(self):
-        self.server = single.Server(basepath=self.basepath)
-        self.client = single.Client(self.server)
-        self.client.urls = self._urls
+    def _initialize_warmup(self, basepath):
+        server = warmup.Server(
+            basepath=basepath,
+            num=len(self._urls),
+            )
 
-    def start(self):
-        if self.prebuffering:
-            self._initialize_prebuffered()
+        return self._connect(server, warmup.Client)
+
+    def _initialize_hybrid(self, basepath):
+        server = hybrid.Server(
+            basepath=basepath,
+            num=len(self._favourites),
+            )
+
+        return self._connect(
+            server,
+            lambda server: hybrid.Client(server, favourites=self._favourites),
+            )
+
+    def _initialize_single(self, basepath, attach=False, load=True):
+        server = single.Server(basepath=basepath, attach=attach)
+
+        return self._connect(server, single.Client, load=load)
+
+    def _initialize(self, basepath, attach=False):
+        if self.prebuffering and self._favourites is not None:
+            return self._initialize_hybrid(basepath)
+        elif self.prebuffering and self.instant_start and not attach:
+            return self._initialize_warmup(basepath)
+        elif self.prebuffering:
+            # adopted workers play right away, no need to warm up
+            return self._initialize_prebuffered(basepath, attach=attach)
         else:
-            self._initialize_single()
+            return self._initialize_single(basepath, attach=attach)
+
+    def start(self):
+        self.server, self.client = self._initialize(
+            self._basepaths[0],
+            attach=self.attach,
+            )
+
+    def _switch(self, previous=None):
+        """ build the backend of the current mode and hand over to it
+
+        If the urls were replaced, `previous` are the ones of the current
+        backend, see `load`. Otherwise the mode was.
+        """
+        basepath = self._basepaths[1]
+        try:
+            server, client = self._initialize(basepath)
+        except Exception as e:
+            self.switch_error = e
+            if previous is None:
+                self._prebuffering = not self._prebuffering
+            else:
+                self._urls = previous
+            return
+
+        def translate(station):
+            # the same station may have another index in the new urls
+            if previous is None:
+                return station
+
+            url = previous[station]
+            return self._urls.index(url) if url in self._urls else None
+
+        old_client, old_server = self.client, self.server
+
+        # silent until it takes over
+        client.volume = 0
+        deadline = time.monotonic() + self.handover_timeout
+        station = None
+        # the listener may switch stations in the meantime
+        while old_client.station is not None:
+            if old_client.station == station:
+                break
+
+            station = old_client.station
+            new_station = translate(station)
+            if new_station is None:
+                break
+            client.play(new_station)
+            self._wait_playing(client, deadline)
+
+        if self.volume_writer is not None:
+            self.volume_writer.flush()
+
+        if old_client.muted:
+            client.mute()
+        client.volume = old_client.volume
+
+        # both play the station for a moment, so there is no gap
+        self.server, self.client = server, client
+        self._basepaths.reverse()
+        with ignore(Exception):
+            old_client.mute()
+
+        old_client.disconnect()
+        old_server.shutdown()
+        self._save()
+
+    @staticmethod
+    def _wait_playing(client, deadline, interval=0.05):
+        """ wait until the client's mpd plays and got audio data """
+        while time.monotonic() < deadline:
+            status = client.status(max_age=0)
+            playing = status.get("state") == "play"
+            if playing and int(status.get("bitrate") or 0) > 0:
+                return True
+            time.sleep(interval)
+
+        return False
+
+    def wait_switch(self, timeout=None):
+        """ wait until a mode switch has been completed
+
+        Returns
+        -------
+        switched : bool
+            False if the timeout expired before
+        """
+        if self._switching is None:
+            return True
+
+        self._switching.join(timeout=timeout)
+        return not self._switching.is_alive()
 
     def shutdown(self):
         # the None replacement currently is necessary:
@@ -42,25 +340,115 @@ class Player(object):
         # is requested. Though, I don't know where the parallel call should
         # come from: normally, we should use either sequential or async
         # programming...
+        self.wait_switch()
+        if self.volume_writer is not None:
+            # writes the pending value and stops the thread
+            self.volume_writer.close()
+
+        self._save()
+        if self.session is not None:
+            self.session.close()
+
         client, self.client = self.client, None
 
         client.disconnect()
         self.server.shutdown()
 
+    def load(self, urls):
+        """ replace the stations, e.g. by a freshly resolved list
+
+        Like a mode switch, the backend gets rebuilt with the new urls in
+        the background and takes over once it plays the current station,
+        if that is still in the list. See `wait_switch`.
+        """
+        urls = list(urls)
+        # only one switch at a time
+        self.wait_switch()
+        if urls == list(self._urls):
+            return
+
+        previous, self._urls = self._urls, urls
+        self.switch_error = None
+        self._switching = threading.Thread(
+            target=self._switch,
+            kwargs=dict(previous=previous),
+            daemon=True,
+            )
+        self._switching.start()
+
+    def detach(self):
+        """ stop the player, but leave its mpd instances running
+
+        A new player with `attach` continues where this one left off.
+
+        Raises
+        ------
+        ValueError
+            if the backend can't be detached, i.e. with favourites or an
+            instant start. The player keeps running then.
+        """
+        self.wait_switch()
+        # hybrid and warmup clients talk to more than one kind of server
+        if getattr(self.client, "detach", None) is None:
+            raise ValueError("this backend can't be detached")
+
+        if self.volume_writer is not None:
+            self.volume_writer.close()
+
+        self._save()
+        if self.session is not None:
+            self.session.close()
+
+        client, self.client = self.client, None
+        client.detach()
+
+    def play(self, index):
+        self.client.play(index)
+        self._save()
+
+    def mute(self):
+        self.client.mute()
+        self._save()
+
+    def unmute(self):
+        self.client.unmute()
+        self._save()
+
+    def toggle_mute(self):
+        self.client.toggle_mute()
+        self._save()
+
+    @property
+    def volume(self):
+        """ the volume, including a change which is not sent yet """
+        if self.volume_writer is not None:
+            pending = self.volume_writer.pending()
+            if pending is not None:
+                return pending
+
+        return self.client.volume
+
     @property
     def prebuffering(self):
         return self._prebuffering
 
     @prebuffering.setter
     def prebuffering(self, new_state):
-        if self.server is not None and self.prebuffering == new_state:
+        if self.server is None:
+            self._prebuffering = new_state
+            self.start()
             return
 
-        with ignore(AttributeError):
-            self.shutdown()
+        # only one switch at a time
+        self.wait_switch()
+        if self.prebuffering == new_state:
+            return
 
         self._prebuffering = new_state
-        self.start()
+        self.switch_error = None
+        self._switching = threading.Thread(target=self._switch, daemon=True)
+        # the new mode is saved once the switch succeeded
+        self._switching.start()
 
     def __getattr__(self, name):
         # forward everything that is not defined here to the current client
@@ -81,11 +469,26 @@ class Player(object):
             "_urls",
             "prebuffering",
             "_prebuffering",
+            "_favourites",
+            "volume_writer",
+            "handover_timeout",
+            "instant_start",
+            "attach",
+            "_switching",
+            "switch_error",
+            "_basepaths",
+            "session",
             ]
         if name in names:
             super().__setattr__(name, value)
+        elif name == "volume" and self.volume_writer is not None:
+            self.volume_writer.submit(value)
+            # the client only gets it later on
+            self._save(volume=value)
         else:
             setattr(self.client, name, value)
+            if name in ("volume", "muted", "station"):
+                self._save()
 
     def __enter__(self):
         return self
@@ -1,108 +1,731 @@
+from concurrent import futures
 import pathlib
 import itertools
+import threading
+import time
 
 from . import base
+from . import session
 from . import single
+from . import volume
 from .base import ignore
 
 
+def available_memory(meminfo="/proc/meminfo"):
+    """ the memory available for starting new processes in bytes
+
+    Returns
+    -------
+    available : int or None
+        None if it can't be determined, e.g. when not running on linux
+    """
+    fields = {}
+    with ignore(OSError):
+        with open(meminfo) as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                fields[key] = value.split()
+
+    # MemAvailable is missing on kernels older than 3.14
+    for key in ("MemAvailable", "MemFree"):
+        if key in fields:
+            amount, *unit = fields[key]
+            return int(amount) * (1024 if unit == ["kB"] else 1)
+
+    return None
+
+
+def memory_limits(
+        *,
+        worker_size=32 * 2**20,
+        reserve=64 * 2**20,
+        meminfo="/proc/meminfo",
+        ):
+    """ the number of workers fitting into the free memory
+
+    Parameters
+    ----------
+    worker_size : int, default 32 MiB
+        the memory used by one worker in bytes
+    reserve : int, default 64 MiB
+        the memory to leave to the rest of the system in bytes
+
+    Returns
+    -------
+    minimum : int
+        the number of workers to keep running, a quarter of the maximum
+    maximum : int or None
+        the number of workers that fit, None if the memory is unknown
+    """
+    available = available_memory(meminfo)
+    if available is None:
+        return 1, None
+
+    maximum = max((available - reserve) // worker_size, 1)
+    return max(maximum // 4, 1), maximum
+
+
 class Server(object):
-    def __init__(self, *, basepath, num):
-        self.workers = []
+    def __init__(
+            self,
+            *,
+            basepath,
+            num,
+            concurrency=None,
+            fast_boot=False,
+            timeout=None,
+            command=("/usr/bin/mpd",),
+            minimum=0,
+            maximum=None,
+            attach=False,
+            ):
+        """ start `num` mpd workers in basepath
+
+        Other Parameters
+        ----------------
+        attach : bool, default False
+            if basepath already exists, adopt the workers still running
+            there and only start the missing ones, see `single.Server`
+        minimum : int, default 0
+            the number of workers clients should keep running
+        maximum : int, optional
+            the maximum number of workers, see `memory_limits`. If None,
+            there is no limit.
+        """
+        self._futures = []
+        self._running = False
 
         self.basepath = pathlib.Path(basepath)
-        if self.basepath.exists():
+        if not self.basepath.exists():
+            # create the root dir
+            self.basepath.mkdir(mode=0o700)
+        elif not attach:
             raise FileExistsError(
                 "{} does already exist... not overwriting".format(
                     self.basepath,
                     ))
+        self._running = True
+
+        self.minimum = minimum
+        self.maximum = maximum
+        self._options = dict(
+            fast_boot=fast_boot,
+            timeout=timeout,
+            command=command,
+            attach=attach,
+            )
+
+        # start the workers concurrently: each single.Server blocks until
+        # its mpd daemonized, so booting them one after another would make
+        # the startup time grow linearly with the number of workers. Lazy
+        # pools start with none and add up to `maximum` later on.
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=concurrency or max(num, minimum, maximum or 0, 1),
+            )
+        self._futures = [self._start(index) for index in range(num)]
+
+    def _start(self, index):
+        return self._executor.submit(
+            single.Server,
+            basepath=self.basepath / "webradio{}".format(index),
+            **self._options
+            )
+
+    @property
+    def size(self):
+        """ the number of workers, including the ones still starting """
+        return sum(future is not None for future in self._futures)
+
+    def add(self):
+        """ start another worker
+
+        The worker boots in the background, use `worker` to wait for it.
+
+        Returns
+        -------
+        index : int
+            the index of the new worker, indices of removed workers get
+            reused
+
+        Raises
+        ------
+        RuntimeError
+            if the pool already has its maximum size
+        """
+        if not self._running:
+            raise RuntimeError("the pool has been shut down")
+        if self.maximum is not None and self.size >= self.maximum:
+            raise RuntimeError("the pool is full")
+
+        try:
+            index = self._futures.index(None)
+        except ValueError:
+            index = len(self._futures)
+            self._futures.append(None)
+
+        self._futures[index] = self._start(index)
+        return index
+
+    def restart(self, index):
+        """ replace a worker by a fresh one, e.g. after it crashed
+
+        The new worker boots in the background, use `worker` to wait for it.
+        """
+        future = self._futures[index]
+        if future is None:
+            raise IndexError("there is no worker {}".format(index))
+
+        # a crashed worker still has to clean up its directory
+        worker = self._booted(future)
+        if worker is not None:
+            worker.shutdown()
+
+        self._futures[index] = self._start(index)
+
+    def remove(self, index):
+        """ shut down a single worker """
+        future = self._futures[index]
+        if future is None:
+            raise IndexError("there is no worker {}".format(index))
 
-        # create the root dir
-        self.basepath.mkdir(mode=0o700)
+        self._futures[index] = None
+        worker = self._booted(future)
+        if worker is not None:
+            worker.shutdown()
+
+    @staticmethod
+    def _booted(future):
+        """ the worker of a future, None if it failed to start
+
+        A worker that failed to start has nothing to shut down.
+        """
+        try:
+            return future.result()
+        except Exception:
+            return None
 
-        # create the worker dirs
-        worker_directories = [
-            self.basepath / "webradio{}".format(index)
-            for index in range(num)
+    @property
+    def workers(self):
+        # blocks until every worker is up, removed workers are None
+        return [
+            future.result() if future is not None else None
+            for future in self._futures
             ]
 
-        self.workers = list(
-            single.Server(basepath=directory)
-            for directory in worker_directories
+    def worker(self, index, timeout=None):
+        """ the worker with the given index
+
+        Blocks until the worker has started.
+
+        Raises
+        ------
+        IndexError
+            if there is no such worker
+        concurrent.futures.TimeoutError
+            if the worker did not start within `timeout` seconds
+        """
+        future = self._futures[index]
+        if future is None:
+            raise IndexError("there is no worker {}".format(index))
+
+        return future.result(timeout=timeout)
+
+    def ready(self, timeout=None):
+        """ iterate over the workers in the order they become ready
+
+        Yields
+        ------
+        index : int
+            the index of the worker
+        worker : single.Server
+            the started worker
+        """
+        indices = {
+            future: index
+            for index, future in enumerate(self._futures)
+            if future is not None
+            }
+        for future in futures.as_completed(indices, timeout=timeout):
+            yield indices[future], future.result()
+
+    @property
+    def attached(self):
+        """ whether any of the workers was adopted, see `attach` """
+        return any(
+            worker.attached
+            for worker in self.workers
+            if worker is not None
             )
 
+    @property
+    def boot_times(self):
+        """ the boot time of each worker in seconds """
+        return [
+            worker.boot_time
+            for worker in self.workers
+            if worker is not None
+            ]
+
     @property
     def sockets(self):
+        # yield each socket as soon as its worker is up, so that clients
+        # can connect while the remaining workers are still starting
+        for index, future in enumerate(self._futures):
+            if future is not None:
+                yield self.worker(index).socket
+
+    @property
+    def state_file(self):
+        """ the station, volume and muted state of detached workers
+
+        The workers are all muted but the played one, so only the pool
+        knows these, see `Client.detach`.
+        """
+        return self.basepath / "state.json"
+
+    def detach(self):
+        """ leave the workers running, see `single.Server.detach` """
+        if not self._running:
+            return
+        self._running = False
+
         for worker in self.workers:
-            yield worker.socket
+            if worker is not None:
+                worker.detach()
+        self._executor.shutdown(wait=False)
 
     def shutdown(self):
         # don't do anything if we already shut down
-        if not self.workers:
+        if not self._running:
             return
+        self._running = False
+
+        pending, self._futures = self._futures, []
+        errors = []
+        for future in pending:
+            worker = None if future is None else self._booted(future)
+            if worker is None:
+                continue
+
+            # shut down the others anyway, the first error is raised below
+            try:
+                worker.shutdown()
+            except Exception as e:
+                errors.append(e)
+        self._executor.shutdown(wait=False)
 
-        for worker in self.workers:
-            worker.shutdown()
-        self.workers = []
-
+        with ignore(OSError):
+            self.state_file.unlink()
         with ignore(OSError):
             self.basepath.rmdir()
 
+        if errors:
+            raise errors[0]
+
 
 class Client(base.base_client):
-    def __init__(self, server, *, muted=False):
+    def __init__(
+            self,
+            server,
+            *,
+            muted=False,
+            coalesce=None,
+            lazy=False,
+            idle_timeout=None,
+            standby=False,
+            ):
+        """ connect to all workers of a pool.Server
+
+        Other Parameters
+        ----------------
+        coalesce : float, optional
+            if given, volume changes are sent in the background at most
+            once per this many seconds, see `volume.CoalescingWriter`
+        lazy : bool, default False
+            if True, a worker is only started when its station is played
+            for the first time, within the limits of the server. Otherwise
+            every worker of the server is used for one station.
+        idle_timeout : float, optional
+            with `lazy`, stop the workers whose station has not been
+            played for this many seconds. They are reaped in a background
+            thread every `idle_timeout / 2` seconds, see `reap`. The last
+            exception raised there is kept as `reap_error`.
+        standby : bool, default False
+            route the muted workers to the null output, so that they keep
+            buffering without mixing and writing silence to the sound card.
+            The played worker gets the alsa output back before it is
+            unmuted, see `single.Client.standby`. Not available with a
+            `partition.Server`.
+
+        If the server adopted running workers, see `Server.attached`, the
+        urls and the played station are read from them, so that the audio
+        doesn't stop. The station, the volume and the muted state of a
+        muted pool come from the server's `state_file`, see `detach`. Lazy
+        clients can't be attached.
+        """
+        no_standby = getattr(server, "standby_output", True) is None
+        if standby and no_standby:
+            raise ValueError("the workers of the server have no standby")
+
         self.server = server
-        self.clients = tuple(
-            single.Client(server=path)
-            for path in server.sockets
-            )
+        self.lazy = lazy
+        self.standby = standby
+        self.idle_timeout = idle_timeout
+
+        # guards the clients against concurrent restarts, see `restart`
+        self._lock = threading.RLock()
+
+        if lazy:
+            # the workers get started on demand, see `_start`
+            self.clients = []
+        else:
+            self.clients = [
+                single.Client(server=path)
+                for path in server.sockets
+                ]
         self._urls = []
+        # the worker index and the time of the last play of each station
+        self._workers = []
+        self._used = []
 
         self._current = None
+        # whether the workers were adopted, see `Server.attached`
+        self.attached = getattr(server, "attached", False)
+        if self.attached:
+            if lazy:
+                raise ValueError("lazy clients can't be attached")
+
+            for client in self.clients:
+                client.sync()
+            # the only unmuted worker is the played one
+            self._current = next(
+                (
+                    client
+                    for client in self.clients
+                    if not client.muted and client.station is not None
+                    ),
+                None,
+                )
+            if self._current is None:
+                self._restore(session.load(server.state_file))
+
         for client in self.clients:
-            client.muted = True
+            if client is not self._current:
+                self._silence(client)
+
+        # only the audible worker gets volume changes right away, the others
+        # get it when they are played. Lazy pools ask the first worker.
+        self._volume = self.clients[-1].volume if self.clients else None
+        if self._current is not None:
+            self._volume = self._current.volume
+
+        self.volume_writer = None
+        if coalesce is not None:
+            self.volume_writer = volume.CoalescingWriter(
+                self._apply_volume,
+                interval=coalesce,
+                )
+
+        # the listener may stay on a station for hours without a play
+        self.reap_error = None
+        self._stopped = threading.Event()
+        self._reaper = None
+        if lazy and idle_timeout is not None:
+            self._reaper = threading.Thread(target=self._reap, daemon=True)
+            self._reaper.start()
+
+    def _restore(self, state):
+        """ continue with the muted station of a detached client """
+        station = state.get("station")
+        if station is None or not 0 <= station < len(self.clients):
+            return
+
+        self._current = self.clients[station]
+        # the worker is muted, so this only updates its cached volume
+        if state.get("volume") is not None:
+            self._current.volume = state["volume"]
+        self._current.muted = bool(state.get("muted", True))
+
+    def _reap(self):
+        while not self._stopped.wait(timeout=self.idle_timeout / 2):
+            try:
+                self.reap()
+            except Exception as e:
+                # keep reaping, a worker may only be stuck for a moment
+                self.reap_error = e
 
     def disconnect(self):
+        self._stopped.set()
+        if self._reaper is not None:
+            self._reaper.join()
+            self._reaper = None
+
+        if self.volume_writer is not None:
+            self.volume_writer.close()
+
         for client in self.clients:
-            client.disconnect()
+            if client is not None:
+                client.disconnect()
 
         self.server.shutdown()
 
+    def detach(self):
+        """ disconnect, but leave the workers running
+
+        A new client of a `Server` with `attach` continues where this one
+        left off.
+        """
+        self.server.detach()
+        session.dump(self.server.state_file, dict(
+            station=self.station,
+            volume=self._volume,
+            muted=self.muted,
+            ))
+        self.disconnect()
+
     @property
     def volume(self):
-        # if we don't have clients, this will raise an index error
-        return self.clients[-1].volume
+        return self._volume if self._volume is not None else 0
 
     @volume.setter
     def volume(self, new_volume):
-        for client in self.clients:
-            client.volume = new_volume
+        self._volume = int(new_volume)
+
+        if self.volume_writer is None:
+            self._apply_volume(self._volume)
+        else:
+            self.volume_writer.submit(self._volume)
+
+    def _apply_volume(self, new_volume):
+        current = self._current
+        if current is not None:
+            current.volume = new_volume
 
     @property
     def urls(self):
+        if self.lazy:
+            return tuple(self._urls)
+
         return tuple(itertools.chain.from_iterable(
             client.urls for client in self.clients
             ))
 
     @urls.setter
     def urls(self, urls):
+        with self._lock:
+            self._set_urls(urls)
+
+    def _set_urls(self, urls):
+        if self.lazy:
+            for station, client in enumerate(self.clients):
+                if client is not None:
+                    self._stop(station)
+
+            self._urls = tuple(urls)
+            self._current = None
+            self.clients = [None] * len(self._urls)
+            self._workers = [None] * len(self._urls)
+            self._used = [None] * len(self._urls)
+
+            # keep the minimum number of workers warm. They boot
+            # concurrently, so add all of them before connecting to any.
+            stations = range(min(self.server.minimum, len(self._urls)))
+            workers = [self._add_worker() for _ in stations]
+            for station, worker in zip(stations, workers):
+                self._connect(station, worker)
+            return
+
         if len(urls) != len(self.clients):
             raise ValueError("number of urls != number of clients")
 
         self._urls = urls
 
-        for url, client in zip(urls, self.clients):
-            client.clear()
-            client.urls = [url]
-            client.play()
-            client.muted = True
+        for index, url in enumerate(urls):
+            if self.attached and self.clients[index].urls == [url]:
+                # an attached worker still plays it
+                continue
 
-    def play(self, index):
-        self._current = self.clients[index]
+            try:
+                self._set_url(self.clients[index], url)
+            except OSError:
+                # the worker died, don't let it take the others down
+                self._set_url(self.restart(index), url)
 
-        for client in self.clients:
-            client.muted = True
+    def _set_url(self, client, url):
+        client.clear()
+        client.urls = [url]
+        client.play()
+        self._silence(client)
+
+    def play(self, index):
+        with self._lock:
+            if self.lazy:
+                if self.clients[index] is None:
+                    self._start(index)
+                self._used[index] = time.monotonic()
+
+            self._switch(self.clients[index])
+
+            if self.lazy:
+                self.reap()
+
+    def restart(self, index):
+        """ replace the worker of a client by a fresh one
+
+        The new worker gets the urls, the station and the muted state of
+        the old one, so a crashed worker can be replaced transparently.
+
+        Returns
+        -------
+        client : single.Client
+            the client connected to the new worker
+        """
+        with self._lock:
+            old = self.clients[index]
+            worker = self._workers[index] if self.lazy else index
+
+            # the old worker may be gone already
+            with ignore(OSError):
+                old.disconnect()
+            self.server.restart(worker)
+
+            client = single.Client(server=self.server.worker(worker).socket)
+            self._silence(client)
+            if self._volume is not None:
+                client.volume = self._volume
+            if old.urls:
+                client.urls = old.urls
+                client.play(old.station)
+
+            self.clients[index] = client
+            if old is self._current:
+                self._current = client
+                if self.standby:
+                    client.standby = False
+                client.muted = old.muted
+
+            return client
+
+    def _start(self, station):
+        """ start a worker for a station, replacing the least recently
+        played one if the server is full
+        """
+        self._connect(station, self._add_worker())
+
+    def _add_worker(self):
+        """ start booting a worker, making room if the server is full
+
+        Returns
+        -------
+        worker : int
+            the index of the worker in the server
+        """
+        maximum = self.server.maximum
+        if maximum is not None and self.server.size >= maximum:
+            idle = [
+                other
+                for other, client in enumerate(self.clients)
+                if client is not None and client is not self._current
+                ]
+            if not idle:
+                raise RuntimeError("no worker available")
+            self._stop(min(idle, key=self._used.__getitem__))
+
+        return self.server.add()
+
+    def _connect(self, station, worker):
+        """ wait for a worker and let it play a station """
+        client = single.Client(server=self.server.worker(worker).socket)
+        self._silence(client)
+        if self._volume is None:
+            self._volume = client.volume
+
+        client.urls = [self._urls[station]]
+        client.play()
+
+        self.clients[station] = client
+        self._workers[station] = worker
+        self._used[station] = time.monotonic()
+
+    def _stop(self, station):
+        client, self.clients[station] = self.clients[station], None
+        worker, self._workers[station] = self._workers[station], None
+
+        client.disconnect()
+        self.server.remove(worker)
+
+    def reap(self, now=None):
+        """ stop the workers whose station has been idle for too long
+
+        The audible worker and the minimum number of workers of the server
+        are kept running. Called after every `play` of a lazy pool and
+        periodically in the background.
+
+        Returns
+        -------
+        stations : list of int
+            the stations whose worker got stopped
+        """
+        if not self.lazy or self.idle_timeout is None:
+            return []
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            running = [
+                station
+                for station, client in enumerate(self.clients)
+                if client is not None
+                ]
+            idle = sorted(
+                (
+                    station
+                    for station in running
+                    if self.clients[station] is not self._current
+                    and now - self._used[station] >= self.idle_timeout
+                    ),
+                key=self._used.__getitem__,
+                )
+
+            reaped = idle[:max(len(running) - self.server.minimum, 0)]
+            for station in reaped:
+                self._stop(station)
+
+        return reaped
+
+    def _switch(self, client):
+        # only the audible worker is unmuted, so switching only has to
+        # touch the old and the new one. Unmute first to keep the gap short.
+        if client is not self._current:
+            # the worker is muted, so this only updates its cached volume
+            client.volume = self._volume
+        previous, self._current = self._current, client
+
+        if self.standby:
+            self._current.standby = False
         self._current.muted = False
+        if previous is not None and previous is not self._current:
+            self._silence(previous)
+
+    def _silence(self, client):
+        """ mute a background worker, in standby if enabled """
+        client.muted = True
+        if self.standby:
+            client.standby = True
+
+    @property
+    def audible(self):
+        """ the client of the worker which is currently played """
+        return self._current
+
+    def status(self, **kwargs):
+        """ the status of the audible mpd, empty if nothing is played
+
+        The arguments are passed to `single.Client.status`.
+        """
+        if self._current is None:
+            return {}
+
+        return self._current.status(**kwargs)
 
     @property
     def station(self):
@@ -120,7 +743,7 @@ class Client(base.base_client):
         if self._current is None:
             return True
 
-        return all(client.muted for client in self.clients)
+        return self._current.muted
 
     @muted.setter
     def muted(self, new_state):
@@ -145,7 +768,21 @@ class Client(base.base_client):
         self.disconnect()
 
 
-def map(basepath, urls):
+def map(basepath, urls, *, lazy=False, idle_timeout=None):
+    if lazy:
+        minimum, maximum = memory_limits()
+        server = Server(
+            basepath=basepath,
+            num=0,
+            fast_boot=True,
+            minimum=minimum,
+            maximum=maximum,
+            )
+        client = Client(server, lazy=True, idle_timeout=idle_timeout)
+        client.urls = urls
+
+        return client
+
     server = Server(basepath=basepath, num=len(urls))
 
     client = Client(server)
@@ -0,0 +1,160 @@
+import concurrent.futures
+
+from . import pool
+from . import ranked
+from .usage import Usage
+
+
+class Client(ranked.Client):
+    """ a pool that follows the listener while zapping through the stations
+
+    After every switch the spare workers are pointed at the neighbours of
+    the current station and at the previously played one in the
+    background, so that "next", "previous" and "back" are always
+    prebuffered. With three or four spare workers this covers zapping
+    through an arbitrarily long list of stations.
+
+    Parameters
+    ----------
+    server : pool.Server
+        the pool, usually with a few more workers than neighbours
+
+    Other Parameters
+    ----------------
+    wrap : bool, default True
+        whether the first and the last station are neighbours
+    """
+    def __init__(
+            self,
+            server,
+            *,
+            muted=False,
+            coalesce=None,
+            usage=None,
+            save_interval=60,
+            standby=False,
+            wrap=True,
+            ):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._prefetching = None
+        self._previous = None
+
+        self.wrap = wrap
+
+        super().__init__(
+            server,
+            muted=muted,
+            coalesce=coalesce,
+            usage=usage,
+            save_interval=save_interval,
+            standby=standby,
+            )
+
+    def disconnect(self):
+        self._executor.shutdown(wait=True)
+        super().disconnect()
+
+    @property
+    def urls(self):
+        return self._urls
+
+    @urls.setter
+    def urls(self, urls):
+        with self._lock:
+            ranked.Client.urls.fset(self, urls)
+            self._previous = None
+
+    def neighbours(self, index):
+        """ the stations to keep prebuffered while `index` is playing """
+        n_urls = len(self._urls)
+
+        candidates = [index + 1, index - 1]
+        if self.wrap:
+            candidates = [candidate % n_urls for candidate in candidates]
+        candidates.append(self._previous)
+
+        neighbours = []
+        for candidate in candidates:
+            if candidate is None or candidate == index:
+                continue
+            if not 0 <= candidate < n_urls or candidate in neighbours:
+                continue
+            neighbours.append(candidate)
+
+        # there is no point in evicting each other
+        return neighbours[:len(self.clients) - 1]
+
+    def play(self, index):
+        # the lock of the pool also protects the worker assignments
+        with self._lock:
+            previous = self._station
+            super().play(index)
+
+            if previous is not None and previous != index:
+                self._previous = previous
+
+        self._prefetching = self._executor.submit(self._prefetch, index)
+
+    def _prefetch(self, index):
+        """ point the spare workers at the neighbours of a station
+
+        Only picking the workers happens under the lock, they are loaded
+        without it, so that `play` never waits for the prefetching.
+        """
+        wanted = self.neighbours(index)
+        for station in wanted:
+            with self._lock:
+                if self._station != index:
+                    # outdated, the listener has moved on
+                    return
+
+                if self.worker(station) is not None:
+                    continue
+
+                worker = self._victim(keep=set(wanted) | {index})
+                # free until it is loaded, but nobody else takes it
+                self._assigned[worker] = None
+                self._loading.add(worker)
+                client, urls = self.clients[worker], self._urls
+
+            try:
+                self._silence(client)
+                client.urls = [urls[station]]
+                client.play(0)
+            finally:
+                with self._lock:
+                    self._loading.discard(worker)
+                    if (
+                            self._station == index
+                            and self._urls is urls
+                            and self.clients[worker] is client
+                            and self.worker(station) is None
+                            ):
+                        self._assigned[worker] = station
+
+    def wait(self, timeout=None):
+        """ wait until the spare workers are prebuffering the neighbours
+
+        Returns
+        -------
+        done : bool
+            False if the timeout expired before
+        """
+        if self._prefetching is None:
+            return True
+
+        try:
+            self._prefetching.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            return False
+        return True
+
+
+def map(basepath, urls, *, spares=3, usage_file=None):
+    """ serve the urls with a pool of the current station and `spares` """
+    server = pool.Server(basepath=basepath, num=min(spares + 1, len(urls)))
+
+    client = Client(server, usage=Usage(usage_file))
+    client.urls = urls
+
+    return client
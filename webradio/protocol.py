@@ -0,0 +1,384 @@
+""" a minimal implementation of the mpd protocol
+
+Only the commands and status fields used by the clients are supported.
+Responses are read into a reusable buffer and only the requested fields
+get decoded, so a `status` call does not build a dict of everything mpd
+reports.
+"""
+import socket
+
+
+# the status fields the clients are interested in
+status_fields = ("volume", "song", "state", "bitrate", "error")
+
+
+class CommandError(RuntimeError):
+    """ the server rejected a command (an ACK response) """
+
+
+def quote(argument):
+    """ quote a command argument for the mpd protocol """
+    escaped = str(argument).replace("\\", "\\\\").replace('"', '\\"')
+    return '"{}"'.format(escaped)
+
+
+def encode(command, *args):
+    """ encode a command line of the mpd protocol """
+    line = " ".join([command] + [quote(arg) for arg in args])
+    return (line + "\n").encode()
+
+
+def parse_list(buffer, start, end, key):
+    """ collect the values of all lines with the given key """
+    prefix = (key + ": ").encode()
+
+    values = []
+    while start < end:
+        eol = buffer.find(b"\n", start, end)
+        if eol == -1:
+            eol = end
+
+        if buffer.startswith(prefix, start):
+            values.append(bytes(buffer[start + len(prefix):eol]).decode())
+
+        start = eol + 1
+
+    return values
+
+
+def parse(buffer, start, end, fields=None):
+    """ parse the key-value lines of a response
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        the buffer containing the response
+    start, end : int
+        the region of the buffer holding the response lines, without the
+        terminating OK
+    fields : sequence of str, optional
+        only decode these keys. If None, decode every line.
+
+    Returns
+    -------
+    response : dict
+        the decoded values, if a key occurs multiple times the last one wins
+    """
+    if fields is not None:
+        wanted = {field.encode(): field for field in fields}
+
+    response = {}
+    while start < end:
+        eol = buffer.find(b"\n", start, end)
+        if eol == -1:
+            eol = end
+
+        separator = buffer.find(b": ", start, eol)
+        if separator != -1:
+            if fields is None:
+                key = bytes(buffer[start:separator]).decode()
+            else:
+                key = wanted.get(bytes(buffer[start:separator]))
+
+            if key is not None:
+                response[key] = bytes(buffer[separator + 2:eol]).decode()
+
+        start = eol + 1
+
+    return response
+
+
+class MPDClient(object):
+    """ synchronous mpd client over a unix socket
+
+    The method names follow the mpd commands. Between
+    `command_list_ok_begin` and `command_list_end` the commands are only
+    queued and then written at once; `command_list_end` returns the list
+    of responses.
+    """
+    def __init__(self, *, bufsize=4096):
+        self._socket = None
+        self._buffer = bytearray(bufsize)
+        # the region of the buffer holding unprocessed data
+        self._start = 0
+        self._end = 0
+
+        self._queue = None
+        self.mpd_version = None
+
+    def connect(self, host, port=0):
+        """ connect to the unix socket at host
+
+        The port is accepted for compatibility with network clients and
+        ignored.
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(host)
+            start, end = self._read_line()
+        except OSError:
+            self._socket.close()
+            self._socket = None
+            raise
+
+        greeting = bytes(self._buffer[start:end])
+        if not greeting.startswith(b"OK MPD "):
+            self.disconnect()
+            raise ConnectionError("not a mpd server: {!r}".format(greeting))
+
+        self.mpd_version = greeting[len(b"OK MPD "):].decode()
+
+    def disconnect(self):
+        if self._socket is None:
+            return
+
+        try:
+            self._socket.sendall(b"close\n")
+        except OSError:
+            pass
+        finally:
+            self._socket.close()
+            self._socket = None
+            self._start = self._end = 0
+            self._queue = None
+
+    def _fill(self):
+        """ read more data from the socket into the buffer """
+        if self._end == len(self._buffer):
+            if self._start > 0:
+                # move the unprocessed data to the front
+                size = self._end - self._start
+                self._buffer[:size] = self._buffer[self._start:self._end]
+                self._start, self._end = 0, size
+            else:
+                self._buffer.extend(bytes(len(self._buffer)))
+
+        view = memoryview(self._buffer)[self._end:]
+        try:
+            received = self._socket.recv_into(view)
+        finally:
+            view.release()
+
+        if received == 0:
+            raise ConnectionError("connection lost")
+        self._end += received
+
+    def _consume(self, end):
+        self._start = end
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def _read_line(self):
+        """ read a single line, returns its region without the newline """
+        while True:
+            eol = self._buffer.find(b"\n", self._start, self._end)
+            if eol != -1:
+                break
+            self._fill()
+
+        start = self._start
+        self._consume(eol + 1)
+        return start, eol
+
+    def _read_response(self, fields=None, terminator=b"OK\n"):
+        """ read and parse the response to a single command
+
+        Raises
+        ------
+        CommandError
+            if the server answered with ACK
+        """
+        start, end = self._read_region(terminator)
+        response = parse(self._buffer, start, end, fields)
+        self._consume(end + len(terminator))
+
+        return response
+
+    def _read_region(self, terminator=b"OK\n"):
+        """ wait for a complete response
+
+        Returns
+        -------
+        start, end : int
+            the region of the buffer holding the response lines. It is
+            only valid until the next read.
+        """
+        position = self._start
+        while True:
+            eol = self._buffer.find(b"\n", position, self._end)
+            if eol == -1:
+                # keep the offset relative to the start, _fill may move it
+                offset = position - self._start
+                self._fill()
+                position = self._start + offset
+                continue
+
+            if self._buffer.startswith(terminator, position):
+                break
+
+            if self._buffer.startswith(b"ACK ", position):
+                message = bytes(self._buffer[position + 4:eol]).decode()
+                self._consume(eol + 1)
+                raise CommandError(message)
+
+            position = eol + 1
+
+        return self._start, position
+
+    def execute(self, *commands, fields=None):
+        """ send several commands in a single write and read all responses
+
+        Parameters
+        ----------
+        commands : tuple
+            the commands as tuples of name and arguments
+
+        Returns
+        -------
+        responses : list of dict
+            the response to each command. If a command fails, the
+            remaining responses are still read and the first error is
+            raised afterwards.
+        """
+        self._send(b"".join(
+            encode(*command)
+            for command in commands
+            ))
+
+        responses = []
+        error = None
+        for _ in commands:
+            try:
+                responses.append(self._read_response(fields))
+            except CommandError as e:
+                error = error or e
+                responses.append(None)
+
+        if error is not None:
+            raise error
+
+        return responses
+
+    def _command(self, command, *args, fields=None):
+        if self._queue is not None:
+            self._queue.append(encode(command, *args))
+            return None
+
+        self._send(encode(command, *args))
+        return self._read_response(fields)
+
+    def _send(self, data):
+        if self._socket is None:
+            raise ConnectionError("not connected")
+        self._socket.sendall(data)
+
+    def abort(self):
+        """ shut the connection down
+
+        This may be called from another thread to interrupt a blocking
+        call like `idle`, which will then raise ConnectionError.
+        """
+        if self._socket is None:
+            return
+
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def command_list_ok_begin(self):
+        if self._queue is not None:
+            raise CommandError("already in a command list")
+        self._queue = []
+
+    def command_list_end(self):
+        if self._queue is None:
+            raise CommandError("not in a command list")
+
+        queue, self._queue = self._queue, None
+        self._send(b"".join(
+            [b"command_list_ok_begin\n"] + queue + [b"command_list_end\n"]
+            ))
+
+        responses = [
+            self._read_response(terminator=b"list_OK\n")
+            for _ in queue
+            ]
+        self._read_response()
+
+        return responses
+
+    def idle(self, *subsystems):
+        """ wait until something changes on the server
+
+        Returns
+        -------
+        changed : list of str
+            the changed subsystems
+        """
+        self._send(encode("idle", *subsystems))
+
+        start, end = self._read_region()
+        changed = parse_list(self._buffer, start, end, "changed")
+        self._consume(end + len(b"OK\n"))
+
+        return changed
+
+    def noidle(self):
+        """ end a pending `idle`, which then returns normally """
+        self._send(encode("noidle"))
+
+    def ping(self):
+        self._command("ping")
+
+    def status(self):
+        return self._command("status", fields=status_fields)
+
+    def playlistinfo(self):
+        """ the urls of the playlist in order
+
+        Returns
+        -------
+        urls : list of str
+        """
+        self._send(encode("playlistinfo"))
+
+        start, end = self._read_region()
+        urls = parse_list(self._buffer, start, end, "file")
+        self._consume(end + len(b"OK\n"))
+
+        return urls
+
+    def setvol(self, volume):
+        self._command("setvol", volume)
+
+    def add(self, url):
+        self._command("add", url)
+
+    def partition(self, name):
+        self._command("partition", name)
+
+    def newpartition(self, name):
+        self._command("newpartition", name)
+
+    def moveoutput(self, name):
+        self._command("moveoutput", name)
+
+    def enableoutput(self, output):
+        self._command("enableoutput", output)
+
+    def disableoutput(self, output):
+        self._command("disableoutput", output)
+
+    def clear(self):
+        self._command("clear")
+
+    def move(self, position, to):
+        """ move a song or a range of songs ("START:END") to `to` """
+        self._command("move", position, to)
+
+    def play(self, index=None):
+        if index is None:
+            self._command("play")
+        else:
+            self._command("play", index)
@@ -0,0 +1,153 @@
+import time
+
+from . import pool
+from .usage import Usage
+
+
+class Client(pool.Client):
+    """ a pool of a few workers serving many stations
+
+    Each worker of the pool.Server prebuffers one station. The workers are
+    assigned to the stations with the highest usage scores. If a station
+    without a worker is played, the least valuable worker that is not
+    audible gets evicted and pointed at it.
+
+    Parameters
+    ----------
+    server : pool.Server
+        the pool, it may have fewer workers than stations
+
+    Other Parameters
+    ----------------
+    usage : usage.Usage, optional
+        the play counters. If None, they are only kept in memory.
+    save_interval : float, default 60
+        the minimum time between saving the play counters in seconds
+    """
+    def __init__(
+            self,
+            server,
+            *,
+            muted=False,
+            coalesce=None,
+            usage=None,
+            save_interval=60,
+            standby=False,
+            ):
+        super().__init__(
+            server,
+            muted=muted,
+            coalesce=coalesce,
+            standby=standby,
+            )
+
+        self.usage = usage if usage is not None else Usage()
+        self.save_interval = save_interval
+        self._saved = time.monotonic()
+
+        # the station each worker is assigned to
+        self._assigned = [None] * len(self.clients)
+        self._station = None
+        # the workers being loaded in the background, see prefetch.Client
+        self._loading = set()
+
+    def disconnect(self):
+        self.usage.save()
+        super().disconnect()
+
+    @property
+    def urls(self):
+        return self._urls
+
+    @urls.setter
+    def urls(self, urls):
+        self._urls = tuple(urls)
+        self._assigned = [None] * len(self.clients)
+        self._current = None
+        self._station = None
+
+        favourites = self.usage.ranked(self._urls)[:len(self.clients)]
+        for worker, station in enumerate(favourites):
+            self._load(worker, station)
+
+    @property
+    def assignments(self):
+        """ the station index of each worker, None if unassigned """
+        return tuple(self._assigned)
+
+    def _load(self, worker, station):
+        client = self.clients[worker]
+        self._silence(client)
+        client.urls = [self._urls[station]]
+        client.play(0)
+        self._assigned[worker] = station
+
+    def _victim(self, keep=()):
+        """ the worker to evict: a free one or the least valuable one
+
+        Neither the audible worker, the workers being loaded nor the workers
+        assigned to one of the stations in `keep` get evicted.
+        """
+        candidates = [
+            worker
+            for worker, client in enumerate(self.clients)
+            if client is not self._current
+            and worker not in self._loading
+            and self._assigned[worker] not in keep
+            ]
+        if not candidates:
+            raise RuntimeError("no worker available")
+
+        now = time.time()
+
+        def value(worker):
+            station = self._assigned[worker]
+            if station is None:
+                return -1
+            return self.usage.score(self._urls[station], now)
+
+        return min(candidates, key=value)
+
+    def worker(self, index):
+        """ the index of the worker playing a station, None if unassigned """
+        try:
+            return self._assigned.index(index)
+        except ValueError:
+            return None
+
+    def play(self, index):
+        if index >= len(self._urls) or index < 0:
+            raise RuntimeError("invalid station index")
+
+        self.usage.record(self._urls[index])
+
+        with self._lock:
+            worker = self.worker(index)
+            if worker is None:
+                worker = self._victim()
+                self._load(worker, index)
+
+            self._switch(self.clients[worker])
+            self._station = index
+
+        if time.monotonic() - self._saved >= self.save_interval:
+            self.usage.save()
+            self._saved = time.monotonic()
+
+    @property
+    def station(self):
+        return self._station
+
+    @station.setter
+    def station(self, index):
+        self.play(index)
+
+
+def map(basepath, urls, *, num, usage_file=None):
+    """ serve the urls with a pool of `num` workers """
+    server = pool.Server(basepath=basepath, num=min(num, len(urls)))
+
+    client = Client(server, usage=Usage(usage_file))
+    client.urls = urls
+
+    return client
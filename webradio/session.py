@@ -0,0 +1,117 @@
+""" remember the state of a player across runs
+
+A `Session` keeps a snapshot of the resolved urls, the station, the volume,
+the muted state and the prebuffering mode in a small json file. Snapshots
+are written through a `volume.CoalescingWriter`, so a burst of changes
+results in a single write, and atomically, so a power cut never leaves a
+truncated file behind. `load` and `dump` read and write a single snapshot,
+like the one a detached mpd leaves behind, see `single.Server.state_file`.
+"""
+import json
+import os
+import pathlib
+
+from . import volume
+from .base import ignore
+
+
+# the fields of a snapshot
+fields = ("urls", "station", "volume", "muted", "prebuffering")
+
+
+def load(path):
+    """ the fields of a snapshot file
+
+    Returns
+    -------
+    state : dict
+        the known fields of the snapshot, empty if there is none or it
+        can't be read
+    """
+    try:
+        with pathlib.Path(path).open() as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(state, dict):
+        return {}
+
+    return {key: value for key, value in state.items() if key in fields}
+
+
+def dump(path, state):
+    """ write a snapshot atomically, its directory is created if necessary """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        with tmp.open("w") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(str(tmp), str(path))
+    except Exception:
+        with ignore(OSError):
+            tmp.unlink()
+        raise
+
+
+class Session(object):
+    """ a snapshot of a player, written at most once per `interval`
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        the snapshot file, its directory is created if necessary
+
+    Other Parameters
+    ----------------
+    interval : float, default 5
+        the minimum time between two writes in seconds. Changes in between
+        are coalesced, only the latest snapshot gets written.
+    """
+    fields = fields
+
+    def __init__(self, path, *, interval=5):
+        self.path = pathlib.Path(path)
+        self._state = {}
+        self._writer = volume.CoalescingWriter(self._write, interval=interval)
+
+    @property
+    def error(self):
+        """ the exception raised by the last failed write, if any """
+        return self._writer.error
+
+    def load(self):
+        """ the last snapshot
+
+        Returns
+        -------
+        state : dict
+            the fields of the snapshot, empty if there is none or it can't
+            be read
+        """
+        self._state = load(self.path)
+        return dict(self._state)
+
+    def save(self, **state):
+        """ update fields of the snapshot and schedule writing it """
+        unknown = set(state) - set(self.fields)
+        if unknown:
+            raise ValueError("unknown fields: {}".format(sorted(unknown)))
+
+        self._state.update(state)
+        self._writer.submit(dict(self._state))
+
+    def flush(self, timeout=None):
+        """ write a pending snapshot right away, see `save` """
+        return self._writer.flush(timeout=timeout)
+
+    def close(self):
+        """ write a pending snapshot and stop writing """
+        self._writer.close()
+
+    def _write(self, state):
+        dump(self.path, state)
@@ -1,11 +1,18 @@
+import asyncio
+import collections
 from functools import wraps
+import os
 import pathlib
 import shutil
+import socket
 import subprocess
-
-import musicpd
+import threading
+import time
 
 from . import base
+from . import protocol
+from . import session
+from . import volume
 from .base import ignore
 
 
@@ -30,49 +37,260 @@ audio_output {{
     mixer_type  "software"
 }}
 
+audio_output {{
+    type        "null"
+    name        "standby"
+    mixer_type  "none"
+    enabled     "no"
+}}
+
+replaygain    "off"
+"""
+
+# a minimal configuration for streaming only: without music directory,
+# database, sticker and state file mpd neither scans nor restores anything
+# and can start accepting connections right away
+fast_boot_template = """
+playlist_directory "{base}/mpd/playlists"
+log_file           "{base}/mpd/log"
+pid_file           "{base}/mpd/pid"
+
+bind_to_address    "{base}/mpd/socket"
+
+input {{
+    plugin "curl"
+}}
+
+audio_output {{
+    type        "alsa"
+    name        "{name}"
+    mixer_type  "software"
+}}
+
+audio_output {{
+    type        "null"
+    name        "standby"
+    mixer_type  "none"
+    enabled     "no"
+}}
+
 replaygain    "off"
 """
 
 
-def fill(path):
+# the ids of the outputs in the templates above. The null output takes the
+# audio of a worker in standby, so that it neither mixes nor writes to alsa.
+# It starts disabled, so that only the workers in standby feed it.
+audible_output = 0
+standby_output = 1
+
+
+def fill(path, *, fast_boot=False):
     mpdpath = path / "mpd"
     mpdpath.mkdir(mode=0o700)
     (mpdpath / "playlists").mkdir(mode=0o700)
-    (mpdpath / "database").touch()
+    if fast_boot:
+        template = fast_boot_template
+    else:
+        template = config_template
+        (mpdpath / "database").touch()
+
     with (mpdpath / "mpd.conf").open('w') as f:
-        f.write(config_template.format(
+        f.write(template.format(
             base=str(path.absolute()),
             name=path.name,
             ))
 
 
 class Server(object):
-    def __init__(self, *, basepath):
+    def __init__(
+            self,
+            *,
+            basepath,
+            fast_boot=False,
+            timeout=None,
+            command=("/usr/bin/mpd",),
+            attach=False,
+            ):
+        """ start a mpd instance in basepath
+
+        Parameters
+        ----------
+        basepath : str or pathlib.Path
+            the (not yet existing) directory to put the mpd tree into
+
+        Other Parameters
+        ----------------
+        fast_boot : bool, default False
+            use a minimal configuration without database, sticker and
+            state file
+        timeout : float, optional
+            if given, wait at most this many seconds for the socket to
+            appear. If None, mpd is assumed to be ready once it daemonized.
+        command : sequence of str, default ("/usr/bin/mpd",)
+            the command to start mpd with. It has to accept `--kill`, see
+            `webradio.fake.command` for a stand-in.
+        attach : bool, default False
+            if basepath already exists, adopt the mpd running there instead
+            of raising, e.g. after the frontend was restarted. It is only
+            adopted if its pid file names a running process and it answers
+            on its socket, otherwise the stale tree is replaced by a fresh
+            mpd. See `attached` and `detach`.
+
+        Raises
+        ------
+        FileExistsError
+            if basepath already exists and attach is False
+        TimeoutError
+            if the socket did not appear within timeout
+        """
         self.basepath = pathlib.Path(basepath).absolute()
+        self.command = list(command)
 
-        if self.basepath.exists():
+        # whether mpd was already running, see `attach`
+        self.attached = False
+        self._detached = False
+
+        if not self.basepath.exists():
+            self.basepath.mkdir(mode=0o700)
+        elif not attach:
             raise FileExistsError(
                 "{} does already exist... not overwriting".format(
                     self.basepath,
                     ))
+        elif self._adopt():
+            self.attached = True
+            self.boot_time = 0
+            return
+        else:
+            # left behind by a crashed mpd
+            self._stop(keep_basepath=True)
 
-        self.basepath.mkdir(mode=0o700)
-
-        fill(self.basepath)
+        start = time.monotonic()
+        self._fill(fast_boot)
         subprocess.call(
-            ["/usr/bin/mpd"],
+            self.command,
             env={'XDG_CONFIG_HOME': str(self.basepath.absolute())},
             )
+        if timeout is not None:
+            self.wait_ready(timeout=timeout)
+
+        # the time from writing the config until mpd was usable
+        self.boot_time = time.monotonic() - start
+
+    def _fill(self, fast_boot):
+        fill(self.basepath, fast_boot=fast_boot)
+
+    def _adopt(self):
+        """ whether a healthy mpd is running in basepath """
+        try:
+            if not base.alive(self.pid):
+                return False
+        except (OSError, ValueError):
+            return False
+
+        client = protocol.MPDClient()
+        try:
+            client.connect(host=str(self.socket), port=0)
+            self._validate(client)
+        except (OSError, protocol.CommandError):
+            return False
+        finally:
+            client.disconnect()
+
+        return True
+
+    def _validate(self, client):
+        """ check an adopted mpd, raises OSError or CommandError if broken """
+        client.ping()
 
     @property
     def socket(self):
         return self.basepath / "mpd" / "socket"
 
-    def shutdown(self):
+    @property
+    def state_file(self):
+        """ the station, volume and muted state of a detached mpd
+
+        mpd itself only knows a volume of 0 for a muted output, see
+        `Client.detach` and `Client.sync`.
+        """
+        return self.basepath / "mpd" / "state.json"
+
+    @property
+    def pid(self):
+        """ the process id of mpd """
+        with (self.basepath / "mpd" / "pid").open() as f:
+            return int(f.read().strip())
+
+    def cpu_time(self):
+        """ the processor time mpd used so far in seconds (linux only) """
+        with open("/proc/{}/stat".format(self.pid)) as f:
+            # the fields following the command name, which may contain spaces
+            fields = f.read().rpartition(")")[2].split()
+
+        # utime and stime, the 14th and 15th field in proc(5)
+        ticks = int(fields[11]) + int(fields[12])
+        return ticks / os.sysconf("SC_CLK_TCK")
+
+    def rss(self):
+        """ the resident memory of mpd in bytes (linux only) """
+        with open("/proc/{}/status".format(self.pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+
+        return 0
+
+    def wait_ready(self, timeout, interval=0.01):
+        """ wait until mpd accepts connections on its socket
+
+        The socket file appears when mpd binds it, which is before it
+        listens, so a connection is tried as well.
+
+        Raises
+        ------
+        TimeoutError
+            if mpd did not accept a connection within timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        while not self._accepting():
+            if time.monotonic() >= deadline:
+                raise TimeoutError(
+                    "mpd in {} did not become ready within {}s".format(
+                        self.basepath,
+                        timeout,
+                        ))
+            time.sleep(interval)
+
+    def _accepting(self):
+        """ whether mpd accepts connections on its socket """
+        if not self.socket.exists():
+            return False
+
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(str(self.socket))
+        except OSError:
+            return False
+        finally:
+            connection.close()
+
+        return True
+
+    def detach(self):
+        """ leave mpd running, `shutdown` does nothing afterwards
+
+        A new Server with `attach` can adopt it later on.
+        """
+        self._detached = True
+
+    def _stop(self, *, keep_basepath=False):
+        """ kill mpd and remove its tree """
         mpd = self.basepath / "mpd"
         if mpd.exists():
             subprocess.call(
-                ['/usr/bin/mpd', '--kill'],
+                self.command + ['--kill'],
                 env={'XDG_CONFIG_HOME': str(self.basepath.absolute())},
                 )
 
@@ -80,26 +298,163 @@ class Server(object):
             # only remove the mpd subtree using something like rm -rf
             shutil.rmtree(str(mpd.absolute()))
 
-            # try to remove the basepath (if it's empty)
-            self.basepath.rmdir()
+            if not keep_basepath:
+                # try to remove the basepath (if it's empty)
+                self.basepath.rmdir()
+
+    def shutdown(self):
+        if not self._detached:
+            self._stop()
+
+
+# errors signalling a lost connection to mpd
+connection_errors = (ConnectionError,)
+
+
+class Watcher(object):
+    """ follow the state changes of a mpd server
+
+    A second connection is held in idle mode in a background thread and
+    `callback` is called with the list of changed subsystems whenever the
+    server reports a change. If the connection is lost, the watcher
+    reconnects with exponential backoff.
+    """
+    subsystems = ("player", "mixer", "playlist")
+
+    def __init__(
+            self,
+            path,
+            callback,
+            *,
+            subsystems=subsystems,
+            partition=None,
+            ):
+        self.path = path
+        self.callback = callback
+        self.subsystems = tuple(subsystems)
+        self.partition = partition
+
+        self._stopped = threading.Event()
+        self._client = protocol.MPDClient()
+        self._connect()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        delay = 0.05
+        while not self._stopped.is_set():
+            try:
+                changed = self._client.idle(*self.subsystems)
+            except connection_errors:
+                if self._stopped.is_set():
+                    break
+
+                self._client.disconnect()
+                if self._stopped.wait(timeout=delay):
+                    break
+                delay = min(delay * 2, 5)
+
+                with ignore(OSError):
+                    self._connect()
+                continue
+
+            delay = 0.05
+            if changed and not self._stopped.is_set():
+                self.callback(changed)
+
+    def _connect(self):
+        self._client.connect(host=str(self.path), port=0)
+        if self.partition is not None:
+            self._client.partition(self.partition)
+
+    def stop(self):
+        self._stopped.set()
+        self._client.abort()
+        self._thread.join(timeout=1)
+        self._client.disconnect()
 
 
 class Client(base.base_client):
-    def __init__(self, server, *, muted=False):
+    def __init__(
+            self,
+            server,
+            *,
+            muted=False,
+            keepalive=50,
+            status_ttl=1,
+            watch=False,
+            coalesce=None,
+            ):
+        """ connect to a mpd server
+
+        Other Parameters
+        ----------------
+        keepalive : float or None, default 50
+            ping the server if the connection was idle for this many
+            seconds. This should be a bit less than mpd's
+            connection_timeout (60s by default). None disables it.
+        status_ttl : float, default 1
+            the number of seconds a fetched status is reused. The client's
+            own commands keep the cached status up to date.
+        watch : bool, default False
+            start watching the server for changes right away, see `watch`
+        coalesce : float, optional
+            if given, volume changes are written in the background at most
+            once per this many seconds, and only the latest one is sent.
+            See `volume.CoalescingWriter`.
+        """
+        # the mpd partition to use, see `partition.Server`
+        self.partition = None
         try:
             self.basepath = server.socket
             self.server = server
+            self.partition = getattr(server, "partition", None)
         except AttributeError:
             self.basepath = pathlib.Path(server).absolute()
             self.server = None
 
+        # the mpd connection is shared with the keepalive thread
+        self._lock = threading.RLock()
+
+        self.status_ttl = status_ttl
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._status = None
+        self._status_time = None
+
+        self._watcher = None
+        self._subscribers = []
+
+        self.volume_writer = None
+        if coalesce is not None:
+            self.volume_writer = volume.CoalescingWriter(
+                self._setvol,
+                interval=coalesce,
+                )
+
         self._connect()
 
         self._muted = muted
+        self._standby = False
         self._station = None
         self._volume = self._get_volume()
 
         self._urls = []
+        if getattr(self.server, "attached", False):
+            self.sync()
+
+        self._stopped = threading.Event()
+        self.keepalive = keepalive
+        if keepalive is not None:
+            self._keepalive_thread = threading.Thread(
+                target=self._keep_alive,
+                daemon=True,
+                )
+            self._keepalive_thread.start()
+
+        if watch:
+            self.watch()
 
     def __enter__(self):
         return self
@@ -110,37 +465,273 @@ class Client(base.base_client):
         with ignore(AttributeError):
             self.server.shutdown()
 
+    def detach(self):
+        """ disconnect, but leave mpd running, see `Server.detach`
+
+        The station, the volume and the muted state are kept in the
+        server's `state_file`, so that a client of an attached server can
+        continue with them.
+        """
+        self.disconnect()
+
+        with ignore(AttributeError):
+            self.server.detach()
+            session.dump(self.server.state_file, dict(
+                station=self._station,
+                volume=self._volume,
+                muted=self._muted,
+                ))
+
     def ensure_connection(func):
+        # run the command optimistically and only if the connection turns
+        # out to be lost, reconnect and replay it once
         @wraps(func)
         def wrapper(self, *args, **kwargs):
-            try:
-                self._client.ping()
-            except BrokenPipeError:
-                self._reconnect()
+            with self._lock:
+                try:
+                    result = func(self, *args, **kwargs)
+                except connection_errors:
+                    self._reconnect()
+                    result = func(self, *args, **kwargs)
 
-            return func(self, *args, **kwargs)
+                self._last_command = time.monotonic()
+                return result
 
         return wrapper
 
-    def _reconnect(self):
-        self.disconnect()
-        self._connect()
+    def _reconnect(self, attempts=5, delay=0.05):
+        with self._lock:
+            self._close()
+            # the server might have been restarted in the meantime
+            self._invalidate_status()
 
-    def disconnect(self):
-        with ignore(BrokenPipeError):
+            # retry with exponential backoff, the server might be restarting
+            for attempt in range(attempts):
+                try:
+                    self._connect()
+                    return
+                except OSError:
+                    if attempt == attempts - 1:
+                        raise
+                    time.sleep(delay * 2 ** attempt)
+
+    def _keep_alive(self):
+        timeout = self.keepalive
+        while not self._stopped.wait(timeout=timeout):
+            idle = time.monotonic() - self._last_command
+            if idle < self.keepalive:
+                timeout = self.keepalive - idle
+                continue
+
+            timeout = self.keepalive
+            with ignore(OSError):
+                self.ping()
+
+    def _close(self):
+        with ignore(connection_errors):
             self._client.disconnect()
 
+    def disconnect(self):
+        if self.volume_writer is not None:
+            # don't lose the last volume change
+            self.volume_writer.close()
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        self._close()
+
     def _connect(self):
-        self._client = musicpd.MPDClient()
+        self._client = protocol.MPDClient()
         self._client.connect(host=str(self.basepath), port=0)
+        if self.partition is not None:
+            # every connection starts in the default partition
+            self._client.partition(self.partition)
+        self._last_command = time.monotonic()
 
     @ensure_connection
+    def ping(self):
+        self._client.ping()
+
+    def status(self, *, max_age=None):
+        """ the status of the server
+
+        The status is cached for `status_ttl` seconds.
+
+        Parameters
+        ----------
+        max_age : float, optional
+            the maximum age of a cached status in seconds, 0 always asks
+            the server. If None, `status_ttl` is used.
+
+        Returns
+        -------
+        status : dict
+            the status fields as strings
+        """
+        if max_age is None:
+            max_age = self.status_ttl
+
+        with self._lock:
+            if self._status is not None:
+                age = time.monotonic() - self._status_time
+                if age < max_age:
+                    self.cache_hits += 1
+                    return self._status
+
+            self.cache_misses += 1
+            return self._fetch_status()
+
+    @ensure_connection
+    def _fetch_status(self):
+        self._status = self._client.status()
+        self._status_time = time.monotonic()
+        return self._status
+
+    def _update_status(self, **fields):
+        with self._lock:
+            if self._status is None:
+                return
+
+            self._status.update(
+                (key, str(value))
+                for key, value in fields.items()
+                )
+
+    def _invalidate_status(self):
+        self._status = None
+
     def _get_volume(self):
-        return int(self._client.status().get('volume'))
+        return int(self.status().get('volume'))
 
     @ensure_connection
+    def sync(self):
+        """ read the playlist, the station and the volume from mpd
+
+        Called on connecting to an attached server, see `Server.attached`.
+        A volume of 0 is taken as muted. The volume before muting and the
+        station of a stopped mpd are taken from the server's `state_file`,
+        if it was detached by a client, see `detach`.
+        """
+        self._urls = self._client.playlistinfo()
+        status = self._fetch_status()
+
+        state = {}
+        with ignore(AttributeError):
+            state = session.load(self.server.state_file)
+
+        self._station = int(status['song']) if 'song' in status else None
+        if self._station is None:
+            station = state.get("station")
+            if station is not None and 0 <= station < len(self._urls):
+                self._station = station
+
+        self._volume = int(status.get('volume', 0))
+        self._muted = self._volume == 0
+        if self._muted:
+            # unless someone else turned it up in the meantime
+            self._muted = bool(state.get("muted", True))
+            self._volume = int(state.get("volume") or 0)
+        # it may have been left in standby
+        self._standby = None
+
+    def watch(self):
+        """ keep the local state in sync with the server
+
+        Starts a `Watcher`, so that changes made by other clients or by the
+        server itself (like a dropped stream) update the cached status,
+        volume and station without polling.
+        """
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = Watcher(
+                    self.basepath,
+                    self._changed,
+                    partition=self.partition,
+                    )
+
+    def subscribe(self, callback, subsystems=None):
+        """ get notified about changes on the server
+
+        Parameters
+        ----------
+        callback : callable
+            called as `callback(subsystem, status)` from the watcher thread
+        subsystems : iterable of str, optional
+            only notify about these subsystems ("player", "mixer" or
+            "playlist"). If None, notify about all of them.
+        """
+        if subsystems is not None:
+            subsystems = frozenset(subsystems)
+
+        self._subscribers.append((callback, subsystems))
+        self.watch()
+
+    def unsubscribe(self, callback):
+        self._subscribers = [
+            (subscriber, subsystems)
+            for subscriber, subsystems in self._subscribers
+            if subscriber is not callback
+            ]
+
+    def events(self, subsystems=None, *, loop=None):
+        """ get notified about changes on the server in an event loop
+
+        Parameters
+        ----------
+        loop : asyncio.AbstractEventLoop, optional
+            the loop to deliver the changes in. If None, the running one,
+            so it has to be called from within the loop then.
+
+        Returns
+        -------
+        queue : asyncio.Queue
+            receives `(subsystem, status)` tuples
+        """
+        if loop is None:
+            loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def put(subsystem, status):
+            loop.call_soon_threadsafe(queue.put_nowait, (subsystem, status))
+
+        self.subscribe(put, subsystems)
+        return queue
+
+    def _changed(self, changed):
+        with self._lock:
+            self._invalidate_status()
+            with ignore(connection_errors):
+                status = self.status()
+            if self._status is None:
+                return
+
+            volume = int(status.get('volume', -1))
+            if volume > 0 and self._muted:
+                # unmuted by someone else
+                self._muted = False
+                self._volume = volume
+            elif volume >= 0 and not self._muted:
+                self._volume = volume
+
+            if 'song' in status:
+                self._station = int(status['song'])
+
+        for subsystem in changed:
+            for callback, subsystems in self._subscribers:
+                if subsystems is None or subsystem in subsystems:
+                    callback(subsystem, status)
+
     def _set_volume(self, new_volume):
+        if self.volume_writer is None:
+            self._setvol(new_volume)
+        else:
+            self.volume_writer.submit(new_volume)
+
+    @ensure_connection
+    def _setvol(self, new_volume):
         self._client.setvol(new_volume)
+        self._update_status(volume=new_volume)
 
     @property
     def volume(self):
@@ -159,9 +750,61 @@ class Client(base.base_client):
 
     @urls.setter
     def urls(self, urls):
-        self.clear()
-        for url in urls:
-            self.add(url)
+        self.load(urls)
+
+    @ensure_connection
+    def load(self, urls, *, chunksize=1000, station=None):
+        """ replace the playlist in as few round-trips as possible
+
+        The clear and add commands are sent as command lists of at most
+        `chunksize` commands each, so that a whole catalog takes a single
+        round-trip per chunk instead of one per url.
+
+        If `station` is given, its url is loaded and played first, so that
+        it starts before the rest of the catalog gets loaded. The others are
+        added behind it and moved in front of it while it keeps playing.
+        """
+        urls = list(urls)
+        if station is not None and not 0 <= station < len(urls):
+            raise RuntimeError("invalid song index")
+
+        if station is None:
+            order = urls
+        else:
+            self._client.command_list_ok_begin()
+            self._client.clear()
+            self._client.add(urls[station])
+            self._client.play(0)
+            self._client.command_list_end()
+
+            order = urls[station + 1:] + urls[:station]
+
+        chunks = [
+            order[start:start + chunksize]
+            for start in range(0, len(order), chunksize)
+            ]
+        if station is None and not chunks:
+            # still clear the playlist
+            chunks = [[]]
+
+        for index, chunk in enumerate(chunks):
+            self._client.command_list_ok_begin()
+            if index == 0 and station is None:
+                self._client.clear()
+            for url in chunk:
+                self._client.add(url)
+            if index == len(chunks) - 1 and station:
+                # the stations before the played one belong in front of it
+                self._client.move(
+                    "{}:{}".format(len(urls) - station, len(urls)),
+                    0,
+                    )
+            self._client.command_list_end()
+
+        self._urls = urls
+        if station is not None:
+            self._station = station
+        self._invalidate_status()
 
     @ensure_connection
     def add(self, url):
@@ -172,17 +815,21 @@ class Client(base.base_client):
     def clear(self):
         self._client.clear()
         self._urls = []
+        self._invalidate_status()
 
     @ensure_connection
     def play(self, index=None):
         if index is None:
             self._client.play()
-            self._station = int(self._client.status().get('song'))
+            # mpd decides which song to play
+            self._invalidate_status()
+            self._station = int(self.status().get('song'))
         else:
             if index >= len(self._urls) or index < 0:
                 raise RuntimeError("invalid song index")
             self._client.play(index)
             self._station = index
+            self._update_status(song=index, state="play")
 
     @property
     def station(self):
@@ -192,6 +839,39 @@ class Client(base.base_client):
     def station(self, index):
         self.play(index)
 
+    @property
+    def standby(self):
+        """ whether the audio goes to the null output instead of alsa
+
+        A muted worker in standby keeps buffering its stream without
+        mixing and writing silence to the sound card. mpd starts with
+        only the alsa output enabled, so this is False at first and None
+        after `sync`, as the state of an adopted mpd is unknown.
+        """
+        return self._standby
+
+    @standby.setter
+    def standby(self, new_state):
+        new_state = bool(new_state)
+        if self._standby is new_state:
+            return
+
+        self._set_standby(new_state)
+
+    @ensure_connection
+    def _set_standby(self, new_state):
+        enable, disable = audible_output, standby_output
+        if new_state:
+            enable, disable = disable, enable
+
+        # enable first, mpd stops playing without any enabled output
+        self._client.command_list_ok_begin()
+        self._client.enableoutput(enable)
+        self._client.disableoutput(disable)
+        self._client.command_list_end()
+
+        self._standby = new_state
+
     @property
     def muted(self):
         return self._muted
@@ -215,6 +895,254 @@ class Client(base.base_client):
         self.muted = not self.muted
 
 
+class AsyncClient(object):
+    """ asyncio based client for a mpd server
+
+    The operations of `base.base_client` are implemented as coroutines.
+    Requests are pipelined: every command is written to the socket right
+    away and the responses are matched to the commands in order, so that
+    concurrent calls don't wait for each other's round-trips.
+
+    The state (volume, muted, station and urls) is updated before the
+    commands are sent, so reading it never blocks. Assigning to `volume`,
+    `muted` or `station` schedules the corresponding coroutine as a task,
+    use `wait` to sequence on these tasks and get their errors.
+
+    Attributes
+    ----------
+    error : Exception or None
+        the last exception raised by a task of the setters, which nobody
+        waited for
+    """
+    def __init__(self, server, *, muted=False):
+        # the mpd partition to use, see `partition.Server`
+        self.partition = None
+        try:
+            self.basepath = server.socket
+            self.server = server
+            self.partition = getattr(server, "partition", None)
+        except AttributeError:
+            self.basepath = pathlib.Path(server).absolute()
+            self.server = None
+
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+        self._pending = collections.deque()
+        # the tasks scheduled by the setters
+        self._tasks = set()
+        self.error = None
+
+        self._muted = muted
+        self._standby = False
+        self._station = None
+        self._volume = None
+        self._urls = []
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            str(self.basepath),
+            )
+        greeting = await self._reader.readline()
+        if not greeting.startswith(b"OK MPD "):
+            raise ConnectionError("not a mpd server: {!r}".format(greeting))
+
+        self._receiver = asyncio.ensure_future(self._receive())
+
+        if self.partition is not None:
+            # every connection starts in the default partition
+            await self._command("partition", self.partition)
+        status = await self._command("status")
+        self._volume = int(status.get('volume', 0))
+
+        return self
+
+    def _schedule(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.error = task.exception()
+
+    async def wait(self):
+        """ wait for the tasks scheduled by the setters
+
+        Raises
+        ------
+        Exception
+            the first exception raised by one of the tasks
+        """
+        tasks = list(self._tasks)
+        if not tasks:
+            return
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                # reported here, so it is not kept as error
+                if result is self.error:
+                    self.error = None
+                raise result
+
+    async def disconnect(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+            with ignore(asyncio.CancelledError):
+                await self._receiver
+            self._receiver = None
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, cls, exception, traceback):
+        await self.disconnect()
+
+    def _command(self, command, *args):
+        """ send a command without waiting for the response
+
+        Returns
+        -------
+        response : asyncio.Future
+            resolves to the response as dict or fails with
+            protocol.CommandError if the server rejected the command
+        """
+        if self._writer is None:
+            raise ConnectionError("not connected")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        self._writer.write(protocol.encode(command, *args))
+
+        return future
+
+    async def _receive(self):
+        try:
+            while True:
+                response = {}
+                error = None
+                while True:
+                    line = await self._reader.readline()
+                    if not line:
+                        raise ConnectionError("connection lost")
+                    if line == b"OK\n":
+                        break
+                    if line.startswith(b"ACK "):
+                        message = line[4:].decode().strip()
+                        error = protocol.CommandError(message)
+                        break
+
+                    response.update(protocol.parse(line, 0, len(line)))
+
+                future = self._pending.popleft()
+                if future.cancelled():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(response)
+        except asyncio.CancelledError:
+            self._fail_pending("disconnected")
+            raise
+        except ConnectionError as e:
+            # later commands fail right away instead of waiting forever
+            self._writer.close()
+            self._writer = None
+            self._receiver = None
+            self._fail_pending(str(e))
+
+    def _fail_pending(self, message):
+        """ nobody is going to answer the remaining requests """
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(message))
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, new_volume):
+        self._schedule(self.set_volume(new_volume))
+
+    async def set_volume(self, new_volume):
+        self._volume = int(new_volume)
+        if not self._muted:
+            await self._command("setvol", self._volume)
+
+    @property
+    def urls(self):
+        return self._urls
+
+    async def set_urls(self, urls):
+        # everything is written at once, so this takes a single round-trip
+        self._urls = list(urls)
+        await asyncio.gather(
+            self._command("clear"),
+            *(self._command("add", url) for url in self._urls)
+            )
+
+    async def add(self, url):
+        self._urls.append(url)
+        await self._command("add", url)
+
+    async def clear(self):
+        self._urls = []
+        await self._command("clear")
+
+    async def play(self, index=None):
+        if index is None:
+            _, status = await asyncio.gather(
+                self._command("play"),
+                self._command("status"),
+                )
+            self._station = int(status.get('song'))
+        else:
+            if index >= len(self._urls) or index < 0:
+                raise RuntimeError("invalid song index")
+            self._station = index
+            await self._command("play", index)
+
+    @property
+    def station(self):
+        return self._station
+
+    @station.setter
+    def station(self, index):
+        self._schedule(self.play(index))
+
+    @property
+    def muted(self):
+        return self._muted
+
+    @muted.setter
+    def muted(self, new_state):
+        self._schedule(self.set_muted(new_state))
+
+    async def set_muted(self, new_state):
+        if self._muted == bool(new_state):
+            return
+
+        self._muted = bool(new_state)
+        await self._command("setvol", 0 if self._muted else self._volume)
+
+    async def mute(self):
+        await self.set_muted(True)
+
+    async def unmute(self):
+        await self.set_muted(False)
+
+    async def toggle_mute(self):
+        await self.set_muted(not self._muted)
+
+
 def map(basepath, urls):
     server = Server(basepath=basepath)
 
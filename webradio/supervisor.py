@@ -0,0 +1,154 @@
+import collections
+import threading
+import time
+
+
+class Supervisor(object):
+    """ keep the workers of a pool healthy
+
+    Every `interval` seconds each worker is pinged in a background thread.
+    A worker which doesn't answer gets restarted with the station it was
+    playing, see `pool.Client.restart`. Workers running longer than
+    `recycle_after` seconds are replaced by fresh ones to contain the
+    memory growth of long running mpd processes. At most one worker is
+    recycled per check and the audible one never is, so the listener
+    doesn't notice.
+
+    Parameters
+    ----------
+    client : pool.Client
+        the pool to supervise
+
+    Other Parameters
+    ----------------
+    interval : float, default 5
+        the time between two health checks in seconds
+    recycle_after : float, optional
+        the maximum age of a worker in seconds. If None, healthy workers
+        are never replaced.
+    start : bool, default True
+        start checking in the background. Otherwise `check` has to be
+        called manually.
+
+    Attributes
+    ----------
+    restarts : collections.Counter
+        the number of restarts of crashed workers per client index
+    recycled : collections.Counter
+        the number of recycled workers per client index
+    recoveries : list of (int, float)
+        the client index and the time it took in seconds for every restart
+        of a crashed worker
+    error : Exception or None
+        the last exception raised while restarting a worker
+    """
+    def __init__(self, client, *, interval=5, recycle_after=None, start=True):
+        self.client = client
+        self.interval = interval
+        self.recycle_after = recycle_after
+
+        self.restarts = collections.Counter()
+        self.recycled = collections.Counter()
+        self.recoveries = []
+        self.error = None
+
+        self._started = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        if start:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(timeout=self.interval):
+            self.check()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, cls, exception, traceback):
+        self.stop()
+
+    def age(self, index, now=None):
+        """ the time since a worker was first seen or last replaced """
+        now = time.monotonic() if now is None else now
+        return now - self._started.setdefault(index, now)
+
+    @staticmethod
+    def healthy(client):
+        try:
+            client.ping()
+        except OSError:
+            return False
+        return True
+
+    def check(self, now=None):
+        """ restart the crashed workers and recycle at most one old one
+
+        Returns
+        -------
+        restarted : list of int
+            the indices of the clients whose worker got replaced
+        """
+        now = time.monotonic() if now is None else now
+
+        restarted = []
+        oldest = None
+        for index, client in enumerate(self.client.clients):
+            # stopped workers of a lazy pool
+            if client is None:
+                self._started.pop(index, None)
+                continue
+
+            if not self.healthy(client):
+                duration = self._restart(index, now)
+                if duration is not None:
+                    self.restarts[index] += 1
+                    self.recoveries.append((index, duration))
+                    restarted.append(index)
+                continue
+
+            if self.recycle_after is None or client is self.client.audible:
+                continue
+            if self.age(index, now) < self.recycle_after:
+                continue
+            if oldest is None or self.age(index, now) > self.age(oldest, now):
+                oldest = index
+
+        # staggered: the other old workers follow in the next checks
+        if oldest is not None and self._restart(oldest, now) is not None:
+            self.recycled[oldest] += 1
+            restarted.append(oldest)
+
+        return restarted
+
+    def _restart(self, index, now):
+        """ replace a worker and return the time it took """
+        start = time.monotonic()
+        try:
+            self.client.restart(index)
+        except Exception as e:
+            self.error = e
+            return None
+
+        self._started[index] = now
+        return time.monotonic() - start
+
+    @property
+    def stats(self):
+        """ a summary of the restarts and recovery times """
+        durations = [duration for _, duration in self.recoveries]
+        return {
+            "restarts": sum(self.restarts.values()),
+            "recycled": sum(self.recycled.values()),
+            "mean_recovery": (
+                sum(durations) / len(durations) if durations else None
+                ),
+            "max_recovery": max(durations) if durations else None,
+            }
@@ -1,6 +1,5 @@
 from urllib.parse import urlparse
 from posixpath import splitext
-import requests
 
 
 def urltype(url):
@@ -34,6 +33,9 @@ def extract_playlist(text):
 
 
 def acquire_playlist(url):
+    # requests takes a while to import and is only needed for playlists
+    import requests
+
     answer = requests.get(url)
     if not answer.ok:
         return ""
@@ -0,0 +1,85 @@
+import json
+import math
+import os
+import pathlib
+import time
+
+
+class Usage(object):
+    """ exponentially decaying play counters of radio stations
+
+    Every play adds one to the score of a station and the scores halve
+    every `half_life` seconds, so recently and frequently played stations
+    rank highest. The stations are identified by their urls.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path, optional
+        the json file to keep the counters in. If None, nothing is saved.
+    half_life : float, default one week
+        the time in seconds after which a score has halved
+    """
+    def __init__(self, path=None, *, half_life=7 * 24 * 3600):
+        self.path = pathlib.Path(path) if path is not None else None
+        self.half_life = half_life
+
+        # url -> (score, time of the score)
+        self._scores = {}
+        self.load()
+
+    def load(self):
+        if self.path is None or not self.path.exists():
+            return
+
+        # a corrupt file is not worth failing for
+        try:
+            with self.path.open() as f:
+                data = json.load(f)
+
+            # url -> [score, time], anything else is not ours
+            scores = {
+                url: (float(score), float(timestamp))
+                for url, (score, timestamp) in data.items()
+                }
+        except (ValueError, TypeError, AttributeError):
+            return
+
+        self._scores = scores
+
+    def save(self):
+        if self.path is None:
+            return
+
+        # write atomically, so that a crash never leaves a truncated file
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        with temporary.open("w") as f:
+            json.dump(self._scores, f)
+        os.replace(str(temporary), str(self.path))
+
+    def score(self, url, now=None):
+        if url not in self._scores:
+            return 0.0
+        if now is None:
+            now = time.time()
+
+        score, timestamp = self._scores[url]
+        age = max(now - timestamp, 0)
+        return score * math.pow(0.5, age / self.half_life)
+
+    def record(self, url, now=None):
+        """ count a play of the given station """
+        if now is None:
+            now = time.time()
+
+        self._scores[url] = (self.score(url, now) + 1, now)
+
+    def ranked(self, urls, now=None):
+        """ the indices of the urls, most valuable first
+
+        Stations with the same score keep their order.
+        """
+        if now is None:
+            now = time.time()
+
+        scores = [self.score(url, now) for url in urls]
+        return sorted(range(len(urls)), key=lambda index: -scores[index])
@@ -0,0 +1,138 @@
+import threading
+import time
+
+
+# marks that there is no value waiting to be written
+_nothing = object()
+
+
+class CoalescingWriter(object):
+    """ write only the latest of rapidly changing values
+
+    Values are handed to `write` from a background thread, at most once
+    per `interval` seconds. A value which gets replaced before it could be
+    written is dropped, so a burst of changes (like turning a volume knob)
+    results in only a few writes of the most recent value and `submit`
+    never blocks on the write itself.
+
+    Parameters
+    ----------
+    write : callable
+        called with the value to write
+    interval : float, default 0.05
+        the minimum time between two writes in seconds
+
+    Attributes
+    ----------
+    written : int
+        the number of values written
+    dropped : int
+        the number of values replaced before they were written
+    error : Exception or None
+        the last exception raised by `write`
+    """
+    def __init__(self, write, *, interval=0.05):
+        self.write = write
+        self.interval = interval
+
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+
+        self._pending = _nothing
+        # the last submitted value, until it has been written
+        self._latest = _nothing
+        self._busy = False
+        self._closed = False
+        # skip the rest of the interval
+        self._urgent = False
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, value):
+        """ schedule a value to be written, replacing a pending one """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("writer is closed")
+
+            if self._pending is not _nothing:
+                self.dropped += 1
+            self._pending = value
+            self._latest = value
+            self._condition.notify_all()
+
+    def pending(self, default=None):
+        """ the last submitted value if it hasn't been written yet
+
+        Returns
+        -------
+        value
+            the value which is waiting or being written, `default` if
+            everything has been written
+        """
+        with self._condition:
+            if self._latest is _nothing:
+                return default
+            return self._latest
+
+    def flush(self, timeout=None):
+        """ write the pending value right away and wait for it
+
+        Returns
+        -------
+        flushed : bool
+            False if the timeout expired before
+        """
+        with self._condition:
+            if self._pending is not _nothing:
+                self._urgent = True
+                self._condition.notify_all()
+            return self._condition.wait_for(
+                lambda: self._pending is _nothing and not self._busy,
+                timeout=timeout,
+                )
+
+    def close(self):
+        """ write the pending value and stop the background thread """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        last_write = None
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._pending is not _nothing or self._closed,
+                    )
+                if self._pending is _nothing:
+                    return
+
+            with self._condition:
+                if last_write is not None:
+                    # more values may come in the meantime
+                    self._condition.wait_for(
+                        lambda: self._closed or self._urgent,
+                        timeout=last_write + self.interval - time.monotonic(),
+                        )
+
+                value, self._pending = self._pending, _nothing
+                self._busy = True
+                self._urgent = False
+
+            try:
+                self.write(value)
+            except Exception as e:
+                self.error = e
+            finally:
+                last_write = time.monotonic()
+                with self._condition:
+                    self._busy = False
+                    if self._pending is _nothing:
+                        # nothing newer came in while writing
+                        self._latest = _nothing
+                    self.written += 1
+                    self._condition.notify_all()
@@ -0,0 +1,266 @@
+""" start playing at once and prebuffer in the background
+
+`Server` starts a single mpd first and the pool of prebuffering workers
+only afterwards, without waiting for it. `Client` plays every station from
+the single mpd until the pool worker of the station is ready, so the time
+to the first audio does not depend on the number of stations.
+"""
+import pathlib
+import threading
+
+from . import base
+from . import pool
+from . import single
+from .base import ignore
+
+
+class Server(object):
+    """ a single server right away and a pool in the background
+
+    Parameters
+    ----------
+    basepath : str or pathlib.Path
+        the (not yet existing) directory to put the servers into
+    num : int
+        the number of stations
+
+    Other Parameters
+    ----------------
+    fast_boot : bool, default True
+        use the minimal mpd configuration, see `single.Server`
+    """
+    def __init__(
+            self,
+            *,
+            basepath,
+            num,
+            fast_boot=True,
+            timeout=None,
+            command=("/usr/bin/mpd",),
+            ):
+        self.basepath = pathlib.Path(basepath)
+        if self.basepath.exists():
+            raise FileExistsError(
+                "{} does already exist... not overwriting".format(
+                    self.basepath,
+                    ))
+
+        self.basepath.mkdir(mode=0o700)
+
+        # the single server first: it is needed for the first station
+        self.single = single.Server(
+            basepath=self.basepath / "single",
+            fast_boot=fast_boot,
+            timeout=timeout,
+            command=command,
+            )
+        # returns right away, the workers boot in the background
+        self.pool = pool.Server(
+            basepath=self.basepath / "pool",
+            num=num,
+            fast_boot=fast_boot,
+            timeout=timeout,
+            command=command,
+            )
+
+    def shutdown(self):
+        self.single.shutdown()
+        self.pool.shutdown()
+
+        with ignore(OSError):
+            self.basepath.rmdir()
+
+
+class Client(base.base_client):
+    """ move from the single server to the pool as it becomes ready
+
+    Once the urls are set, the workers of the pool get connected and
+    loaded in a background thread in the order they finish booting. A
+    station is played by its worker if that is ready and by the single
+    server otherwise. Once every worker is ready and none of the stations
+    is played by the single server any more, it gets shut down.
+
+    Parameters
+    ----------
+    server : warmup.Server
+        the servers to connect to
+
+    Attributes
+    ----------
+    ready : threading.Event
+        set once every worker is ready
+    error : Exception or None
+        the exception which stopped the warm up. The stations without a
+        ready worker are played by the single server.
+    """
+    def __init__(self, server, *, muted=False):
+        self.server = server
+
+        self.single = single.Client(server.single, muted=True)
+        # the clients of the ready workers by station
+        self.workers = {}
+
+        self.ready = threading.Event()
+        self.error = None
+
+        # guards the workers and the current client against the warm up
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._urls = ()
+        self._current = None
+        self._station = None
+        self._volume = self.single.volume
+
+    def disconnect(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        with self._lock:
+            for client in self.workers.values():
+                client.disconnect()
+            if self.single is not None:
+                self.single.disconnect()
+
+        self.server.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, cls, exception, traceback):
+        self.disconnect()
+
+    @property
+    def urls(self):
+        return self._urls
+
+    @urls.setter
+    def urls(self, urls):
+        if self._thread is not None:
+            raise RuntimeError("the urls can only be set once")
+
+        self._urls = tuple(urls)
+        self.single.urls = self._urls
+
+        self._thread = threading.Thread(target=self._warm_up, daemon=True)
+        self._thread.start()
+
+    def _warm_up(self):
+        try:
+            for index, worker in self.server.pool.ready():
+                if self._stopped.is_set():
+                    return
+
+                client = single.Client(worker)
+                client.muted = True
+                client.urls = [self._urls[index]]
+                client.play()
+
+                with self._lock:
+                    if self._stopped.is_set():
+                        client.disconnect()
+                        return
+                    self.workers[index] = client
+        except Exception as e:
+            self.error = e
+            return
+
+        with self._lock:
+            self.ready.set()
+            self._retire_single()
+
+    def _retire_single(self):
+        """ shut the single server down once the pool plays everything """
+        if not self.ready.is_set() or self.single is None:
+            return
+        if self._current is self.single:
+            return
+
+        self.single.disconnect()
+        self.server.single.shutdown()
+        self.single = None
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, new_volume):
+        self._volume = int(new_volume)
+        with self._lock:
+            if self._current is not None:
+                self._current.volume = self._volume
+
+    def play(self, index):
+        if index >= len(self._urls) or index < 0:
+            raise RuntimeError("invalid station index")
+
+        with self._lock:
+            previous = self._current
+            self._current = self.workers.get(index, self.single)
+            if self._current is not previous:
+                # the new client is muted, so this only sets its volume
+                self._current.volume = self._volume
+
+            if self._current is self.single:
+                self.single.play(index)
+            self._current.muted = False
+
+            if previous is not None and previous is not self._current:
+                previous.muted = True
+
+            self._station = index
+            self._retire_single()
+
+    @property
+    def station(self):
+        return self._station
+
+    @station.setter
+    def station(self, index):
+        self.play(index)
+
+    def status(self, **kwargs):
+        """ the status of the audible mpd, empty if nothing is played
+
+        The arguments are passed to `single.Client.status`.
+        """
+        if self._current is None:
+            return {}
+
+        return self._current.status(**kwargs)
+
+    @property
+    def muted(self):
+        if self._current is None:
+            return True
+
+        return self._current.muted
+
+    @muted.setter
+    def muted(self, new_state):
+        with self._lock:
+            if self._current is None:
+                return
+
+            self._current.muted = new_state
+
+    def mute(self):
+        self.muted = True
+
+    def unmute(self):
+        self.muted = False
+
+    def toggle_mute(self):
+        self.muted = not self.muted
+
+
+def map(basepath, urls):
+    server = Server(basepath=basepath, num=len(urls))
+
+    client = Client(server)
+    client.urls = urls
+
+    return client